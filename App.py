@@ -1,24 +1,302 @@
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
+import click
+from datetime import datetime, timedelta
 import mysql.connector
+import heapq
+import hmac
 import os
-
-app = Flask(__name__, static_folder='build', static_url_path='')
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import activity
+import batch
+import changes
+import db
+import metrics
+import serialization
+import sessions
+import static_assets
+from archive import LOCK_NAME as ARCHIVE_LOCK, MessageArchive, archive_cold_messages
+from broker import SubscriptionClosed, create_broker
+from cache import RedisCache, ResponseCache, TTLCache, create_backend
+from ical import render_calendar
+from friend_graph import FriendGraph
+from identity import IdentityCache
+from ingest import IngestBusy, IngestError, MessageIngestor, NotAMember, MAX_CLIENT_ID_LENGTH, server_client_id
+from jobs import JobRunner
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from queries import top_n_per_group
+from search import PlaceSearchIndex, UserSearchIndex
+
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 db_config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'admin',
-    'database': 'tripsync'
+    'host': os.environ.get('TRIPSYNC_DB_HOST', 'localhost'),
+    'user': os.environ.get('TRIPSYNC_DB_USER', 'root'),
+    'password': os.environ.get('TRIPSYNC_DB_PASSWORD', 'admin'),
+    'database': os.environ.get('TRIPSYNC_DB_NAME', 'tripsync'),
 }
 
+# Size the pool so that workers * TRIPSYNC_DB_POOL_SIZE stays below MySQL's max_connections
+db.init_pool(
+    db_config,
+    size=int(os.environ.get('TRIPSYNC_DB_POOL_SIZE', 10)),
+    timeout=float(os.environ.get('TRIPSYNC_DB_POOL_TIMEOUT', 5)),
+)
+
+# Per-category place totals for /api/places; search totals come from the index
+place_count_cache = TTLCache(
+    maxsize=2048,
+    ttl=float(os.environ.get('TRIPSYNC_PLACE_COUNT_TTL', 300)),
+)
+
+# Set TRIPSYNC_CACHE_URL=redis://... to share cached catalog responses and membership
+# invalidations between workers
+cache_backend = create_backend(
+    os.environ.get('TRIPSYNC_CACHE_URL'),
+    ttl=float(os.environ.get('TRIPSYNC_CATALOG_TTL', 600)),
+)
+
+# user_id -> username and group member sets, shared by every endpoint's access checks;
+# without a shared backend a membership change reaches other workers within TRIPSYNC_MEMBERSHIP_TTL
+identity = IdentityCache(
+    maxsize=int(os.environ.get('TRIPSYNC_IDENTITY_CACHE_SIZE', 10000)),
+    membership_ttl=float(os.environ.get('TRIPSYNC_MEMBERSHIP_TTL', 30)),
+    shared=cache_backend if isinstance(cache_backend, RedisCache) else None,
+)
+
+# Rendered catalog responses (categories, top places/cities, place details) with ETags
+response_cache = ResponseCache(
+    cache_backend,
+    max_age=int(os.environ.get('TRIPSYNC_CATALOG_MAX_AGE', 0)),
+)
+
+# Trigram indexes behind /api/places?search= and /api/users?search=, built in the background when
+# a process starts serving (TRIPSYNC_SEARCH_WARMUP=0 leaves that to the first search) and topped
+# up with new rows every refresh interval
+SEARCH_WARMUP = os.environ.get('TRIPSYNC_SEARCH_WARMUP', '1') == '1'
+place_index = PlaceSearchIndex(
+    refresh_interval=float(os.environ.get('TRIPSYNC_SEARCH_REFRESH_SECONDS', 30)),
+)
+user_index = UserSearchIndex(
+    refresh_interval=float(os.environ.get('TRIPSYNC_SEARCH_REFRESH_SECONDS', 30)),
+)
+
+# Sorted friend/request id arrays per user, caught up from the change log every
+# TRIPSYNC_FRIEND_GRAPH_REFRESH_SECONDS and immediately after this process's own writes
+friend_graph = FriendGraph(
+    refresh_interval=float(os.environ.get('TRIPSYNC_FRIEND_GRAPH_REFRESH_SECONDS', 2)),
+)
+
+# Fan-out for live chat streams; set TRIPSYNC_BROKER_URL=redis://... when running several workers
+message_broker = create_broker(
+    os.environ.get('TRIPSYNC_BROKER_URL'),
+    queue_size=int(os.environ.get('TRIPSYNC_STREAM_QUEUE_SIZE', 256)),
+)
+
+# Per-route latency/SQL histograms at /metrics; statements slower than
+# TRIPSYNC_SLOW_QUERY_MS are logged to the tripsync.slow_query logger
+metrics.init_app(app, slow_query_seconds=float(os.environ.get('TRIPSYNC_SLOW_QUERY_MS', 200)) / 1000)
+metrics.register_stats(
+    'tripsync_db_pool', 'MySQL connection pool', db.pool_stats,
+    ['size', 'open', 'idle', 'in_use', 'waiters', 'checkouts', 'timeouts', 'health_check_failures'],
+)
+metrics.register_stats(
+    'tripsync_broker', 'Chat stream broker', message_broker.stats,
+    ['channels', 'subscribers', 'published', 'evictions'],
+)
+metrics.register_stats(
+    'tripsync_friend_graph', 'Friend graph index', friend_graph.stats,
+    ['users', 'friendships', 'pending_requests', 'change_id', 'reloads'],
+)
+
+# orjson/MessagePack encoding and gzip/brotli for responses above TRIPSYNC_COMPRESS_MIN_BYTES
+serialization.init_app(app, compress_min_size=int(os.environ.get('TRIPSYNC_COMPRESS_MIN_BYTES', 1024)))
+
+# POST /api/batch: several GET routes in one round trip, run on at most
+# TRIPSYNC_BATCH_CONCURRENCY pooled connections at a time
+batch.init_app(
+    app,
+    max_requests=int(os.environ.get('TRIPSYNC_BATCH_MAX_REQUESTS', 10)),
+    concurrency=int(os.environ.get('TRIPSYNC_BATCH_CONCURRENCY', 4)),
+)
+
+# Login issues tokens signed with TRIPSYNC_SESSION_SECRET (the same value in every worker and
+# in asgi.py) carrying user_id and username, verified per request without a query. Every API
+# route outside PUBLIC_ENDPOINTS needs one and takes the caller from it; TRIPSYNC_REQUIRE_SESSION=0
+# falls back to trusting the user ids requests name, for local development only.
+SESSION_SECRET = os.environ.get('TRIPSYNC_SESSION_SECRET')
+SESSION_REQUIRED = os.environ.get('TRIPSYNC_REQUIRE_SESSION', '1') != '0'
+if SESSION_REQUIRED and not SESSION_SECRET:
+    raise RuntimeError("Set TRIPSYNC_SESSION_SECRET (or TRIPSYNC_REQUIRE_SESSION=0 for local development)")
+PUBLIC_ENDPOINTS = frozenset({
+    'hello', 'get_pool_stats', 'register_user', 'login_user',
+    'get_top_places', 'get_top_cities', 'get_categories', 'get_places', 'get_place_details',
+    # Authenticated with TRIPSYNC_INTERNAL_TOKEN instead
+    'post_catalog_changes',
+})
+session_tokens = None
+if SESSION_SECRET:
+    session_tokens = sessions.SessionTokens(
+        SESSION_SECRET,
+        max_age=int(os.environ.get('TRIPSYNC_SESSION_MAX_AGE', 7 * 24 * 3600)),
+    )
+else:
+    app.logger.warning("TRIPSYNC_SESSION_SECRET is not set; login issues no session tokens")
+sessions.init_app(app, session_tokens, required=SESSION_REQUIRED, public=PUBLIC_ENDPOINTS)
+
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_REPLAY_LIMIT = 200
+
+def publish_group_message(group_id, message_id, sender, message, timestamp=None, client_msg_id=None):
+    message_broker.publish(f"group:{group_id}", {
+        'id': message_id,
+        'sender': sender,
+        'message': message,
+        'timestamp': (timestamp or datetime.now()).isoformat(),
+        'client_msg_id': client_msg_id,
+    })
+
+def publish_stored_messages(rows):
+    for row in rows:
+        publish_group_message(row['group_id'], row['id'], row['sender'], row['message'],
+                              row['created_at'], row['client_msg_id'])
+
+# Chat messages are written in batches, one INSERT and one commit per batch;
+# senders wait at most TRIPSYNC_INGEST_TIMEOUT seconds for theirs to be stored
+message_ingestor = MessageIngestor(
+    db.get_connection,
+    identity.is_member,
+    on_insert=activity.record_messages,
+    on_commit=publish_stored_messages,
+    max_batch=int(os.environ.get('TRIPSYNC_INGEST_MAX_BATCH', 100)),
+    max_delay=float(os.environ.get('TRIPSYNC_INGEST_MAX_DELAY_MS', 2)) / 1000,
+    queue_size=int(os.environ.get('TRIPSYNC_INGEST_QUEUE_SIZE', 1000)),
+)
+INGEST_TIMEOUT = float(os.environ.get('TRIPSYNC_INGEST_TIMEOUT', 5))
+
+# Chat history older than TRIPSYNC_ARCHIVE_AFTER_DAYS is moved to compressed per-group segment
+# files under TRIPSYNC_ARCHIVE_DIR by the archive_messages job (or `python -m archive`); reads
+# merge them back in by message id. Archived rows are deleted from MySQL, so the directory must be
+# shared storage mounted by every app host (NFS, EFS, ...): on a host-local disk the history would
+# vanish for every other host. Archiving stays off until TRIPSYNC_ARCHIVE_DIR is set.
+ARCHIVE_DIR = os.environ.get('TRIPSYNC_ARCHIVE_DIR')
+message_archive = MessageArchive(ARCHIVE_DIR or os.path.join(app.root_path, 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.environ.get('TRIPSYNC_ARCHIVE_AFTER_DAYS', 90))
+metrics.register_stats(
+    'tripsync_ingest', 'Chat message ingestion', message_ingestor.stats,
+    ['queued', 'batches', 'messages', 'duplicates', 'rejected', 'largest_batch'],
+)
+
+# Heavy maintenance runs as durable jobs on TRIPSYNC_JOB_WORKERS threads per process;
+# deleted groups are purged TRIPSYNC_PURGE_BATCH_ROWS rows (and one commit) at a time
+job_runner = JobRunner(
+    db.get_connection,
+    workers=int(os.environ.get('TRIPSYNC_JOB_WORKERS', 2)),
+    lease_seconds=int(os.environ.get('TRIPSYNC_JOB_LEASE_SECONDS', 60)),
+)
+PURGE_BATCH_ROWS = int(os.environ.get('TRIPSYNC_PURGE_BATCH_ROWS', 1000))
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('TRIPSYNC_CHANGE_LOG_RETENTION_DAYS', 30))
+metrics.register_stats(
+    'tripsync_jobs', 'Background jobs', job_runner.stats,
+    ['workers', 'running', 'succeeded', 'failed', 'retried'],
+)
+
+@job_runner.register('purge_group')
+def purge_group(job):
+    group_id = job.payload['group_id']
+    for table in ('messages', 'calendar_events'):
+        deleted = job.progress.get(table, 0)
+        while True:
+            with db.transaction() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE group_id = %s LIMIT %s", (group_id, PURGE_BATCH_ROWS))
+                count = cursor.rowcount
+            deleted += count
+            job.report(**{table: deleted})
+            if count < PURGE_BATCH_ROWS:
+                break
+    # An archive pass appending to this group after the drop would leave its segments behind,
+    # so wait for the archiver's lock; reporting progress keeps the lease while waiting
+    with db.connection() as conn:
+        lock = conn.cursor()
+        while True:
+            lock.execute("SELECT GET_LOCK(%s, 10)", (ARCHIVE_LOCK,))
+            if lock.fetchone()[0] == 1:
+                break
+            job.report(waiting_for='archiver')
+        try:
+            message_archive.drop(group_id)
+            # What is left is small: the tombstone and the rows cascading from it
+            with db.transaction() as cursor:
+                cursor.execute("DELETE FROM chat_groups WHERE id = %s AND deleted_at IS NOT NULL", (group_id,))
+        finally:
+            lock.execute("SELECT RELEASE_LOCK(%s)", (ARCHIVE_LOCK,))
+            lock.fetchall()
+            lock.close()
+
+@job_runner.register('archive_messages', max_attempts=3)
+def archive_messages(job):
+    if not ARCHIVE_DIR:
+        job.report(skipped="TRIPSYNC_ARCHIVE_DIR is not set")
+        return
+    with db.connection() as conn:
+        moved = archive_cold_messages(conn, message_archive, job.payload.get('older_than_days', ARCHIVE_AFTER_DAYS),
+                                      log=lambda line: job.report(last=line))
+    job.progress['moved'] = moved
+
+@job_runner.register('prune_change_log', max_attempts=3)
+def prune_change_log(job):
+    pruned = 0
+    while True:
+        with db.transaction() as cursor:
+            count = changes.prune(cursor, CHANGE_LOG_RETENTION_DAYS, limit=PURGE_BATCH_ROWS)
+        pruned += count
+        job.report(pruned=pruned)
+        if count < PURGE_BATCH_ROWS:
+            break
+
+if ARCHIVE_DIR:
+    job_runner.schedule('archive_messages', float(os.environ.get('TRIPSYNC_ARCHIVE_INTERVAL_HOURS', 24)) * 3600)
+job_runner.schedule('prune_change_log', 24 * 3600)
+
+# Job workers and search warm-up start with the first request a serving process handles, never at
+# import, so migrations, the CLI, tests and a preloading server's master stay free of background threads.
+# Tools that drive the app in-process (the plan check) set BACKGROUND_WORK to False
+app.config.setdefault('BACKGROUND_WORK', True)
+
+
+@app.before_request
+def start_background_work():
+    if not app.config['BACKGROUND_WORK']:
+        return
+    job_runner.start()
+    if SEARCH_WARMUP:
+        place_index.warm(db.get_connection)
+        user_index.warm(db.get_connection)
+
+def catalog_changed(place_ids=(), city_ids=()):
+    """Drop cached catalog reads after places or cities were written"""
+    response_cache.invalidate('catalog')
+    place_count_cache.clear()
+    if place_index.loaded and (place_ids or city_ids):
+        with db.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for place_id in place_ids:
+                place_index.refresh_place(cursor, place_id)
+            for city_id in city_ids:
+                place_index.refresh_city(cursor, city_id)
+
 # API Endpoints (these all stay the same)
 
 @app.route('/api/hello', methods=['GET'])
 def hello():
     return jsonify({"message": "Hello from Flask!"})
 
+@app.route('/api/db/pool', methods=['GET'])
+def get_pool_stats():
+    return jsonify(db.pool_stats()), 200
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     data = request.get_json()
@@ -28,7 +306,7 @@ def register_user():
 
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor()
         insert_query = """
             INSERT INTO users 
@@ -44,6 +322,8 @@ def register_user():
         )
         cursor.execute(insert_query, values)
         conn.commit()
+        if user_index.loaded:
+            user_index.refresh_row(conn.cursor(dictionary=True), cursor.lastrowid)
         return jsonify({"message": "User registered successfully"}), 201
 
     except mysql.connector.Error as err:
@@ -65,14 +345,15 @@ def login_user():
 
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         query = "SELECT * FROM users WHERE username = %s AND password = %s"
         cursor.execute(query, (username, password))
         user = cursor.fetchone()
         
         if user:
-            return jsonify({'success': True, 'user': user}), 200
+            token = session_tokens.issue(user['user_id'], user['username']) if session_tokens else None
+            return jsonify({'success': True, 'user': user, 'token': token}), 200
         else:
             return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
     except mysql.connector.Error as err:
@@ -82,51 +363,81 @@ def login_user():
         if conn:
             conn.close()
 
+@app.route('/api/stream_ticket', methods=['POST'])
+def issue_stream_ticket():
+    """Trade the session for a ticket an EventSource can put in its URL; it expires within a minute."""
+    caller = sessions.current()
+    if caller is None:
+        return jsonify({'error': 'Session token required'}), 401
+    return jsonify({'ticket': session_tokens.issue_ticket(caller), 'expires_in': session_tokens.ticket_max_age}), 200
+
+USER_PAGE_DEFAULT = 20
+USER_PAGE_MAX = 100
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     conn = None
     search_term = request.args.get('search', '')
-    current_user_id = request.args.get('current_user_id')
+    current_user_id = sessions.caller_id(request.args.get('current_user_id', type=int))
+    limit = min(max(request.args.get('limit', USER_PAGE_DEFAULT, type=int), 1), USER_PAGE_MAX)
+    page_cursor = request.args.get('cursor', '')
     
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         if search_term:
-            query = """
-            SELECT 
-                u.user_id AS id,
-                CONCAT(u.first_name, ' ', u.last_name) AS name,
-                u.username,
-                CASE
-                    WHEN f.status = 'pending' AND f.user_id = %s THEN 'request_sent'
-                    WHEN f.status = 'pending' AND f.friend_id = %s THEN 'request_received'
-                    WHEN f.status = 'accepted' THEN 'friends'
-                    ELSE 'none'
-                END AS friendship_status
-            FROM users u
-            LEFT JOIN friends f ON 
-                (f.user_id = u.user_id AND f.friend_id = %s) OR 
-                (f.friend_id = u.user_id AND f.user_id = %s)
-            WHERE (u.first_name LIKE %s OR u.last_name LIKE %s OR u.username LIKE %s)
-            AND u.user_id != %s
-            """
-            search_pattern = f"%{search_term}%"
-            cursor.execute(query, (current_user_id, current_user_id, current_user_id, current_user_id, 
-                                  search_pattern, search_pattern, search_pattern, current_user_id))
+            # Ranked ids come from the in-memory index; only the page is read from MySQL
+            user_index.ensure_fresh(cursor)
+            matched, _ = user_index.search(search_term)
+            ranked = [user_id for user_id in matched if user_id != current_user_id]
+            start = int(decode_cursor(page_cursor)['offset']) if page_cursor else 0
+            page_ids = ranked[start:start + limit]
+            next_cursor = encode_cursor({'offset': start + limit}) if start + limit < len(ranked) else None
+            
+            users = []
+            if page_ids:
+                placeholders = ", ".join(["%s"] * len(page_ids))
+                cursor.execute(f"""
+                SELECT 
+                    user_id AS id,
+                    CONCAT(first_name, ' ', last_name) AS name,
+                    username
+                FROM users
+                WHERE user_id IN ({placeholders})
+                """, page_ids)
+                by_id = {row['id']: row for row in cursor.fetchall()}
+                users = [by_id[user_id] for user_id in page_ids if user_id in by_id]
+                
+                # Friendship status for the page comes from the friend graph
+                if current_user_id is not None:
+                    friend_graph.ensure_fresh(cursor)
+                for user in users:
+                    user['friendship_status'] = (friend_graph.status(current_user_id, user['id'])
+                                                 if current_user_id is not None else 'none')
         else:
+            # Paged directory listing in user_id order
+            after_id = int(decode_cursor(page_cursor)['after']) if page_cursor else 0
             query = """
             SELECT 
                 user_id AS id,
                 CONCAT(first_name, ' ', last_name) AS name,
                 username
             FROM users
-            WHERE user_id != %s
+            WHERE user_id > %s AND user_id != %s
+            ORDER BY user_id
+            LIMIT %s
             """
-            cursor.execute(query, (current_user_id,))
-        
-        users = cursor.fetchall()
-        return jsonify({"users": users}), 200
+            cursor.execute(query, (after_id, current_user_id or 0, limit + 1))
+            users = cursor.fetchall()
+            next_cursor = None
+            if len(users) > limit:
+                users = users[:limit]
+                next_cursor = encode_cursor({'after': users[-1]['id']})
+        
+        return jsonify({"users": users, "next_cursor": next_cursor}), 200
+    except (InvalidCursor, KeyError, TypeError, ValueError):
+        return jsonify({"error": "Invalid cursor"}), 400
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
         return jsonify({"error": str(err)}), 400
@@ -134,107 +445,142 @@ def get_users():
         if conn:
             conn.close()
 
+def add_group_members(cursor, group_id, inviter_id, friend_ids):
+    """Add the inviter's accepted friends among friend_ids to a group.
+
+    Validates every candidate with one query and inserts them with one
+    multi-row statement; the caller owns the transaction. Returns the
+    user_ids that were added.
+    """
+    friend_ids = list(dict.fromkeys(int(friend_id) for friend_id in friend_ids))
+    if not friend_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(friend_ids))
+    cursor.execute(f"""
+    SELECT u.user_id, u.username
+    FROM friends f
+    JOIN users u ON u.user_id = f.friend_id
+    WHERE f.user_id = %s AND f.status = 'accepted' AND f.friend_id IN ({placeholders})
+      AND u.username NOT IN (SELECT username FROM group_members WHERE group_id = %s)
+    UNION
+    SELECT u.user_id, u.username
+    FROM friends f
+    JOIN users u ON u.user_id = f.user_id
+    WHERE f.friend_id = %s AND f.status = 'accepted' AND f.user_id IN ({placeholders})
+      AND u.username NOT IN (SELECT username FROM group_members WHERE group_id = %s)
+    """, [inviter_id, *friend_ids, group_id, inviter_id, *friend_ids, group_id])
+    valid = {row['user_id']: row['username'] for row in cursor.fetchall()}
+
+    for friend_id in friend_ids:
+        if friend_id not in valid:
+            print(f"User {friend_id} is not a friend of user {inviter_id} or already in group {group_id}")
+
+    added = [friend_id for friend_id in friend_ids if friend_id in valid]
+    if added:
+        cursor.executemany(
+            "INSERT INTO group_members (group_id, username) VALUES (%s, %s)",
+            [(group_id, valid[friend_id]) for friend_id in added]
+        )
+        changes.record_changes(cursor, [
+            (changes.MEMBER, friend_id, changes.UPSERT, group_id, friend_id) for friend_id in added
+        ])
+        activity.mark_joined(cursor, group_id, [valid[friend_id] for friend_id in added])
+    return added
+
 @app.route('/api/create_group', methods=['POST'])
 def create_group():
     data = request.get_json()
     group_name = data.get('group_name')
-    created_by = data.get('created_by')  # user_id of the creator
+    created_by = sessions.caller_id(data.get('created_by'))  # user_id of the creator
     members = data.get('members', [])  # List of friend user_ids to add
 
     if not group_name or not created_by:
         return jsonify({'error': 'Missing required fields'}), 400
 
-    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        # First get the username of the creator
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (created_by,))
-        creator = cursor.fetchone()
-        if not creator:
-            return jsonify({'error': 'Creator not found'}), 404
-        creator_username = creator['username']
-
-        # Create the chat group
-        create_query = "INSERT INTO chat_groups (name, created_by) VALUES (%s, %s)"
-        cursor.execute(create_query, (group_name, created_by))
-        conn.commit()
-
-        group_id = cursor.lastrowid
-
-        # Add the group creator to the group
-        cursor.execute("INSERT INTO group_members (group_id, username) VALUES (%s, %s)", (group_id, creator_username))
-        conn.commit()
-
-        valid_members = []
-        # For each friend_id, get their username and check if they're a friend
-        for friend_id in members:
-            # Get the friend's username
-            cursor.execute("SELECT username FROM users WHERE user_id = %s", (friend_id,))
-            friend = cursor.fetchone()
-            if not friend:
-                print(f"User ID {friend_id} not found")
-                continue
-            
-            friend_username = friend['username']
-            
-            # Check if they're actually a friend
-            check_query = """
-            SELECT 1 FROM friends
-            WHERE ((user_id = %s AND friend_id = %s) OR (user_id = %s AND friend_id = %s))
-              AND status = 'accepted'
-            """
-            cursor.execute(check_query, (created_by, friend_id, friend_id, created_by))
-            if cursor.fetchone():
-                # Add friend to group and track them as valid
-                cursor.execute("INSERT INTO group_members (group_id, username) VALUES (%s, %s)", 
-                               (group_id, friend_username))
-                conn.commit()
-                valid_members.append(friend_id)
-            else:
-                print(f"User {friend_id} is not a friend of user {created_by}")
+        # The group and all of its members are committed together or not at all
+        with db.transaction(dictionary=True) as cursor:
+            # First get the username of the creator
+            creator_username = identity.username(cursor, created_by)
+            if not creator_username:
+                return jsonify({'error': 'Creator not found'}), 404
+
+            # Create the chat group
+            create_query = "INSERT INTO chat_groups (name, created_by) VALUES (%s, %s)"
+            cursor.execute(create_query, (group_name, created_by))
+            group_id = cursor.lastrowid
+
+            # Add the group creator, then every valid friend in one batch
+            cursor.execute("INSERT INTO group_members (group_id, username) VALUES (%s, %s)", (group_id, creator_username))
+            activity.init_group(cursor, group_id)
+            activity.mark_joined(cursor, group_id, [creator_username])
+            changes.record_changes(cursor, [
+                (changes.GROUP, group_id, changes.UPSERT, group_id, None),
+                (changes.MEMBER, created_by, changes.UPSERT, group_id, created_by),
+            ])
+            valid_members = add_group_members(cursor, group_id, created_by, members)
+        identity.invalidate_group(group_id)
 
         return jsonify({'message': 'Group created', 'group_id': group_id, 'members_added': valid_members}), 201
 
+    except (TypeError, ValueError):
+        return jsonify({'error': 'members must be a list of user ids'}), 400
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
         return jsonify({'error': str(err)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/add_friend_to_group', methods=['POST'])
 def add_friend_to_group():
     data = request.get_json()
     group_id = data.get('group_id')
     friend_id = data.get('friend_id')
-    user_id = data.get('user_id')
+    friend_ids = data.get('friend_ids')
+    user_id = sessions.caller_id(data.get('user_id'))
 
-    if not group_id or not friend_id or not user_id:
+    if not group_id or not (friend_id or friend_ids) or not user_id:
         return jsonify({'error': 'Missing required fields'}), 400
 
+    if friend_ids:
+        # Multi-friend variant: validated and inserted as one batch in one transaction
+        try:
+            with db.transaction(dictionary=True) as cursor:
+                if not identity.is_member(cursor, group_id, identity.username(cursor, user_id)):
+                    return jsonify({'error': 'You are not a member of this group'}), 403
+                added = add_group_members(cursor, group_id, user_id, friend_ids)
+            identity.invalidate_group(group_id)
+
+            return jsonify({'message': 'Friends added to group successfully', 'members_added': added}), 201
+
+        except (TypeError, ValueError):
+            return jsonify({'error': 'friend_ids must be a list of user ids'}), 400
+        except mysql.connector.Error as err:
+            print("MySQL Error:", err)
+            return jsonify({'error': str(err)}), 500
+
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
 
         # Get the friend's username
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (friend_id,))
-        friend = cursor.fetchone()
-        if not friend:
+        friend_username = identity.username(cursor, friend_id)
+        if not friend_username:
             return jsonify({'error': 'Friend not found'}), 404
-        friend_username = friend['username']
 
         # Add the friend to the group
         cursor.execute("INSERT INTO group_members (group_id, username) VALUES (%s, %s)", 
                        (group_id, friend_username))
+        changes.record_change(cursor, changes.MEMBER, friend_id, group_id=group_id, user_id=friend_id)
+        activity.mark_joined(cursor, group_id, [friend_username])
         conn.commit()
+        identity.invalidate_group(group_id)
 
         return jsonify({'message': 'Friend added to group successfully'}), 201
 
     except mysql.connector.Error as err:
-        conn.rollback()
+        if conn:
+            conn.rollback()
         return jsonify({'error': str(err)}), 500
     finally:
         if conn:
@@ -244,100 +590,251 @@ def add_friend_to_group():
 def send_message():
     data = request.get_json()
     group_id = data.get('group_id')
-    sender = data.get('sender')  # This is the username
+    sender = sessions.caller_username(data.get('sender'))  # This is the username
     message = data.get('message')
+    client_msg_id = data.get('client_msg_id')  # client-generated, makes resending safe
 
     if not group_id or not sender or not message:
         return jsonify({'error': 'Missing required fields'}), 400
+    if client_msg_id is not None and (not isinstance(client_msg_id, str) or len(client_msg_id) > MAX_CLIENT_ID_LENGTH):
+        return jsonify({'error': f'client_msg_id must be a string of at most {MAX_CLIENT_ID_LENGTH} characters'}), 400
+    try:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'group_id must be an integer'}), 400
+
+    # Membership is checked and the message stored by the ingestor, batched with concurrent sends
+    try:
+        stored = message_ingestor.send(group_id, sender, message, client_msg_id, timeout=INGEST_TIMEOUT)
+    except NotAMember:
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    except IngestBusy:
+        return jsonify({'error': 'Too many messages, please retry'}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        # It may still be stored; resending with the same client_msg_id will not duplicate it
+        return jsonify({'error': 'Message not confirmed in time, please retry'}), 503, {'Retry-After': '1'}
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    except IngestError as err:
+        return jsonify({'error': str(err)}), 500
+
+    return jsonify({
+        'message': 'Message sent',
+        'id': stored['id'],
+        'client_msg_id': stored['client_msg_id'],
+        'timestamp': stored['created_at'],
+    }), 200 if stored['duplicate'] else 201
+
+MESSAGE_PAGE_DEFAULT = 50
+MESSAGE_PAGE_MAX = 200
+
+
+def message_window(args):
+    """(limit, before, after) from the query string; ValueError naming the bad argument."""
+    try:
+        limit = min(int(args.get('limit', MESSAGE_PAGE_DEFAULT)), MESSAGE_PAGE_MAX)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    # Parsed by hand rather than with type=int, which would turn bad input into "no bound"
+    bounds = []
+    for name in ('before', 'after'):
+        value = args.get(name)
+        if value is not None:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f'{name} must be a message id')
+            if value < 0:
+                raise ValueError(f'{name} must be a message id')
+        bounds.append(value)
+    before, after = bounds
+    if before is not None and after is not None:
+        raise ValueError('Use either before or after, not both')
+    return limit, before, after
+
+
+@app.route('/api/group_messages/<int:group_id>', methods=['GET'])
+def get_group_messages(group_id):
+    user_id = sessions.caller_id(request.args.get('user_id'))
+    if not user_id:
+        return jsonify({'error': 'User ID not provided'}), 400
+
+    # limit/before/after select a window of the history keyed on message id;
+    # without any of them the full history is returned as before
+    windowed = any(arg in request.args for arg in ('limit', 'before', 'after'))
+    try:
+        limit, before, after = message_window(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
 
     conn = None
+    streaming = False
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
 
-        # First check if the sender is a member of the group
-        cursor.execute("SELECT 1 FROM group_members WHERE group_id = %s AND username = %s", 
-                       (group_id, sender))
-        if not cursor.fetchone():
-            return jsonify({'error': 'You are not a member of this group'}), 403
+        # Get username of current user
+        username = identity.username(cursor, user_id)
+        if not username:
+            return jsonify({'error': 'User not found'}), 404
 
-        # Insert the message
-        query = "INSERT INTO messages (group_id, sender, message) VALUES (%s, %s, %s)"
-        cursor.execute(query, (group_id, sender, message))
-        conn.commit()
+        # Verify that the user is a member of the group
+        if not identity.is_member(cursor, group_id, username):
+            return jsonify({'error': 'User is not a member of this group'}), 403
 
-        return jsonify({'message': 'Message sent'}), 201
+        # If the user is a member, retrieve the group messages. Ids up to the
+        # archive floor are read from the group's archive, later ones from MySQL
+        floor = message_archive.floor(group_id)
+        if not windowed:
+            # The whole history can be large: stream it from the cursor instead of building a list
+            query = "SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages WHERE group_id = %s AND id > %s ORDER BY id ASC"
+            cursor.execute(query, (group_id, floor))
+            streaming = True
+            # Archived ids all sit below the table's, but merge by id rather than rely on it
+            rows = heapq.merge(message_archive.iter_messages(group_id), serialization.iter_cursor(cursor),
+                               key=lambda message: message['id'])
+            return serialization.stream_array(rows, on_close=conn.close)
+
+        if after is not None:
+            # Only messages the client has not seen yet, oldest first
+            messages = message_archive.read_after(group_id, after, limit + 1)
+            if len(messages) <= limit:
+                query = """
+                SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                WHERE group_id = %s AND id > %s
+                ORDER BY id ASC
+                LIMIT %s
+                """
+                cursor.execute(query, (group_id, max(after, floor), limit + 1 - len(messages)))
+                messages += cursor.fetchall()
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        else:
+            # Latest window, or scrollback ending just before a known id
+            messages = []
+            if before is None or before > floor + 1:
+                query = f"""
+                SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                WHERE group_id = %s AND id > %s {"AND id < %s" if before is not None else ""}
+                ORDER BY id DESC
+                LIMIT %s
+                """
+                params = [group_id, floor] + ([before] if before is not None else []) + [limit + 1]
+                cursor.execute(query, params)
+                messages = cursor.fetchall()
+            if len(messages) <= limit:
+                messages += message_archive.read_before(group_id, before, limit + 1 - len(messages))
+            has_more = len(messages) > limit
+            messages = messages[:limit][::-1]
+
+        return jsonify({'messages': messages, 'has_more': has_more})
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
         return jsonify({'error': str(err)}), 500
     finally:
-        if conn:
+        if conn and not streaming:
             conn.close()
 
-@app.route('/api/group_messages/<group_id>', methods=['GET'])
-def get_group_messages(group_id):
-    user_id = request.args.get('user_id')
+@app.route('/api/group_messages/<int:group_id>/stream', methods=['GET'])
+def stream_group_messages(group_id):
+    """Server-sent events feed of new messages in a group"""
+    user_id = sessions.caller_id(request.args.get('user_id'))
     if not user_id:
         return jsonify({'error': 'User ID not provided'}), 400
 
+    # EventSource resends the last id it saw when it reconnects
+    last_seen = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        last_seen = int(last_seen) if last_seen else None
+    except ValueError:
+        return jsonify({'error': 'Invalid last event id'}), 400
+
+    # Subscribe before reading the backlog so nothing published in between is lost
+    subscription = message_broker.subscribe(f"group:{group_id}")
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Get username of current user
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (user_id,))
-        user = cursor.fetchone()
-        if not user:
+        username = identity.username(cursor, user_id)
+        if not username:
+            subscription.close()
             return jsonify({'error': 'User not found'}), 404
-        username = user['username']
 
-        # Verify that the user is a member of the group
-        cursor.execute("SELECT 1 FROM group_members WHERE group_id = %s AND username = %s", 
-                       (group_id, username))
-        membership = cursor.fetchone()
-
-        if not membership:
+        if not identity.is_member(cursor, group_id, username):
+            subscription.close()
             return jsonify({'error': 'User is not a member of this group'}), 403
 
-        # If the user is a member, retrieve the group messages
-        query = "SELECT sender, message, created_at AS timestamp FROM messages WHERE group_id = %s ORDER BY created_at ASC"
-        cursor.execute(query, (group_id,))
-        messages = cursor.fetchall()
-
-        return jsonify(messages)
+        backlog = []
+        if last_seen is not None:
+            backlog = message_archive.read_after(group_id, last_seen, STREAM_REPLAY_LIMIT)
+            if len(backlog) < STREAM_REPLAY_LIMIT:
+                cursor.execute("""
+                SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                WHERE group_id = %s AND id > %s
+                ORDER BY id ASC
+                LIMIT %s
+                """, (group_id, max(last_seen, message_archive.floor(group_id)), STREAM_REPLAY_LIMIT - len(backlog)))
+                backlog += cursor.fetchall()
     except mysql.connector.Error as err:
+        subscription.close()
         print("MySQL Error:", err)
         return jsonify({'error': str(err)}), 500
     finally:
+        # The stream itself must not hold a pooled connection
         if conn:
             conn.close()
 
+    def event(message):
+        return f"id: {message['id']}\nevent: message\ndata: {serialization.dumps(message)}\n\n"
+
+    def generate():
+        sent_up_to = last_seen or 0
+        try:
+            yield "retry: 3000\n\n"
+            for message in backlog:
+                sent_up_to = message['id']
+                yield event(message)
+            while True:
+                try:
+                    message = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except SubscriptionClosed:
+                    # Too slow to keep up; the client reconnects and replays from its last id
+                    return
+                if message is None:
+                    yield ": keepalive\n\n"
+                elif message['id'] > sent_up_to:
+                    sent_up_to = message['id']
+                    yield event(message)
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/api/get_groups', methods=['GET'])
 def get_groups():
-    user_id = request.args.get('user_id')
+    user_id = sessions.caller_id(request.args.get('user_id'))
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Get username of the user
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (user_id,))
-        user = cursor.fetchone()
-        if not user:
+        username = identity.username(cursor, user_id)
+        if not username:
             return jsonify({"error": "User not found"}), 404
-        username = user['username']
         
-        # Get groups where the user is a member
-        query = """
-        SELECT g.id, g.name 
-        FROM chat_groups g
-        JOIN group_members gm ON g.id = gm.group_id
-        WHERE gm.username = %s
-        """
-        cursor.execute(query, (username,))
+        # Get groups where the user is a member, with the latest message and unread count
+        cursor.execute(activity.GROUP_LIST_QUERY, (username,))
         groups = cursor.fetchall()
         return jsonify({"groups": groups}), 200
     except mysql.connector.Error as err:
@@ -347,10 +844,36 @@ def get_groups():
         if conn:
             conn.close()
 
+@app.route('/api/mark_read', methods=['POST'])
+def mark_read():
+    data = request.get_json() or {}
+    group_id = data.get('group_id')
+    user_id = sessions.caller_id(data.get('user_id'))
+    last_read_id = data.get('last_read_id')  # newest message the client has shown; default: all
+
+    if not group_id or not user_id:
+        return jsonify({'error': 'Missing required fields'}), 400
+    if last_read_id is not None and not isinstance(last_read_id, int):
+        return jsonify({'error': 'last_read_id must be an integer'}), 400
+
+    try:
+        with db.transaction(dictionary=True) as cursor:
+            username = identity.username(cursor, user_id)
+            if not username:
+                return jsonify({'error': 'User not found'}), 404
+            if not identity.is_member(cursor, group_id, username):
+                return jsonify({'error': 'User is not a member of this group'}), 403
+            unread = activity.mark_read(cursor, group_id, username, last_read_id)
+        return jsonify({'group_id': group_id, 'unread_count': unread}), 200
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+
 @app.route('/api/group_members/<int:group_id>', methods=['GET'])
 def get_group_members(group_id):
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         query = """
@@ -373,10 +896,11 @@ def get_group_members(group_id):
 
 @app.route('/api/group_info/<group_id>', methods=['GET'])
 def get_group_info(group_id):
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT name FROM chat_groups WHERE id = %s", (group_id,))
+        cursor.execute("SELECT name FROM chat_groups WHERE id = %s AND deleted_at IS NULL", (group_id,))
         group = cursor.fetchone()
 
         if not group:
@@ -392,28 +916,107 @@ def get_group_info(group_id):
 
 @app.route('/api/delete_group/<int:group_id>', methods=['DELETE'])
 def delete_group(group_id):
+    user_id = sessions.caller_id(request.args.get('user_id'))
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
+        with db.transaction() as cursor:
+            cursor.execute("SELECT created_by FROM chat_groups WHERE id = %s AND deleted_at IS NULL FOR UPDATE", (group_id,))
+            group = cursor.fetchone()
+            if not group:
+                return jsonify({'error': 'Group not found'}), 404
+            # Only the creator can delete the group
+            if int(group[0]) != int(user_id):
+                return jsonify({'error': 'Only the group creator can delete it'}), 403
+
+            # The group disappears for everyone now; its messages and events are purged by a job
+            cursor.execute("UPDATE chat_groups SET deleted_at = NOW() WHERE id = %s", (group_id,))
+            # Members lose access to the group's changes once it is gone, so tell each directly
+            cursor.execute("""
+            SELECT u.user_id FROM group_members gm JOIN users u ON u.username = gm.username
+            WHERE gm.group_id = %s
+            """, (group_id,))
+            changes.record_changes(cursor, [
+                (changes.GROUP, group_id, changes.DELETE, None, member_id) for (member_id,) in cursor.fetchall()
+            ])
+            cursor.execute("DELETE FROM group_members WHERE group_id = %s", (group_id,))
+            job_id = job_runner.enqueue(cursor, 'purge_group', {'group_id': group_id})
+        identity.invalidate_group(group_id)
+        job_runner.wake()
+
+        return jsonify({'message': 'Group deleted successfully', 'job_id': job_id}), 202
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
 
-        cursor.execute("DELETE FROM messages WHERE group_id = %s", (group_id,))
-        cursor.execute("DELETE FROM group_members WHERE group_id = %s", (group_id,))
-        cursor.execute("DELETE FROM chat_groups WHERE id = %s", (group_id,))
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    conn = None
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        job = job_runner.get(cursor, job_id)
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
 
-        return jsonify({'message': 'Group deleted successfully'}), 200
+        return jsonify(job), 200
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
-        return jsonify({'error': str(err)}), 500
+        return jsonify({"error": str(err)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+def record_friendship_change(cursor, friendship_id, user_id, friend_id, op=changes.UPSERT):
+    # Both ends keep a copy: the recipient as a request, both as a friend once accepted
+    changes.record_changes(cursor, [
+        (changes.FRIENDSHIP, friendship_id, op, None, user_id),
+        (changes.FRIENDSHIP, friendship_id, op, None, friend_id),
+    ])
+
+def query_friend_requests(cursor, user_id, request_ids=None):
+    """Pending requests sent to user_id, optionally only the given friends rows."""
+    params = [user_id]
+    only = ""
+    if request_ids is not None:
+        only = f"AND f.id IN ({', '.join(['%s'] * len(request_ids))})"
+        params.extend(request_ids)
+    cursor.execute(f"""
+    SELECT f.id, f.user_id, f.status, u.first_name, u.last_name, u.username
+    FROM friends f
+    JOIN users u ON f.user_id = u.user_id
+    WHERE f.friend_id = %s AND f.status = 'pending' {only}
+    """, params)
+    return cursor.fetchall()
+
+def query_friends(cursor, user_id, friendship_ids=None):
+    """Accepted friends of user_id, optionally only those from the given friends rows."""
+    params = [user_id]
+    only = ""
+    if friendship_ids is not None:
+        only = f"AND f.id IN ({', '.join(['%s'] * len(friendship_ids))})"
+        params.extend(friendship_ids)
+    # Since friendship is mutual, we need to check both directions
+    cursor.execute(f"""
+    SELECT u.user_id, u.username, u.first_name, u.last_name, u.email
+    FROM friends f
+    JOIN users u ON u.user_id = f.friend_id
+    WHERE f.user_id = %s AND f.status = 'accepted' {only}
+    UNION
+    SELECT u.user_id, u.username, u.first_name, u.last_name, u.email
+    FROM friends f
+    JOIN users u ON u.user_id = f.user_id
+    WHERE f.friend_id = %s AND f.status = 'accepted' {only}
+    """, params + params)
+    return cursor.fetchall()
 
 # Friend request endpoints
 @app.route('/api/send_friend_request', methods=['POST'])
 def send_friend_request():
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = sessions.caller_id(data.get('user_id'))
     friend_id = data.get('friend_id')
     
     if not user_id or not friend_id:
@@ -424,7 +1027,7 @@ def send_friend_request():
         
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Check if a friend request already exists in either direction
@@ -445,7 +1048,9 @@ def send_friend_request():
                     # Accept the request if it was sent to us
                     accept_query = "UPDATE friends SET status = 'accepted' WHERE id = %s"
                     cursor.execute(accept_query, (existing['id'],))
+                    record_friendship_change(cursor, existing['id'], user_id, friend_id)
                     conn.commit()
+                    friend_graph.refresh_pair(cursor, user_id, friend_id)
                     return jsonify({'message': 'Friend request accepted'}), 200
             else:
                 return jsonify({'error': 'Unknown friendship status'}), 400
@@ -453,7 +1058,9 @@ def send_friend_request():
         # Insert new friend request
         insert_query = "INSERT INTO friends (user_id, friend_id, status) VALUES (%s, %s, 'pending')"
         cursor.execute(insert_query, (user_id, friend_id))
+        record_friendship_change(cursor, cursor.lastrowid, user_id, friend_id)
         conn.commit()
+        friend_graph.refresh_pair(cursor, user_id, friend_id)
         
         return jsonify({'message': 'Friend request sent successfully'}), 201
         
@@ -468,17 +1075,9 @@ def send_friend_request():
 def get_friend_requests(user_id):
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT f.id, f.user_id, f.status, u.first_name, u.last_name, u.username
-        FROM friends f
-        JOIN users u ON f.user_id = u.user_id
-        WHERE f.friend_id = %s AND f.status = 'pending'
-        """
-        cursor.execute(query, (user_id,))
-        requests = cursor.fetchall()
+        requests = query_friend_requests(cursor, user_id)
         
         return jsonify({'friend_requests': requests}), 200
     except mysql.connector.Error as err:
@@ -498,15 +1097,20 @@ def accept_friend_request():
         
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         query = "UPDATE friends SET status = 'accepted' WHERE id = %s"
         cursor.execute(query, (request_id,))
-        conn.commit()
         
         if cursor.rowcount == 0:
             return jsonify({'error': 'Friend request not found'}), 404
+        
+        cursor.execute("SELECT user_id, friend_id FROM friends WHERE id = %s", (request_id,))
+        sender_id, recipient_id = cursor.fetchone()
+        record_friendship_change(cursor, request_id, sender_id, recipient_id)
+        conn.commit()
+        friend_graph.refresh_pair(conn.cursor(dictionary=True), sender_id, recipient_id)
             
         return jsonify({'message': 'Friend request accepted'}), 200
     except mysql.connector.Error as err:
@@ -526,15 +1130,23 @@ def reject_friend_request():
         
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor()
         
+        cursor.execute("SELECT user_id, friend_id FROM friends WHERE id = %s AND status = 'pending'", (request_id,))
+        pending = cursor.fetchone()
+        if not pending:
+            return jsonify({'error': 'Friend request not found'}), 404
+        
         query = "DELETE FROM friends WHERE id = %s AND status = 'pending'"
         cursor.execute(query, (request_id,))
-        conn.commit()
         
         if cursor.rowcount == 0:
             return jsonify({'error': 'Friend request not found'}), 404
+        
+        record_friendship_change(cursor, request_id, *pending, op=changes.DELETE)
+        conn.commit()
+        friend_graph.refresh_pair(conn.cursor(dictionary=True), *pending)
             
         return jsonify({'message': 'Friend request rejected'}), 200
     except mysql.connector.Error as err:
@@ -548,22 +1160,18 @@ def reject_friend_request():
 def get_friends(user_id):
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
-        # Since friendship is mutual, we need to check both directions
-        query = """
-        SELECT u.user_id, u.username, u.first_name, u.last_name, u.email
-        FROM friends f
-        JOIN users u ON u.user_id = f.friend_id
-        WHERE f.user_id = %s AND f.status = 'accepted'
-        UNION
-        SELECT u.user_id, u.username, u.first_name, u.last_name, u.email
-        FROM friends f
-        JOIN users u ON u.user_id = f.user_id
-        WHERE f.friend_id = %s AND f.status = 'accepted'
-        """
-        cursor.execute(query, (user_id, user_id))
-        friends = cursor.fetchall()
+        friend_graph.ensure_fresh(cursor)
+        friend_ids = list(friend_graph.friends(user_id))
+        friends = []
+        if friend_ids:
+            cursor.execute(f"""
+            SELECT user_id, username, first_name, last_name, email
+            FROM users
+            WHERE user_id IN ({', '.join(['%s'] * len(friend_ids))})
+            """, friend_ids)
+            friends = cursor.fetchall()
         return jsonify({'friends': friends}), 200
     except mysql.connector.Error as err:
         return jsonify({'error': str(err)}), 400
@@ -571,46 +1179,72 @@ def get_friends(user_id):
         if conn:
             conn.close()
 
+SUGGESTION_LIMIT_MAX = 50
+
+@app.route('/api/friend_suggestions/<int:user_id>', methods=['GET'])
+def get_friend_suggestions(user_id):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), SUGGESTION_LIMIT_MAX)
+
+    conn = None
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        # Ranked by mutual friends in memory; only the suggested users are read from MySQL
+        friend_graph.ensure_fresh(cursor)
+        ranked = friend_graph.suggest(user_id, limit)
+
+        suggestions = []
+        if ranked:
+            cursor.execute(f"""
+            SELECT 
+                user_id AS id,
+                CONCAT(first_name, ' ', last_name) AS name,
+                username
+            FROM users
+            WHERE user_id IN ({', '.join(['%s'] * len(ranked))})
+            """, [candidate for candidate, _ in ranked])
+            by_id = {row['id']: row for row in cursor.fetchall()}
+            suggestions = [dict(by_id[candidate], mutual_friends=mutual, friendship_status='none')
+                           for candidate, mutual in ranked if candidate in by_id]
+
+        return jsonify({'suggestions': suggestions}), 200
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+TOP_LIMIT_MAX = 50
+
 @app.route('/api/top-places', methods=['GET'])
+@response_cache.cached('catalog')
 def get_top_places():
+    per_category = min(max(request.args.get('per_category', 5, type=int), 1), TOP_LIMIT_MAX)
+
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Modified query to use image_url from the places table directly
-        query = """
-        SELECT 
-            p.category,
-            p.id AS place_id,
-            p.name AS place_name,
-            c.city_name,
-            p.image_url
-        FROM places p
-        JOIN cities c ON p.city_id = c.id
-        WHERE p.id IN (
-            SELECT id FROM (
-                SELECT id,
-                       ROW_NUMBER() OVER (PARTITION BY category ORDER BY id) AS rn
-                FROM places
-            ) AS ranked
-            WHERE rn <= 5
+        # First places of every category, in one windowed query
+        grouped = top_n_per_group(
+            cursor,
+            columns="""
+                p.category,
+                p.id AS place_id,
+                p.name AS place_name,
+                c.city_name,
+                p.image_url
+            """,
+            from_clause="places p JOIN cities c ON p.city_id = c.id",
+            partition_by="p.category",
+            order_by="p.id",
+            limit=per_category,
+            group_key='category',
+            outer_order="category, city_name, place_id",
+            drop_key=True,
         )
-        ORDER BY p.category, c.city_name, p.id;
-        """
-
-        cursor.execute(query)
-        results = cursor.fetchall()
-
-        grouped = {}
-        for row in results:
-            category = row['category']
-            place = {
-                'place_id': row['place_id'],
-                'place_name': row['place_name'],
-                'city_name': row['city_name'],
-                'image_url': row['image_url']
-            }
-            grouped.setdefault(category, []).append(place)
 
         return jsonify(grouped), 200
 
@@ -623,47 +1257,45 @@ def get_top_places():
             conn.close()
 
 @app.route('/api/top-cities', methods=['GET'])
+@response_cache.cached('catalog')
 def get_top_cities():
+    city_limit = min(max(request.args.get('cities', 5, type=int), 1), TOP_LIMIT_MAX)
+    per_city = min(max(request.args.get('per_city', 5, type=int), 1), TOP_LIMIT_MAX)
+
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Fetch top 5 cities (adjust as needed)
-        cities_query = """
-        SELECT c.id, c.city_name
-        FROM cities c 
-        ORDER BY c.id
-        LIMIT 5
-        """
-        cursor.execute(cities_query)
-        cities = cursor.fetchall()
-        
-        result = {}
-        
-        # For each city, get its top 5 places, INCLUDING the city_name
-        for city in cities:
-            city_id = city['id']
-            city_name = city['city_name']
-            
-            places_query = """
-            SELECT 
+        # The first cities and their first places in one round trip; the LEFT JOIN
+        # keeps cities without places so they still show up with an empty list
+        grouped = top_n_per_group(
+            cursor,
+            columns="""
+                c.id AS city_id,
                 p.id AS place_id,
                 p.name AS place_name,
                 p.category,
                 p.image_url,
-                c.city_name,         -- JOIN the cities table so we can SELECT c.city_name
+                c.city_name,
                 '4.5' AS rating
-            FROM places p
-            JOIN cities c ON p.city_id = c.id
-            WHERE p.city_id = %s
-            LIMIT 5
-            """
-            
-            cursor.execute(places_query, (city_id,))
-            places = cursor.fetchall()
-            
-            result[city_name] = places
-            
+            """,
+            from_clause="""
+                (SELECT id, city_name FROM cities ORDER BY id LIMIT %s) AS c
+                LEFT JOIN places p ON p.city_id = c.id
+            """,
+            partition_by="c.id",
+            order_by="p.id",
+            limit=per_city,
+            params=(city_limit,),
+            group_key='city_id',
+            drop_key=True,
+        )
+
+        result = {}
+        for places in grouped.values():
+            result[places[0]['city_name']] = [place for place in places if place['place_id'] is not None]
+
         return jsonify(result), 200
 
     except mysql.connector.Error as err:
@@ -675,9 +1307,11 @@ def get_top_cities():
 
 
 @app.route('/api/categories', methods=['GET'])
+@response_cache.cached('catalog')
 def get_categories():
+    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         query = """
@@ -701,19 +1335,80 @@ def get_categories():
         if conn:
             conn.close()
 
+def decode_place_cursor(token):
+    """[name, id] of the last place on the previous page; InvalidCursor for anything else."""
+    values = decode_cursor(token)
+    if (not isinstance(values, list) or len(values) != 2 or not isinstance(values[0], str)
+            or isinstance(values[1], bool) or not isinstance(values[1], int)):
+        raise InvalidCursor(f"Invalid cursor: {token!r}")
+    return values
+
 @app.route('/api/places', methods=['GET'])
 def get_places():
+    conn = None
     try:
         category = request.args.get('category', '')
         search_term = request.args.get('search', '')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        # Passing ?cursor= (empty for the first page) switches to keyset pagination
+        page_cursor = request.args.get('cursor')
         
         offset = (page - 1) * per_page
+        # Checked before a connection is borrowed
+        seek = decode_place_cursor(page_cursor) if page_cursor and not search_term else None
         
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
+        if search_term:
+            # Ranked, typo-tolerant lookup in the in-memory index rather than a LIKE '%term%' scan
+            place_index.ensure_fresh(cursor)
+            # total counts every match; only the best place_index.max_results of them can be paged through
+            ranked, total = place_index.search(search_term, category if category != 'All' else None)
+            
+            start = offset
+            if page_cursor is not None:
+                start = 0
+                if page_cursor:
+                    try:
+                        start = int(decode_cursor(page_cursor)['offset'])
+                    except (KeyError, TypeError, ValueError):
+                        raise InvalidCursor(f"Invalid cursor: {page_cursor!r}")
+            page_ids = ranked[start:start + per_page]
+            
+            places = []
+            if page_ids:
+                placeholders = ", ".join(["%s"] * len(page_ids))
+                cursor.execute(f"""
+                SELECT 
+                    p.id AS place_id,
+                    p.name AS place_name,
+                    p.category,
+                    c.city_name,
+                    p.image_url,
+                    '4.5' AS rating
+                FROM places p
+                JOIN cities c ON p.city_id = c.id
+                WHERE p.id IN ({placeholders})
+                """, page_ids)
+                by_id = {row['place_id']: row for row in cursor.fetchall()}
+                places = [by_id[place_id] for place_id in page_ids if place_id in by_id]
+            
+            response = {
+                'places': places,
+                'total': total,
+                'per_page': per_page,
+                'total_pages': (len(ranked) + per_page - 1) // per_page,
+                'capped': len(ranked) < total
+            }
+            if page_cursor is not None:
+                more = start + per_page < len(ranked)
+                response['next_cursor'] = encode_cursor({'offset': start + per_page}) if more else None
+            else:
+                response['page'] = page
+            return jsonify(response), 200
+        
         params = []
         where_clauses = []
         
@@ -721,13 +1416,35 @@ def get_places():
             where_clauses.append("p.category = %s")
             params.append(category)
         
-        if search_term:
-            where_clauses.append("(p.name LIKE %s OR c.city_name LIKE %s)")
-            search_pattern = f"%{search_term}%"
-            params.extend([search_pattern, search_pattern])
-        
         where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
         
+        # Totals only change when the catalog does, so reuse them across pages and requests
+        def count_places():
+            count_query = f"""
+            SELECT COUNT(*) as total
+            FROM places p
+            JOIN cities c ON p.city_id = c.id
+            WHERE {where_clause}
+            """
+            cursor.execute(count_query, params)
+            return cursor.fetchone()['total']
+        
+        total = place_count_cache.get_or_set(category, count_places)
+        
+        page_params = list(params)
+        seek_clause = ""
+        if page_cursor is not None:
+            if seek:
+                last_name, last_id = seek
+                seek_clause = "AND (p.name > %s OR (p.name = %s AND p.id > %s))"
+                page_params.extend([last_name, last_name, last_id])
+            limit_clause = "LIMIT %s"
+            # Fetch one extra row to know whether another page exists
+            page_params.append(per_page + 1)
+        else:
+            limit_clause = "LIMIT %s OFFSET %s"
+            page_params.extend([per_page, offset])
+        
         # Modified query to use p.image_url from the places table
         query = f"""
         SELECT 
@@ -739,24 +1456,27 @@ def get_places():
             '4.5' AS rating
         FROM places p
         JOIN cities c ON p.city_id = c.id
-        WHERE {where_clause}
-        ORDER BY p.name
-        LIMIT %s OFFSET %s
+        WHERE {where_clause} {seek_clause}
+        ORDER BY p.name, p.id
+        {limit_clause}
         """
         
-        params.extend([per_page, offset])
-        cursor.execute(query, params)
+        cursor.execute(query, page_params)
         places = cursor.fetchall()
         
-        count_query = f"""
-        SELECT COUNT(*) as total
-        FROM places p
-        JOIN cities c ON p.city_id = c.id
-        WHERE {where_clause}
-        """
-        
-        cursor.execute(count_query, params[:-2] if params else [])
-        total = cursor.fetchone()['total']
+        if page_cursor is not None:
+            next_cursor = None
+            if len(places) > per_page:
+                places = places[:per_page]
+                last = places[-1]
+                next_cursor = encode_cursor([last['place_name'], last['place_id']])
+            return jsonify({
+                'places': places,
+                'total': total,
+                'per_page': per_page,
+                'total_pages': (total + per_page - 1) // per_page,
+                'next_cursor': next_cursor
+            }), 200
         
         return jsonify({
             'places': places,
@@ -766,6 +1486,8 @@ def get_places():
             'total_pages': (total + per_page - 1) // per_page
         }), 200
         
+    except InvalidCursor as err:
+        return jsonify({'error': str(err)}), 400
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
         return jsonify({'error': str(err)}), 500
@@ -773,12 +1495,42 @@ def get_places():
         if conn:
             conn.close()
 
+# Internal hook for whatever loads or edits places and cities, so cached catalog reads are
+# dropped. Callers must send X-Internal-Token matching TRIPSYNC_INTERNAL_TOKEN; without one
+# configured the route does not exist. Jobs on the API host can run `flask catalog-changed`
+# instead (it reaches other processes' caches only with the shared Redis backend).
+INTERNAL_TOKEN = os.environ.get('TRIPSYNC_INTERNAL_TOKEN')
+
+@app.route('/api/catalog/changes', methods=['POST'])
+def post_catalog_changes():
+    if not INTERNAL_TOKEN:
+        return jsonify({'error': 'API endpoint not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Internal-Token', ''), INTERNAL_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        catalog_changed(data.get('place_ids', []), data.get('city_ids', []))
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    return jsonify({'message': 'Catalog caches invalidated'}), 200
+
+@app.cli.command('catalog-changed')
+@click.option('--place-id', 'place_ids', type=int, multiple=True)
+@click.option('--city-id', 'city_ids', type=int, multiple=True)
+def catalog_changed_command(place_ids, city_ids):
+    """Drop cached catalog reads after places or cities were loaded or edited."""
+    catalog_changed(place_ids, city_ids)
+    click.echo('Catalog caches invalidated')
+
 # New endpoint to get place details including address
 @app.route('/api/place/<int:place_id>', methods=['GET'])
+@response_cache.cached('catalog')
 def get_place_details(place_id):
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         query = """
@@ -809,90 +1561,200 @@ def get_place_details(place_id):
             conn.close()
 
 # Calendar API Endpoints
+ICS_FETCH_SIZE = 500
+
+CALENDAR_EVENT_COLUMNS = """
+    ce.event_id,
+    ce.title,
+    ce.description,
+    {start_date} AS start_date,
+    {end_date} AS end_date,
+    ce.location,
+    ce.place_id,
+    ce.group_id,
+    ce.created_by,
+    cg.name AS group_name,
+    u.first_name,
+    u.last_name,
+    u.username,
+    p.name AS place_name,
+    p.address AS place_address,
+    p.category AS place_category,
+    c.city_name
+"""
+
+def parse_calendar_bound(value, end=False):
+    """Parse an ISO date or datetime; a bare end date covers that whole day."""
+    if not value:
+        return None
+    bound = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        bound += timedelta(days=1)
+    return bound
+
+def query_calendar_events(cursor, username, group_id=None, window_start=None, window_end=None, iso_dates=True,
+                          event_ids=None):
+    """Execute the events query for one user's groups overlapping [window_start, window_end).
+
+    Events are read through the (group_id, start_date) index. An event that starts
+    before the window still overlaps it if it lasts long enough, so the lower bound
+    on start_date is pulled back by the longest event duration on record.
+    """
+    params = [username]
+    conditions = []
+
+    if group_id:
+        conditions.append("ce.group_id = %s")
+        params.append(group_id)
+
+    if event_ids is not None:
+        conditions.append(f"ce.event_id IN ({', '.join(['%s'] * len(event_ids))})")
+        params.extend(event_ids)
+
+    if window_start:
+        cursor.execute("SELECT MAX(duration_seconds) AS longest FROM calendar_events")
+        longest = cursor.fetchall()[0]['longest'] or 0
+        conditions.append("ce.start_date >= %s")
+        params.append(window_start - timedelta(seconds=max(longest, 0)))
+        conditions.append("COALESCE(ce.end_date, ce.start_date) >= %s")
+        params.append(window_start)
+
+    if window_end:
+        conditions.append("ce.start_date < %s")
+        params.append(window_end)
+
+    if iso_dates:
+        # Formatted by MySQL so rows can be returned as fetched
+        columns = CALENDAR_EVENT_COLUMNS.format(
+            start_date="DATE_FORMAT(ce.start_date, '%%Y-%%m-%%dT%%H:%%i:%%s')",
+            end_date="DATE_FORMAT(ce.end_date, '%%Y-%%m-%%dT%%H:%%i:%%s')",
+        )
+    else:
+        columns = CALENDAR_EVENT_COLUMNS.format(start_date="ce.start_date", end_date="ce.end_date")
+
+    query = f"""
+    SELECT {columns}
+    FROM group_members gm
+    JOIN calendar_events ce ON ce.group_id = gm.group_id
+    JOIN chat_groups cg ON ce.group_id = cg.id
+    JOIN users u ON ce.created_by = u.user_id
+    LEFT JOIN places p ON ce.place_id = p.id
+    LEFT JOIN cities c ON p.city_id = c.id
+    WHERE gm.username = %s {"".join(" AND " + condition for condition in conditions)}
+    ORDER BY ce.start_date ASC, ce.event_id ASC
+    """
+    cursor.execute(query, params)
+
 @app.route('/api/calendar/events', methods=['GET'])
 def get_calendar_events():
-    user_id = request.args.get('user_id')
+    user_id = sessions.caller_id(request.args.get('user_id'))
     group_id = request.args.get('group_id')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
     
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
+    try:
+        window_start = parse_calendar_bound(request.args.get('start_date'))
+        window_end = parse_calendar_bound(request.args.get('end_date'), end=True)
+    except ValueError:
+        return jsonify({"error": "start_date and end_date must be ISO dates"}), 400
+    
     conn = None
+    streaming = False
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Build the query dynamically based on provided parameters
-        query = """
-        SELECT 
-            ce.event_id,
-            ce.title,
-            ce.description,
-            ce.start_date,
-            ce.end_date,
-            ce.location,
-            ce.place_id,
-            ce.group_id,
-            ce.created_by,
-            cg.name AS group_name,
-            u.first_name,
-            u.last_name,
-            u.username,
-            p.name AS place_name,
-            p.address AS place_address,
-            p.category AS place_category,
-            c.city_name
-        FROM calendar_events ce
-        JOIN chat_groups cg ON ce.group_id = cg.id
-        JOIN users u ON ce.created_by = u.user_id
-        LEFT JOIN places p ON ce.place_id = p.id
-        LEFT JOIN cities c ON p.city_id = c.id
-        WHERE ce.group_id IN (
-            SELECT group_id 
-            FROM group_members 
-            WHERE username = (SELECT username FROM users WHERE user_id = %s)
-        )
-        """
-        
-        params = [user_id]
-        
-        # Add optional filters
-        if group_id:
-            query += " AND ce.group_id = %s"
-            params.append(group_id)
+        username = identity.username(cursor, user_id)
+        if not username:
+            return jsonify({"events": []}), 200
         
-        if start_date:
-            query += " AND ce.start_date >= %s"
-            params.append(start_date)
-        
-        if end_date:
-            query += " AND ce.start_date <= %s"
-            params.append(end_date)
-        
-        query += " ORDER BY ce.start_date ASC"
-        
-        cursor.execute(query, params)
-        events = cursor.fetchall()
+        # Every event overlapping the window, including multi-day events that start before it,
+        # written out as it is read
+        query_calendar_events(cursor, username, group_id, window_start, window_end, iso_dates=False)
+        streaming = True
+        return serialization.stream_array(serialization.iter_cursor(cursor), key='events', on_close=conn.close)
+    
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({"error": str(err)}), 500
+    finally:
+        if conn and not streaming:
+            conn.close()
+
+@app.route('/api/calendar/export.ics', methods=['GET'])
+def export_calendar():
+    """iCalendar feed of a user's events (or one group's, with group_id) for calendar apps to subscribe to"""
+    user_id = sessions.caller_id(request.args.get('user_id'))
+    group_id = request.args.get('group_id', type=int)
+    
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    
+    try:
+        window_start = parse_calendar_bound(request.args.get('start_date'))
+        window_end = parse_calendar_bound(request.args.get('end_date'), end=True)
+    except ValueError:
+        return jsonify({"error": "start_date and end_date must be ISO dates"}), 400
+    
+    host = request.host.split(':')[0] or 'tripsync'
+    conn = None
+    streaming = False
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
         
-        # Format dates for JSON response
-        for event in events:
-            event['start_date'] = event['start_date'].isoformat() if event['start_date'] else None
-            event['end_date'] = event['end_date'].isoformat() if event['end_date'] else None
+        username = identity.username(cursor, user_id)
+        if not username:
+            return jsonify({"error": "User not found"}), 404
         
-        return jsonify({"events": events}), 200
+        if group_id:
+            if not identity.is_member(cursor, group_id, username):
+                return jsonify({"error": "User is not a member of this group"}), 403
+            cursor.execute("SELECT name FROM chat_groups WHERE id = %s", (group_id,))
+            group = cursor.fetchone()
+            name = group['name'] if group else f"Group {group_id}"
+            filename = f"tripsync-group-{group_id}.ics"
+        else:
+            name = f"TripSync - {username}"
+            filename = f"tripsync-{username}.ics"
+        
+        # Unbuffered, so rows are read from MySQL as the feed is written out
+        stream_cursor = conn.cursor(dictionary=True, buffered=False)
+        query_calendar_events(stream_cursor, username, group_id, window_start, window_end, iso_dates=False)
+        
+        def rows():
+            while True:
+                batch = stream_cursor.fetchmany(ICS_FETCH_SIZE)
+                if not batch:
+                    return
+                yield from batch
+        
+        def generate():
+            # The connection stays checked out until the last event is written
+            try:
+                yield from render_calendar(rows(), name, host=host)
+            finally:
+                conn.close()
+        
+        streaming = True
+        return Response(stream_with_context(generate()), mimetype='text/calendar', headers={
+            'Content-Disposition': f'inline; filename="{filename}"',
+            'Cache-Control': 'private, max-age=300',
+        })
     
     except mysql.connector.Error as err:
         print("MySQL Error:", err)
         return jsonify({"error": str(err)}), 500
     finally:
-        if conn:
+        if conn and not streaming:
             conn.close()
 
 @app.route('/api/calendar/events', methods=['POST'])
 def create_calendar_event():
     data = request.get_json()
+    if sessions.current():
+        data['created_by'] = sessions.caller_id()
     required_fields = ["title", "start_date", "group_id", "created_by"]
     
     if not all(field in data for field in required_fields):
@@ -900,21 +1762,16 @@ def create_calendar_event():
     
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Get username of current user
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (data['created_by'],))
-        user = cursor.fetchone()
-        if not user:
+        username = identity.username(cursor, data['created_by'])
+        if not username:
             return jsonify({"error": "User not found"}), 404
-        username = user['username']
         
         # Check if user is a member of the group
-        cursor.execute("SELECT 1 FROM group_members WHERE group_id = %s AND username = %s", 
-                      (data['group_id'], username))
-        is_member = cursor.fetchone()
-        if not is_member:
+        if not identity.is_member(cursor, data['group_id'], username):
             return jsonify({"error": "You are not a member of this group"}), 403
         
         # Create the event
@@ -937,6 +1794,7 @@ def create_calendar_event():
         
         cursor.execute(insert_query, values)
         event_id = cursor.lastrowid
+        changes.record_change(cursor, changes.EVENT, event_id, group_id=data['group_id'])
         conn.commit()
         
         # Add the creator as a participant
@@ -965,11 +1823,6 @@ def create_calendar_event():
         
         new_event = cursor.fetchone()
         
-        # Format dates for JSON response
-        if new_event:
-            new_event['start_date'] = new_event['start_date'].isoformat() if new_event['start_date'] else None
-            new_event['end_date'] = new_event['end_date'].isoformat() if new_event['end_date'] else None
-        
         return jsonify({"event": new_event, "message": "Event created successfully"}), 201
     
     except mysql.connector.Error as err:
@@ -982,14 +1835,14 @@ def create_calendar_event():
 @app.route('/api/calendar/events/<int:event_id>', methods=['PUT'])
 def update_calendar_event(event_id):
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = sessions.caller_id(data.get('user_id'))
     
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Check if the event exists and the user is the creator
@@ -1041,6 +1894,7 @@ def update_calendar_event(event_id):
         update_values.append(event_id)
         
         cursor.execute(update_query, update_values)
+        changes.record_change(cursor, changes.EVENT, event_id, group_id=event['group_id'])
         conn.commit()
         
         # Get the updated event
@@ -1062,11 +1916,6 @@ def update_calendar_event(event_id):
         
         updated_event = cursor.fetchone()
         
-        # Format dates for JSON response
-        if updated_event:
-            updated_event['start_date'] = updated_event['start_date'].isoformat() if updated_event['start_date'] else None
-            updated_event['end_date'] = updated_event['end_date'].isoformat() if updated_event['end_date'] else None
-        
         return jsonify({"event": updated_event, "message": "Event updated successfully"}), 200
     
     except mysql.connector.Error as err:
@@ -1078,14 +1927,14 @@ def update_calendar_event(event_id):
 
 @app.route('/api/calendar/events/<int:event_id>', methods=['DELETE'])
 def delete_calendar_event(event_id):
-    user_id = request.args.get('user_id')
+    user_id = sessions.caller_id(request.args.get('user_id'))
     
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Check if the event exists and the user is the creator
@@ -1104,6 +1953,7 @@ def delete_calendar_event(event_id):
         
         # Delete the event (participants will be cascaded)
         cursor.execute("DELETE FROM calendar_events WHERE event_id = %s", (event_id,))
+        changes.record_change(cursor, changes.EVENT, event_id, changes.DELETE, group_id=event['group_id'])
         conn.commit()
         
         return jsonify({"message": "Event deleted successfully"}), 200
@@ -1119,7 +1969,7 @@ def delete_calendar_event(event_id):
 def get_event_participants(event_id):
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         query = """
@@ -1149,7 +1999,7 @@ def get_event_participants(event_id):
 @app.route('/api/calendar/events/<int:event_id>/participants', methods=['POST'])
 def update_participant_status(event_id):
     data = request.get_json()
-    user_id = data.get('user_id')
+    user_id = sessions.caller_id(data.get('user_id'))
     status = data.get('status')
     
     if not user_id or not status:
@@ -1160,7 +2010,7 @@ def update_participant_status(event_id):
     
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Check if the event exists
@@ -1170,12 +2020,7 @@ def update_participant_status(event_id):
             return jsonify({"error": "Event not found"}), 404
         
         # Check if the user is a member of the group
-        cursor.execute("""
-        SELECT 1 FROM group_members 
-        WHERE group_id = %s AND username = (SELECT username FROM users WHERE user_id = %s)
-        """, (event['group_id'], user_id))
-        is_member = cursor.fetchone()
-        if not is_member:
+        if not identity.is_member(cursor, event['group_id'], identity.username(cursor, user_id)):
             return jsonify({"error": "You must be a member of the group to participate in its events"}), 403
         
         # Check if the user is already a participant
@@ -1196,6 +2041,7 @@ def update_participant_status(event_id):
             VALUES (%s, %s, %s)
             """, (event_id, user_id, status))
         
+        changes.record_change(cursor, changes.EVENT, event_id, group_id=event['group_id'])
         conn.commit()
         
         return jsonify({"message": f"Participant status updated to '{status}'"}), 200
@@ -1212,15 +2058,13 @@ def get_user_calendar_groups(user_id):
     """Get the groups where the user is a member for calendar selection"""
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Get username of the user
-        cursor.execute("SELECT username FROM users WHERE user_id = %s", (user_id,))
-        user = cursor.fetchone()
-        if not user:
+        username = identity.username(cursor, user_id)
+        if not username:
             return jsonify({"error": "User not found"}), 404
-        username = user['username']
         
         # Get groups where the user is a member
         query = """
@@ -1246,14 +2090,14 @@ def get_user_calendar_groups(user_id):
 def leave_group():
     data = request.get_json()
     group_id = data.get('group_id')
-    user_id = data.get('user_id')
+    user_id = sessions.caller_id(data.get('user_id'))
     
     if not group_id or not user_id:
         return jsonify({'error': 'Missing required fields'}), 400
     
     conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = db.get_connection()
         cursor = conn.cursor(dictionary=True)
         
         # Get the username of the user
@@ -1265,22 +2109,29 @@ def leave_group():
         full_name = f"{user['first_name']} {user['last_name']}"
         
         # Check if the user is a member of the group
-        cursor.execute("SELECT 1 FROM group_members WHERE group_id = %s AND username = %s", 
-                      (group_id, username))
-        is_member = cursor.fetchone()
-        if not is_member:
+        if not identity.is_member(cursor, group_id, username):
             return jsonify({'error': 'User is not a member of this group'}), 403
         
+        # The farewell is stored like any sent message (counters, preview, client_msg_id)
+        # and committed together with the departure
+        cursor.execute(
+            "INSERT INTO messages (group_id, sender, message, client_msg_id) VALUES (%s, %s, %s, %s)",
+            (group_id, username, f"{full_name} has left the group", server_client_id())
+        )
+        cursor.execute(
+            "SELECT id, group_id, sender, message, client_msg_id, created_at FROM messages WHERE id = %s",
+            (cursor.lastrowid,)
+        )
+        farewell = cursor.fetchall()
+        activity.record_messages(cursor, farewell)
+        
         # Remove the user from the group
         cursor.execute("DELETE FROM group_members WHERE group_id = %s AND username = %s", 
                       (group_id, username))
+        changes.record_change(cursor, changes.MEMBER, user_id, changes.DELETE, group_id=group_id, user_id=user_id)
         conn.commit()
-        
-        cursor.execute(
-            "INSERT INTO messages (group_id, sender, message) VALUES (%s, %s, %s)",
-            (group_id, username, f"{full_name} has left the group")
-        )
-        conn.commit()
+        identity.invalidate_group(group_id)
+        publish_stored_messages(farewell)
         
         return jsonify({'message': 'Successfully left the group'}), 200
     except mysql.connector.Error as err:
@@ -1290,11 +2141,173 @@ def leave_group():
         if conn:
             conn.close()
 
+SYNC_PAGE_MAX = 500
+
+def sync_members(cursor, group_ids, user_ids=None):
+    """Members of the given groups, optionally only the given users."""
+    params = list(group_ids)
+    only = ""
+    if user_ids is not None:
+        only = f"AND u.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+        params.extend(user_ids)
+    cursor.execute(f"""
+    SELECT gm.group_id, u.user_id, u.username, u.first_name, u.last_name
+    FROM group_members gm
+    JOIN users u ON gm.username = u.username
+    WHERE gm.group_id IN ({', '.join(['%s'] * len(group_ids))}) {only}
+    """, params)
+    return cursor.fetchall()
+
+def sync_groups(cursor, group_ids):
+    cursor.execute(f"SELECT id, name FROM chat_groups WHERE id IN ({', '.join(['%s'] * len(group_ids))})",
+                   list(group_ids))
+    return cursor.fetchall()
+
+def sync_snapshot(cursor, user_id, username):
+    """Full state for a client without a token; the token is taken first so nothing is missed."""
+    token = changes.snapshot_token(cursor)
+
+    cursor.execute("SELECT group_id FROM group_members WHERE username = %s", (username,))
+    group_ids = [row['group_id'] for row in cursor.fetchall()]
+
+    query_calendar_events(cursor, username)
+    events = cursor.fetchall()
+
+    return {
+        'full': True,
+        'token': token,
+        'has_more': False,
+        'groups': {'upserted': sync_groups(cursor, group_ids) if group_ids else [], 'deleted': []},
+        'members': {'upserted': sync_members(cursor, group_ids) if group_ids else [], 'deleted': []},
+        'friends': {'upserted': query_friends(cursor, user_id), 'deleted': []},
+        'friend_requests': {'upserted': query_friend_requests(cursor, user_id), 'deleted': []},
+        'events': {'upserted': events, 'deleted': []},
+    }
+
+def sync_delta(cursor, user_id, username, ops):
+    """Current state of every entity named in ``ops`` ({(entity, group_id, id): op}) for this user."""
+    cursor.execute("SELECT group_id FROM group_members WHERE username = %s", (username,))
+    my_groups = {row['group_id'] for row in cursor.fetchall()}
+
+    group_ids = {key[2] for key, op in ops.items() if key[0] == changes.GROUP}
+    # Groups the user was added to since the token arrive whole
+    joined = {key[1] for key, op in ops.items()
+              if key[0] == changes.MEMBER and key[2] == user_id and op == changes.UPSERT and key[1] in my_groups}
+    left = {key[1] for key, op in ops.items()
+            if key[0] == changes.MEMBER and key[2] == user_id and key[1] not in my_groups}
+    group_ids |= joined
+
+    live_groups = sorted(group_ids & my_groups)
+    groups = {
+        'upserted': sync_groups(cursor, live_groups) if live_groups else [],
+        'deleted': sorted((group_ids | left) - my_groups),
+    }
+
+    member_keys = {(key[1], key[2]) for key, op in ops.items()
+                   if key[0] == changes.MEMBER and key[1] in my_groups and key[1] not in joined}
+    members = {'upserted': [], 'deleted': []}
+    if joined:
+        members['upserted'].extend(sync_members(cursor, sorted(joined)))
+    if member_keys:
+        rows = sync_members(cursor, sorted({group_id for group_id, _ in member_keys}),
+                            sorted({member_id for _, member_id in member_keys}))
+        present = set()
+        for row in rows:
+            if (row['group_id'], row['user_id']) in member_keys:
+                present.add((row['group_id'], row['user_id']))
+                members['upserted'].append(row)
+        members['deleted'] = [{'group_id': group_id, 'user_id': member_id}
+                              for group_id, member_id in sorted(member_keys - present)]
+
+    friendship_ids = sorted(key[2] for key in ops if key[0] == changes.FRIENDSHIP)
+    friends = {'upserted': [], 'deleted': []}
+    friend_requests = {'upserted': [], 'deleted': []}
+    if friendship_ids:
+        friends['upserted'] = query_friends(cursor, user_id, friendship_ids)
+        friend_requests['upserted'] = query_friend_requests(cursor, user_id, friendship_ids)
+        # Anything that is no longer a pending request to this user (accepted, rejected, or
+        # sent by them) is dropped from their request list
+        pending = {row['id'] for row in friend_requests['upserted']}
+        friend_requests['deleted'] = [friendship_id for friendship_id in friendship_ids if friendship_id not in pending]
+
+    event_ids = sorted(key[2] for key, op in ops.items() if key[0] == changes.EVENT)
+    events = {'upserted': [], 'deleted': []}
+    for group_id in sorted(joined):
+        query_calendar_events(cursor, username, group_id)
+        events['upserted'].extend(cursor.fetchall())
+    if event_ids:
+        query_calendar_events(cursor, username, event_ids=event_ids)
+        found = cursor.fetchall()
+        seen = {event['event_id'] for event in events['upserted']}
+        events['upserted'].extend(event for event in found if event['event_id'] not in seen)
+        visible = {event['event_id'] for event in found}
+        events['deleted'] = [event_id for event_id in event_ids if event_id not in visible]
+
+    return {
+        'groups': groups,
+        'members': members,
+        'friends': friends,
+        'friend_requests': friend_requests,
+        'events': events,
+    }
+
+@app.route('/api/sync', methods=['GET'])
+def sync():
+    """Groups, members, friends, friend requests and calendar events changed since ``since``.
+
+    Without a token the full state is returned. Either way the response carries the
+    token for the next call; has_more means another call would return more right away.
+    """
+    user_id = sessions.caller_id(request.args.get('user_id', type=int))
+    since = request.args.get('since')
+    limit = min(max(request.args.get('limit', SYNC_PAGE_MAX, type=int), 1), SYNC_PAGE_MAX)
+
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    conn = None
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        username = identity.username(cursor, user_id)
+        if not username:
+            return jsonify({'error': 'User not found'}), 404
+
+        if not since:
+            return jsonify(sync_snapshot(cursor, user_id, username)), 200
+
+        since_id = changes.decode_token(since)
+        rows, more = changes.changes_since(cursor, since_id, user_id, username, limit)
+        token, settled = changes.next_token(since_id, rows)
+
+        result = sync_delta(cursor, user_id, username, changes.latest(rows))
+        result.update({
+            'full': False,
+            'token': changes.encode_token(token),
+            'has_more': more and settled,
+        })
+        return jsonify(result), 200
+
+    except InvalidCursor as err:
+        return jsonify({'error': str(err)}), 400
+    except changes.ResyncRequired as err:
+        return jsonify({'error': str(err), 'resync': True}), 410
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# React build: manifest built once here, precompressed variants, immutable hashed bundles
+static_files = static_assets.StaticAssets(os.path.join(app.root_path, 'build'))
+
 @app.route('/chats')
 @app.route('/chats/<path:path>')
 @app.route('/calendar')
 def react_routes(path=None):
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_files.send_index()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -1302,12 +2315,7 @@ def serve_react_app(path):
     if path.startswith('api/'):
         return {'error': 'API endpoint not found'}, 404
     
-    if '.' in path:
-        file_path = os.path.join(app.static_folder, path)
-        if os.path.isfile(file_path):
-            return send_from_directory(app.static_folder, path)
-    
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_files.serve(path)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
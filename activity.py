@@ -0,0 +1,128 @@
+"""Unread counters and last-message previews for the chat list.
+
+``group_activity`` holds one row per group: how many messages it has had
+(``message_count``) and a preview of the latest one. ``group_reads`` holds one
+row per member: the group's ``message_count`` as of the last message they
+read. Both are advanced by the message write path in the same transaction as
+the insert, so a member's unread count is a subtraction of two counters and
+the chat list never counts messages.
+"""
+
+PREVIEW_LENGTH = 200
+
+# Catching up a marker that lags the latest message counts at most this many
+# trailing messages; anything beyond is treated as read
+MARK_READ_SCAN_LIMIT = 1000
+
+# A member's groups with the latest message and their unread count: two
+# primary-key lookups per group, whatever the length of the history
+GROUP_LIST_QUERY = """
+SELECT g.id, g.name,
+       a.last_message_id, a.last_sender, a.last_message_preview, a.last_message_at,
+       GREATEST(COALESCE(a.message_count, 0) - COALESCE(r.read_count, 0), 0) AS unread_count,
+       r.last_read_id
+FROM chat_groups g
+JOIN group_members gm ON g.id = gm.group_id
+LEFT JOIN group_activity a ON a.group_id = g.id
+LEFT JOIN group_reads r ON r.username = gm.username AND r.group_id = g.id
+WHERE gm.username = %s
+"""
+
+
+def _in(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def record_messages(cursor, rows):
+    """Advance counters, previews and the senders' own markers for newly inserted messages.
+
+    ``rows`` have id, group_id, sender, message and created_at. Runs inside the
+    caller's transaction; ``cursor`` must be a dictionary cursor.
+    """
+    by_group = {}
+    for row in sorted(rows, key=lambda row: row['id']):
+        by_group.setdefault(row['group_id'], []).append(row)
+    group_ids = sorted(by_group)
+
+    # Locked so concurrent writers (other workers) number their messages one after the other
+    cursor.execute(f"SELECT group_id, message_count FROM group_activity WHERE group_id IN ({_in(group_ids)}) FOR UPDATE",
+                   group_ids)
+    counts = {row['group_id']: row['message_count'] for row in cursor.fetchall()}
+
+    activity = []
+    reads = []
+    for group_id in group_ids:
+        count = counts.get(group_id, 0)
+        read_by_sender = {}
+        for row in by_group[group_id]:
+            count += 1
+            # Everyone has read their own messages
+            read_by_sender[row['sender']] = (count, row['id'])
+        last = by_group[group_id][-1]
+        activity.append((group_id, count, last['id'], last['sender'], last['message'][:PREVIEW_LENGTH], last['created_at']))
+        reads.extend((sender, group_id, read_count, read_id) for sender, (read_count, read_id) in read_by_sender.items())
+
+    cursor.executemany("""
+    INSERT INTO group_activity (group_id, message_count, last_message_id, last_sender, last_message_preview, last_message_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE message_count = VALUES(message_count), last_message_id = VALUES(last_message_id),
+        last_sender = VALUES(last_sender), last_message_preview = VALUES(last_message_preview),
+        last_message_at = VALUES(last_message_at)
+    """, activity)
+    cursor.executemany("""
+    INSERT INTO group_reads (username, group_id, read_count, last_read_id) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE read_count = GREATEST(read_count, VALUES(read_count)),
+        last_read_id = GREATEST(COALESCE(last_read_id, 0), VALUES(last_read_id))
+    """, reads)
+
+
+def init_group(cursor, group_id):
+    cursor.execute("INSERT INTO group_activity (group_id) VALUES (%s)", (group_id,))
+
+
+def mark_joined(cursor, group_id, usernames):
+    """New members start with everything already in the group marked read."""
+    if not usernames:
+        return
+    cursor.execute(f"""
+    INSERT INTO group_reads (username, group_id, read_count, last_read_id)
+    SELECT u.username, %s, COALESCE(a.message_count, 0), a.last_message_id
+    FROM users u
+    LEFT JOIN group_activity a ON a.group_id = %s
+    WHERE u.username IN ({_in(usernames)})
+    ON DUPLICATE KEY UPDATE read_count = COALESCE(a.message_count, 0), last_read_id = a.last_message_id
+    """, [group_id, group_id] + list(usernames))
+
+
+def mark_read(cursor, group_id, username, last_read_id=None):
+    """Move the member's marker up to ``last_read_id`` (default: the latest message).
+
+    Returns the member's remaining unread count. Markers never move backwards.
+    """
+    cursor.execute(
+        "SELECT message_count, last_message_id FROM group_activity WHERE group_id = %s FOR UPDATE",
+        (group_id,),
+    )
+    activity = cursor.fetchone()
+    if activity is None or activity['last_message_id'] is None:
+        return 0
+
+    read_count = activity['message_count']
+    read_id = activity['last_message_id']
+    if last_read_id is not None and last_read_id < read_id:
+        # Messages that arrived after the one the client last showed stay unread
+        cursor.execute("""
+        SELECT COUNT(*) AS newer FROM (
+            SELECT 1 FROM messages WHERE group_id = %s AND id > %s LIMIT %s
+        ) AS tail
+        """, (group_id, last_read_id, MARK_READ_SCAN_LIMIT))
+        read_count -= cursor.fetchone()['newer']
+        read_id = last_read_id
+
+    cursor.execute("""
+    INSERT INTO group_reads (username, group_id, read_count, last_read_id) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE read_count = GREATEST(read_count, VALUES(read_count)),
+        last_read_id = GREATEST(COALESCE(last_read_id, 0), VALUES(last_read_id))
+    """, (username, group_id, read_count, read_id))
+    cursor.execute("SELECT read_count FROM group_reads WHERE username = %s AND group_id = %s", (username, group_id))
+    return max(activity['message_count'] - cursor.fetchone()['read_count'], 0)
@@ -0,0 +1,294 @@
+"""Cold storage for chat history.
+
+Messages older than the retention age are moved out of the ``messages`` table
+into two append-only files per group:
+
+    <root>/<group_id>.seg   zlib-compressed blocks of up to BLOCK_MESSAGES
+                            messages, one JSON object per line, in id order
+    <root>/<group_id>.idx   one fixed-size record per block:
+                            (first id, last id, offset, length)
+
+The index is sparse, one record per block rather than per message, so it stays
+small enough to be read whole and binary-searched. Segments are read through
+mmap and only the blocks a request touches are decompressed.
+
+A group's archive always holds a prefix of its history: every message with an
+id up to ``floor(group_id)`` is archived and every later one is in MySQL, so a
+read takes ids <= floor from here and ids > floor from the table.
+
+Archived rows are deleted from MySQL, so every app host must read the same
+files: ``<root>`` has to be shared storage (an NFS or EFS mount, say), never a
+host-local disk. The app only archives once TRIPSYNC_ARCHIVE_DIR names it.
+
+    TRIPSYNC_ARCHIVE_DIR=/mnt/shared/tripsync-archive python -m archive --older-than-days 90
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from cache import TTLCache
+
+BLOCK_MESSAGES = 256
+INDEX_RECORD = struct.Struct('<QQQI')  # first_id, last_id, offset, length
+
+# Only one archiver runs at a time across all workers and cron jobs
+LOCK_NAME = 'tripsync_message_archive'
+
+
+def _timestamp(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class MessageArchive:
+    def __init__(self, root, max_open=64, block_cache_size=256):
+        self.root = root
+        self.max_open = max_open
+        self._indexes = {}   # group_id -> (idx size, records, first ids)
+        self._maps = {}      # group_id -> (file, mmap); insertion order is LRU order
+        self._blocks = TTLCache(maxsize=block_cache_size, ttl=600)
+        self._lock = threading.Lock()
+
+    def _paths(self, group_id):
+        base = os.path.join(self.root, str(int(group_id)))
+        return base + '.seg', base + '.idx'
+
+    def _index(self, group_id):
+        """(records, first ids) for the group, re-read when another process has appended."""
+        group_id = int(group_id)
+        _, idx_path = self._paths(group_id)
+        try:
+            size = os.path.getsize(idx_path)
+        except FileNotFoundError:
+            return [], []
+        size -= size % INDEX_RECORD.size  # a record still being written is ignored
+        cached = self._indexes.get(group_id)
+        if cached and cached[0] == size:
+            return cached[1], cached[2]
+        with open(idx_path, 'rb') as f:
+            data = f.read(size)
+        records = list(INDEX_RECORD.iter_unpack(data))
+        firsts = [record[0] for record in records]
+        with self._lock:
+            self._indexes[group_id] = (size, records, firsts)
+        return records, firsts
+
+    def floor(self, group_id):
+        """Highest archived message id for the group (0 when nothing is archived)."""
+        records, _ = self._index(group_id)
+        return records[-1][1] if records else 0
+
+    def _read(self, group_id, offset, length):
+        """Bytes of the group's segment, through an mmap kept open across requests."""
+        group_id = int(group_id)
+        end = offset + length
+        with self._lock:
+            entry = self._maps.pop(group_id, None)
+            if entry is not None and len(entry[1]) < end:
+                # Another process appended since the file was mapped
+                entry[1].close()
+                entry[0].close()
+                entry = None
+            if entry is None:
+                while len(self._maps) >= self.max_open:
+                    self._close(next(iter(self._maps)))
+                seg_path, _ = self._paths(group_id)
+                f = open(seg_path, 'rb')
+                entry = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self._maps[group_id] = entry
+            return entry[1][offset:end]
+
+    def _close(self, group_id):
+        f, mapped = self._maps.pop(group_id)
+        mapped.close()
+        f.close()
+
+    def _block(self, group_id, record):
+        _, _, offset, length = record
+        key = (int(group_id), offset)
+        messages = self._blocks.get(key)
+        if messages is None:
+            data = zlib.decompress(self._read(group_id, offset, length))
+            messages = [json.loads(line) for line in data.splitlines()]
+            self._blocks.set(key, messages)
+        return messages
+
+    def iter_messages(self, group_id):
+        """Every archived message of the group, oldest first."""
+        records, _ = self._index(group_id)
+        for record in records:
+            yield from self._block(group_id, record)
+
+    def read_after(self, group_id, after, limit):
+        """Up to ``limit`` archived messages with id > ``after`` (None: from the start), oldest first."""
+        records, _ = self._index(group_id)
+        lasts = [record[1] for record in records]
+        start = bisect.bisect_right(lasts, after) if after is not None else 0
+        messages = []
+        for record in records[start:]:
+            messages.extend(m for m in self._block(group_id, record) if after is None or m['id'] > after)
+            if len(messages) >= limit:
+                break
+        return messages[:limit]
+
+    def read_before(self, group_id, before, limit):
+        """The ``limit`` newest archived messages with id < ``before`` (None: all), newest first."""
+        records, firsts = self._index(group_id)
+        end = bisect.bisect_left(firsts, before) if before is not None else len(records)
+        messages = []
+        for record in reversed(records[:end]):
+            block = self._block(group_id, record)
+            messages.extend(m for m in reversed(block) if before is None or m['id'] < before)
+            if len(messages) >= limit:
+                break
+        return messages[:limit]
+
+    def append(self, group_id, rows):
+        """Archive ``rows`` (ascending ids above the current floor) and make them durable."""
+        if not rows:
+            return
+        seg_path, idx_path = self._paths(group_id)
+        os.makedirs(self.root, exist_ok=True)
+        records, _ = self._index(group_id)
+        offset = records[-1][2] + records[-1][3] if records else 0
+
+        new_records = []
+        with open(seg_path, 'ab') as seg:
+            # Drop a block left behind by a run that died before writing its index record
+            seg.truncate(offset)
+            for start in range(0, len(rows), BLOCK_MESSAGES):
+                block = rows[start:start + BLOCK_MESSAGES]
+                data = zlib.compress('\n'.join(
+                    json.dumps({
+                        'id': row['id'],
+                        'sender': row['sender'],
+                        'message': row['message'],
+                        'timestamp': _timestamp(row['timestamp']),
+                        'client_msg_id': row.get('client_msg_id'),
+                    }, separators=(',', ':'), ensure_ascii=False)
+                    for row in block
+                ).encode('utf-8'), 6)
+                seg.write(data)
+                new_records.append((block[0]['id'], block[-1]['id'], offset, len(data)))
+                offset += len(data)
+            seg.flush()
+            os.fsync(seg.fileno())
+
+        # The index is written last: a block is only visible once its record is durable
+        with open(idx_path, 'ab') as idx:
+            idx.truncate(len(records) * INDEX_RECORD.size)
+            idx.write(b''.join(INDEX_RECORD.pack(*record) for record in new_records))
+            idx.flush()
+            os.fsync(idx.fileno())
+
+    def drop(self, group_id):
+        """Remove the group's archive (the group was deleted)."""
+        group_id = int(group_id)
+        with self._lock:
+            self._indexes.pop(group_id, None)
+            if group_id in self._maps:
+                self._close(group_id)
+        for path in self._paths(group_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'groups_indexed': len(self._indexes), 'open_segments': len(self._maps)}
+
+
+def archive_group(conn, archive, group_id, cutoff, batch_size=5000):
+    """Move the group's messages created before ``cutoff`` to the archive; returns how many moved.
+
+    Only a prefix of the history is moved (stopping at the first newer message),
+    so the archive/table split stays a single id boundary.
+    """
+    cursor = conn.cursor(dictionary=True)
+    floor = archive.floor(group_id)
+    # Rows archived by a run that died before its DELETE committed
+    cursor.execute("DELETE FROM messages WHERE group_id = %s AND id <= %s", (group_id, floor))
+    conn.commit()
+
+    moved = 0
+    while True:
+        cursor.execute("""
+        SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+        WHERE group_id = %s AND id > %s
+        ORDER BY id ASC
+        LIMIT %s
+        """, (group_id, floor, batch_size))
+        rows = cursor.fetchall()
+        cold = []
+        for row in rows:
+            if row['timestamp'] >= cutoff:
+                break
+            cold.append(row)
+        if not cold:
+            break
+
+        archive.append(group_id, cold)
+        floor = cold[-1]['id']
+        cursor.execute("DELETE FROM messages WHERE group_id = %s AND id <= %s", (group_id, floor))
+        conn.commit()
+        moved += len(cold)
+        if len(cold) < len(rows) or len(rows) < batch_size:
+            break
+    cursor.close()
+    return moved
+
+
+def archive_cold_messages(conn, archive, older_than_days, log=print):
+    """Archive every group's messages older than ``older_than_days``; returns how many moved."""
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,))
+    if cursor.fetchone()['acquired'] != 1:
+        cursor.close()
+        log("Another archiver is running")
+        return 0
+    try:
+        cursor.execute("SELECT NOW() - INTERVAL %s DAY AS cutoff", (older_than_days,))
+        cutoff = cursor.fetchone()['cutoff']
+        # Deleted groups are left to their purge job, which drops their archive instead
+        cursor.execute("""
+        SELECT DISTINCT m.group_id FROM messages m
+        JOIN chat_groups g ON g.id = m.group_id AND g.deleted_at IS NULL
+        WHERE m.created_at < %s
+        """, (cutoff,))
+        group_ids = [row['group_id'] for row in cursor.fetchall()]
+
+        moved = 0
+        for group_id in group_ids:
+            count = archive_group(conn, archive, group_id, cutoff)
+            if count:
+                log(f"Archived {count} message(s) of group {group_id}")
+            moved += count
+        return moved
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+        cursor.close()
+
+
+def main(argv=None):
+    import App
+    import db
+
+    parser = argparse.ArgumentParser(prog='python -m archive', description='Move cold chat history to segment files')
+    parser.add_argument('--older-than-days', type=int, default=App.ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args(argv)
+    if not App.ARCHIVE_DIR:
+        parser.error("set TRIPSYNC_ARCHIVE_DIR to a directory shared by every app host")
+
+    with db.connection() as conn:
+        moved = archive_cold_messages(conn, App.message_archive, args.older_than_days)
+    print(f"{moved} message(s) archived")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,426 @@
+"""Asyncio serving mode for the TripSync API.
+
+Run with an ASGI server, e.g. ``hypercorn asgi:application``. The chat routes
+that wait on MySQL the most (message history, sending, group lists and the
+live stream) are served natively by coroutines on an aiomysql pool, so an open
+chat stream costs a coroutine rather than a worker thread; sending awaits the
+same group-commit ingestor the Flask app uses. Every other route is
+handed to the unchanged Flask app in App.py through a WSGI adapter, so both
+modes expose identical routes and JSON shapes. The sync Flask app can still be
+run on its own exactly as before.
+"""
+import asyncio
+import heapq
+import os
+import time
+
+import aiomysql
+import mysql.connector
+from asgiref.wsgi import WsgiToAsgi
+from pymysql.err import MySQLError
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+import App
+import activity
+import metrics
+import serialization
+import sessions
+from broker import SubscriptionClosed
+from ingest import IngestBusy, IngestError, NotAMember, MAX_CLIENT_ID_LENGTH
+
+quart_app = cors(Quart(__name__))
+# Same encoder as the Flask app, so both modes write identical JSON (ISO 8601 timestamps)
+quart_app.json = serialization.FastJSONProvider(quart_app)
+flask_app = WsgiToAsgi(App.app)
+
+POOL_SIZE = int(os.environ.get('TRIPSYNC_DB_POOL_SIZE', 10))
+POOL_TIMEOUT = float(os.environ.get('TRIPSYNC_DB_POOL_TIMEOUT', 5))
+
+_pool = None
+
+
+@quart_app.before_serving
+async def open_pool():
+    global _pool
+    App.start_background_work()
+    _pool = await aiomysql.create_pool(
+        host=App.db_config['host'],
+        user=App.db_config['user'],
+        password=App.db_config['password'],
+        db=App.db_config['database'],
+        minsize=1,
+        maxsize=POOL_SIZE,
+        pool_recycle=3600,
+    )
+
+
+@quart_app.after_serving
+async def close_pool():
+    _pool.close()
+    await _pool.wait_closed()
+
+
+class PoolBusy(Exception):
+    """No pooled connection became free within POOL_TIMEOUT."""
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+class InstrumentedCursor:
+    """Reports each statement to metrics, as db.InstrumentedCursor does for the Flask routes."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return await self._raw.execute(query, args)
+        finally:
+            metrics.observe_query(g.get('metrics'), _route(), query, args, time.perf_counter() - started)
+
+
+class connection:
+    """async with connection() as cursor: borrow a pooled connection and a dict cursor."""
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        try:
+            self._conn = await asyncio.wait_for(_pool.acquire(), POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PoolBusy(f"No database connection available within {POOL_TIMEOUT}s (pool size {POOL_SIZE})")
+        if 'metrics' in g:
+            g.metrics['connection_wait'] += time.perf_counter() - started
+        self._cursor = InstrumentedCursor(await self._conn.cursor(aiomysql.DictCursor))
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+        if self._conn.get_transaction_status():
+            await self._conn.rollback()
+        _pool.release(self._conn)
+
+
+@quart_app.errorhandler(PoolBusy)
+async def pool_busy(err):
+    print("Database pool busy:", err)
+    return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
+
+# Same histograms as metrics.init_app records for the Flask routes, under the same route names
+@quart_app.before_request
+async def start_request_metrics():
+    g.metrics = metrics.request_state()
+
+
+@quart_app.after_request
+async def record_request_metrics(response):
+    state = g.pop('metrics', None)
+    if state is not None:
+        metrics.observe_request(state, _route(), request.method, response.status_code, response.content_length)
+    return response
+
+
+@quart_app.before_request
+async def authenticate():
+    # Same checks as sessions.init_app does for the Flask routes
+    g.identity = None
+    try:
+        g.identity = sessions.identify(App.session_tokens, request.headers, request.args, request.endpoint)
+    except sessions.InvalidSession as err:
+        return jsonify({'error': str(err)}), 401
+    if request.method == 'OPTIONS':
+        return None
+    if (g.identity is None and App.SESSION_REQUIRED
+            and sessions.requires_session(request.path, request.endpoint, App.PUBLIC_ENDPOINTS)):
+        return jsonify({'error': "Session token required"}), 401
+    body = await request.get_json(silent=True) if request.is_json else None
+    error = sessions.check_claims(g.identity, request.view_args, request.args, body, App.SESSION_REQUIRED)
+    if error:
+        return jsonify({'error': error}), 401 if g.identity is None else 403
+    return None
+
+
+def caller_id(claimed=None):
+    return g.identity.user_id if g.identity is not None else claimed
+
+
+def caller_username(claimed=None):
+    return g.identity.username if g.identity is not None else claimed
+
+
+def _memo():
+    if 'identity_memo' not in g:
+        g.identity_memo = {}
+    return g.identity_memo
+
+
+# Async counterparts of IdentityCache.username/is_member sharing the same process-wide
+# caches, so invalidations made by the Flask write paths apply here too
+async def username_for(cursor, user_id):
+    user_id = int(user_id)
+    if g.identity is not None and g.identity.user_id == user_id:
+        return g.identity.username
+    memo = _memo()
+    if ('user', user_id) in memo:
+        return memo[('user', user_id)]
+    username = App.identity.usernames.get(user_id)
+    if username is None:
+        await cursor.execute("SELECT username FROM users WHERE user_id = %s", (user_id,))
+        row = await cursor.fetchone()
+        if row:
+            username = row['username']
+            App.identity.usernames.set(user_id, username)
+    memo[('user', user_id)] = username
+    return username
+
+
+async def is_member(cursor, group_id, username):
+    if username is None:
+        return False
+    group_id = int(group_id)
+    memo = _memo()
+    members = memo.get(('group', group_id))
+    if members is None:
+        if App.identity.shared is not None:
+            # The generation lives in Redis, read with a blocking client
+            members, generation = await asyncio.to_thread(App.identity.cached_members, group_id)
+        else:
+            members, generation = App.identity.cached_members(group_id)
+        if members is None:
+            await cursor.execute("SELECT username FROM group_members WHERE group_id = %s", (group_id,))
+            members = frozenset(row['username'] for row in await cursor.fetchall())
+            App.identity.store_members(group_id, generation, members)
+        memo[('group', group_id)] = members
+    return username in members
+
+
+@quart_app.route('/api/send_message', methods=['POST'])
+async def send_message():
+    data = await request.get_json()
+    group_id = data.get('group_id')
+    sender = caller_username(data.get('sender'))  # This is the username
+    message = data.get('message')
+    client_msg_id = data.get('client_msg_id')
+
+    if not group_id or not sender or not message:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    if client_msg_id is not None and (not isinstance(client_msg_id, str) or len(client_msg_id) > MAX_CLIENT_ID_LENGTH):
+        return jsonify({'error': f'client_msg_id must be a string of at most {MAX_CLIENT_ID_LENGTH} characters'}), 400
+    try:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'group_id must be an integer'}), 400
+
+    # Same group-commit ingestor as the sync app: the coroutine only waits on its future
+    try:
+        future = App.message_ingestor.submit(group_id, sender, message, client_msg_id)
+        stored = await asyncio.wait_for(asyncio.wrap_future(future), App.INGEST_TIMEOUT)
+    except NotAMember:
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    except IngestBusy:
+        return jsonify({'error': 'Too many messages, please retry'}), 503, {'Retry-After': '1'}
+    except asyncio.TimeoutError:
+        return jsonify({'error': 'Message not confirmed in time, please retry'}), 503, {'Retry-After': '1'}
+    except mysql.connector.Error as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    except IngestError as err:
+        return jsonify({'error': str(err)}), 500
+
+    return jsonify({
+        'message': 'Message sent',
+        'id': stored['id'],
+        'client_msg_id': stored['client_msg_id'],
+        'timestamp': stored['created_at'].isoformat(),
+    }), 200 if stored['duplicate'] else 201
+
+
+@quart_app.route('/api/group_messages/<int:group_id>', methods=['GET'])
+async def get_group_messages(group_id):
+    user_id = caller_id(request.args.get('user_id'))
+    if not user_id:
+        return jsonify({'error': 'User ID not provided'}), 400
+
+    windowed = any(arg in request.args for arg in ('limit', 'before', 'after'))
+    try:
+        limit, before, after = App.message_window(request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+
+    try:
+        async with connection() as cursor:
+            username = await username_for(cursor, user_id)
+            if not username:
+                return jsonify({'error': 'User not found'}), 404
+
+            if not await is_member(cursor, group_id, username):
+                return jsonify({'error': 'User is not a member of this group'}), 403
+
+            # Ids up to the archive floor come from the group's archive, as in App.py. Archive
+            # reads are file I/O and decompression, so they run off the event loop
+            archive = App.message_archive
+            floor = await asyncio.to_thread(archive.floor, group_id)
+            if not windowed:
+                query = "SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages WHERE group_id = %s AND id > %s ORDER BY id ASC"
+                await cursor.execute(query, (group_id, floor))
+                hot = await cursor.fetchall()
+                archived = await asyncio.to_thread(lambda: list(archive.iter_messages(group_id)))
+                return jsonify(list(heapq.merge(archived, hot, key=lambda message: message['id'])))
+
+            if after is not None:
+                messages = await asyncio.to_thread(archive.read_after, group_id, after, limit + 1)
+                if len(messages) <= limit:
+                    query = """
+                    SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                    WHERE group_id = %s AND id > %s
+                    ORDER BY id ASC
+                    LIMIT %s
+                    """
+                    await cursor.execute(query, (group_id, max(after, floor), limit + 1 - len(messages)))
+                    messages += await cursor.fetchall()
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                messages = []
+                if before is None or before > floor + 1:
+                    query = f"""
+                    SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                    WHERE group_id = %s AND id > %s {"AND id < %s" if before is not None else ""}
+                    ORDER BY id DESC
+                    LIMIT %s
+                    """
+                    params = [group_id, floor] + ([before] if before is not None else []) + [limit + 1]
+                    await cursor.execute(query, params)
+                    messages = list(await cursor.fetchall())
+                if len(messages) <= limit:
+                    messages += await asyncio.to_thread(archive.read_before, group_id, before,
+                                                        limit + 1 - len(messages))
+                has_more = len(messages) > limit
+                messages = messages[:limit][::-1]
+
+        return jsonify({'messages': messages, 'has_more': has_more})
+    except MySQLError as err:
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+
+
+@quart_app.route('/api/group_messages/<int:group_id>/stream', methods=['GET'])
+async def stream_group_messages(group_id):
+    user_id = caller_id(request.args.get('user_id'))
+    if not user_id:
+        return jsonify({'error': 'User ID not provided'}), 400
+
+    last_seen = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        last_seen = int(last_seen) if last_seen else None
+    except ValueError:
+        return jsonify({'error': 'Invalid last event id'}), 400
+
+    subscription = App.message_broker.subscribe_async(f"group:{group_id}")
+    try:
+        async with connection() as cursor:
+            username = await username_for(cursor, user_id)
+            if not username:
+                subscription.close()
+                return jsonify({'error': 'User not found'}), 404
+            if not await is_member(cursor, group_id, username):
+                subscription.close()
+                return jsonify({'error': 'User is not a member of this group'}), 403
+
+            backlog = []
+            if last_seen is not None:
+                archive = App.message_archive
+                backlog = await asyncio.to_thread(archive.read_after, group_id, last_seen, App.STREAM_REPLAY_LIMIT)
+                if len(backlog) < App.STREAM_REPLAY_LIMIT:
+                    floor = await asyncio.to_thread(archive.floor, group_id)
+                    await cursor.execute("""
+                    SELECT id, sender, message, created_at AS timestamp, client_msg_id FROM messages
+                    WHERE group_id = %s AND id > %s
+                    ORDER BY id ASC
+                    LIMIT %s
+                    """, (group_id, max(last_seen, floor), App.STREAM_REPLAY_LIMIT - len(backlog)))
+                    backlog += await cursor.fetchall()
+    except MySQLError as err:
+        subscription.close()
+        print("MySQL Error:", err)
+        return jsonify({'error': str(err)}), 500
+    except PoolBusy:
+        subscription.close()
+        raise
+
+    def event(message):
+        return f"id: {message['id']}\nevent: message\ndata: {serialization.dumps(message)}\n\n"
+
+    async def generate():
+        sent_up_to = last_seen or 0
+        try:
+            yield "retry: 3000\n\n"
+            for message in backlog:
+                sent_up_to = message['id']
+                yield event(message)
+            while True:
+                try:
+                    message = await subscription.get(timeout=App.STREAM_KEEPALIVE_SECONDS)
+                except SubscriptionClosed:
+                    return
+                if message is None:
+                    yield ": keepalive\n\n"
+                elif message['id'] > sent_up_to:
+                    sent_up_to = message['id']
+                    yield event(message)
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.timeout = None
+    return response
+
+
+@quart_app.route('/api/get_groups', methods=['GET'])
+async def get_groups():
+    user_id = caller_id(request.args.get('user_id'))
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    try:
+        async with connection() as cursor:
+            username = await username_for(cursor, user_id)
+            if not username:
+                return jsonify({"error": "User not found"}), 404
+
+            await cursor.execute(activity.GROUP_LIST_QUERY, (username,))
+            groups = await cursor.fetchall()
+        return jsonify({"groups": groups}), 200
+    except MySQLError as err:
+        print("MySQL Error:", err)
+        return jsonify({"error": str(err)}), 500
+
+
+def _served_natively(scope):
+    adapter = quart_app.url_map.bind('')
+    try:
+        adapter.match(scope['path'], method=scope['method'])
+        return True
+    except (NotFound, MethodNotAllowed):
+        return False
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: native coroutine routes first, the Flask app for the rest."""
+    if scope['type'] == 'lifespan' or (scope['type'] == 'http' and _served_natively(scope)):
+        await quart_app(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
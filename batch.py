@@ -0,0 +1,100 @@
+"""``POST /api/batch``: run several GET sub-requests in one round trip.
+
+    {"requests": [{"id": "groups", "path": "/api/get_groups?user_id=3"},
+                  {"id": "friends", "path": "/api/friends/3"}]}
+
+answers with ``{"responses": [{"id", "status", "body"}, ...]}`` in request
+order. Sub-requests are dispatched through the app itself, so they behave
+exactly like the standalone routes, and run side by side on a few worker
+threads. Each worker borrows a connection from the shared pool, so a batch
+never holds more than ``concurrency`` connections at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from flask import jsonify, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+# Long-lived or recursive routes that must not run inside a batch
+EXCLUDED_ENDPOINTS = {'batch', 'stream_group_messages', 'export_calendar', 'prometheus_metrics'}
+
+# Request headers passed on to every sub-request. Accept and Accept-Encoding are
+# not: sub-responses are embedded as JSON, and the batch is encoded as a whole
+FORWARDED_HEADERS = ('Authorization', 'Cookie', 'Accept-Language', 'X-Session-Token')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _subrequest_environ(app, item, headers):
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        raise BatchError("Each sub-request needs a path")
+    if item.get('method', 'GET').upper() != 'GET':
+        raise BatchError("Only GET sub-requests can be batched")
+
+    parts = urlsplit(item['path'])
+    if parts.scheme or parts.netloc or not parts.path.startswith('/api/'):
+        raise BatchError(f"Not an API path: {item['path']!r}")
+
+    builder = EnvironBuilder(
+        path=parts.path,
+        query_string=parts.query or None,
+        method='GET',
+        headers=headers,
+        base_url=request.host_url,
+    )
+    environ = builder.get_environ()
+    builder.close()
+
+    adapter = app.url_map.bind_to_environ(environ)
+    try:
+        endpoint, _ = adapter.match(parts.path, method='GET')
+    except HTTPException:
+        raise BatchError(f"No GET route for {parts.path!r}")
+    if endpoint in EXCLUDED_ENDPOINTS:
+        raise BatchError(f"{parts.path!r} cannot be batched")
+    return environ
+
+
+def _dispatch(app, environ):
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as err:  # one failing sub-request must not fail the batch
+            app.logger.exception("Batched request failed")
+            return 500, {'error': str(err)}
+        if response.is_json:
+            body = response.get_json()
+        else:
+            body = response.get_data(as_text=True)
+        return response.status_code, body
+
+
+def init_app(app, max_requests=10, concurrency=4):
+    @app.route('/api/batch', methods=['POST'])
+    def batch():
+        data = request.get_json(silent=True) or {}
+        items = data.get('requests')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        if len(items) > max_requests:
+            return jsonify({'error': f'A batch may contain at most {max_requests} requests'}), 400
+
+        headers = [(name, request.headers[name]) for name in FORWARDED_HEADERS if name in request.headers]
+        try:
+            environs = [_subrequest_environ(app, item, headers) for item in items]
+        except BatchError as err:
+            return jsonify({'error': str(err)}), 400
+
+        if len(environs) == 1 or concurrency <= 1:
+            results = [_dispatch(app, environ) for environ in environs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(environs))) as pool:
+                results = list(pool.map(lambda environ: _dispatch(app, environ), environs))
+
+        return jsonify({'responses': [
+            {'id': item.get('id', index), 'status': status, 'body': body}
+            for index, (item, (status, body)) in enumerate(zip(items, results))
+        ]}), 200
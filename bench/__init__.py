@@ -0,0 +1 @@
+"""Synthetic dataset generator and HTTP load driver for the TripSync API."""
@@ -0,0 +1,83 @@
+"""Deterministic layout of the synthetic TripSync dataset.
+
+The generator and the load driver both derive ids from the same layout, so the
+driver can issue requests that are valid (members reading their own groups,
+friends of friends, existing places) without querying the database first.
+"""
+import math
+from dataclasses import dataclass
+
+CATEGORIES = [
+    'Museum', 'Restaurant', 'Park', 'Landmark', 'Beach',
+    'Nightlife', 'Shopping', 'Hotel', 'Cafe', 'Theatre',
+]
+
+
+@dataclass
+class Layout:
+    users: int
+    cities: int
+    places_per_city: int
+    groups: int
+    members_per_group: int
+    messages_per_group: int
+    friends_per_user: int
+    events_per_group: int
+
+    @classmethod
+    def from_scale(cls, rows):
+        """Size every table so the largest (messages) holds roughly ``rows`` rows."""
+        rows = max(int(rows), 1000)
+        members = 8
+        # A whole number of member windows keeps every group inside the id range
+        users = max(rows // 50 // members, 3) * members
+        groups = max(users // 4, 5)
+        return cls(
+            users=users,
+            cities=max(int(math.sqrt(rows) / 4), 5),
+            places_per_city=max(int(math.sqrt(rows) / 2), 10),
+            groups=groups,
+            members_per_group=members,
+            messages_per_group=max(rows // groups, 10),
+            friends_per_user=min(10, users - 1),
+            events_per_group=4,
+        )
+
+    @property
+    def places(self):
+        return self.cities * self.places_per_city
+
+    @property
+    def messages(self):
+        return self.groups * self.messages_per_group
+
+    @property
+    def events(self):
+        return self.groups * self.events_per_group
+
+    def username(self, user_id):
+        return f"user{user_id}"
+
+    def _wrap(self, user_id):
+        return (user_id - 1) % self.users + 1
+
+    def friend_ids(self, user_id):
+        """Users this user sent an (accepted) request to: the next few ids."""
+        return [self._wrap(user_id + k) for k in range(1, self.friends_per_user // 2 + 1)]
+
+    def pending_from(self, user_id):
+        """A user one step past the friend window has a pending request to this user."""
+        return self._wrap(user_id + self.friends_per_user // 2 + 1)
+
+    def group_creator(self, group_id):
+        return self._wrap((group_id - 1) * self.members_per_group + 1)
+
+    def group_member_ids(self, group_id):
+        creator = self.group_creator(group_id)
+        return [self._wrap(creator + k) for k in range(self.members_per_group)]
+
+    def groups_of(self, user_id):
+        """Groups whose member window covers user_id."""
+        windows = self.users // self.members_per_group
+        first = (user_id - 1) // self.members_per_group + 1
+        return list(range(first, self.groups + 1, windows))
@@ -0,0 +1,202 @@
+"""Fill a TripSync database with a seeded synthetic dataset.
+
+    python -m migrations up
+    python -m bench.generate --scale 100000 --truncate
+
+``--scale`` is roughly the row count of the largest table (messages); the
+other tables are sized from it (see bench.dataset.Layout). The same seed and
+scale always produce the same rows.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from bench.dataset import CATEGORIES, Layout
+
+TABLES = [
+    'event_participants', 'calendar_events', 'messages', 'group_members',
+    'chat_groups', 'friends', 'places', 'cities', 'users',
+]
+
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farah', 'Gus', 'Hana', 'Ivan', 'Jia',
+               'Kofi', 'Lena', 'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sami', 'Tomas']
+LAST_NAMES = ['Alvarez', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito',
+              'Johnson', 'Kim', 'Lopez', 'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Smith']
+PLACE_WORDS = ['Old', 'Royal', 'Grand', 'Little', 'Blue', 'Golden', 'Harbour', 'Garden', 'River',
+               'Hill', 'Market', 'Tower', 'Bridge', 'Square', 'Palace', 'Gallery', 'Corner', 'House']
+CITY_WORDS = ['San', 'Port', 'New', 'Lake', 'North', 'South', 'Saint', 'Fort', 'East', 'West']
+CITY_ROOTS = ['haven', 'ford', 'burg', 'ton', 'mouth', 'field', 'stad', 'polis', 'vale', 'bay']
+MESSAGE_WORDS = ['flight', 'hotel', 'dinner', 'tomorrow', 'tickets', 'museum', 'beach', 'train',
+                 'meet', 'lobby', 'booked', 'sounds', 'great', 'late', 'early', 'price', 'plan']
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(conn, table, columns, rows, batch_size):
+    cursor = conn.cursor()
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    count = 0
+    started = time.perf_counter()
+    for batch in batched(rows, batch_size):
+        cursor.executemany(query, batch)
+        conn.commit()
+        count += len(batch)
+    cursor.close()
+    print(f"  {table:<20} {count:>10} rows  {time.perf_counter() - started:6.1f}s")
+
+
+def users(layout, rng):
+    for user_id in range(1, layout.users + 1):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        username = layout.username(user_id)
+        yield (user_id, first, last, username, f"{username}@example.com", 'password')
+
+
+def friends(layout):
+    row_id = 0
+    for user_id in range(1, layout.users + 1):
+        for friend_id in layout.friend_ids(user_id):
+            row_id += 1
+            yield (row_id, user_id, friend_id, 'accepted')
+        pending = layout.pending_from(user_id)
+        if pending not in layout.friend_ids(user_id) and user_id not in layout.friend_ids(pending):
+            row_id += 1
+            yield (row_id, pending, user_id, 'pending')
+
+
+def cities(layout, rng):
+    for city_id in range(1, layout.cities + 1):
+        yield (city_id, f"{rng.choice(CITY_WORDS)} {rng.choice(CITY_ROOTS).title()} {city_id}")
+
+
+def places(layout, rng):
+    place_id = 0
+    for city_id in range(1, layout.cities + 1):
+        for _ in range(layout.places_per_city):
+            place_id += 1
+            name = f"{rng.choice(PLACE_WORDS)} {rng.choice(PLACE_WORDS)} {place_id}"
+            category = CATEGORIES[place_id % len(CATEGORIES)]
+            yield (place_id, name, category, city_id,
+                   f"https://images.example.com/places/{place_id}.jpg",
+                   f"{rng.randint(1, 999)} {rng.choice(PLACE_WORDS)} Street")
+
+
+def chat_groups(layout):
+    for group_id in range(1, layout.groups + 1):
+        yield (group_id, f"Trip {group_id}", layout.group_creator(group_id))
+
+
+def group_members(layout):
+    for group_id in range(1, layout.groups + 1):
+        for user_id in layout.group_member_ids(group_id):
+            yield (group_id, layout.username(user_id))
+
+
+def messages(layout, rng, now):
+    message_id = 0
+    for group_id in range(1, layout.groups + 1):
+        members = layout.group_member_ids(group_id)
+        # Spread each group's history over the last year, oldest first
+        at = now - timedelta(days=365)
+        step = timedelta(days=365) / layout.messages_per_group
+        for _ in range(layout.messages_per_group):
+            message_id += 1
+            at += step
+            text = ' '.join(rng.choices(MESSAGE_WORDS, k=rng.randint(3, 14)))
+            yield (message_id, group_id, layout.username(rng.choice(members)), text, at)
+
+
+def calendar_events(layout, rng, now):
+    event_id = 0
+    for group_id in range(1, layout.groups + 1):
+        members = layout.group_member_ids(group_id)
+        for _ in range(layout.events_per_group):
+            event_id += 1
+            start = now + timedelta(days=rng.randint(-60, 60), hours=rng.randint(8, 20))
+            end = start + timedelta(days=rng.choice([0, 0, 0, 1, 3, 7]), hours=2)
+            place_id = rng.randint(1, layout.places)
+            yield (event_id, f"Plan {event_id}", 'Generated event', start, end, None,
+                   place_id, group_id, rng.choice(members))
+
+
+def event_participants(layout, rng):
+    event_id = 0
+    for group_id in range(1, layout.groups + 1):
+        members = layout.group_member_ids(group_id)
+        for _ in range(layout.events_per_group):
+            event_id += 1
+            for user_id in rng.sample(members, k=min(3, len(members))):
+                yield (event_id, user_id, rng.choice(['attending', 'maybe', 'declined']))
+
+
+def generate(conn, layout, seed, batch_size):
+    rng = random.Random(seed)
+    now = datetime(2025, 6, 1, 12, 0, 0)
+
+    insert(conn, 'users', ['user_id', 'first_name', 'last_name', 'username', 'email', 'password'],
+           users(layout, rng), batch_size)
+    insert(conn, 'friends', ['id', 'user_id', 'friend_id', 'status'], friends(layout), batch_size)
+    insert(conn, 'cities', ['id', 'city_name'], cities(layout, rng), batch_size)
+    insert(conn, 'places', ['id', 'name', 'category', 'city_id', 'image_url', 'address'],
+           places(layout, rng), batch_size)
+    insert(conn, 'chat_groups', ['id', 'name', 'created_by'], chat_groups(layout), batch_size)
+    insert(conn, 'group_members', ['group_id', 'username'], group_members(layout), batch_size)
+    insert(conn, 'messages', ['id', 'group_id', 'sender', 'message', 'created_at'],
+           messages(layout, rng, now), batch_size)
+    insert(conn, 'calendar_events',
+           ['event_id', 'title', 'description', 'start_date', 'end_date', 'location',
+            'place_id', 'group_id', 'created_by'],
+           calendar_events(layout, rng, now), batch_size)
+    insert(conn, 'event_participants', ['event_id', 'user_id', 'status'],
+           event_participants(layout, rng), batch_size)
+
+
+def truncate(conn):
+    cursor = conn.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    conn.commit()
+    cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=100000, help='approximate rows in the largest table')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--truncate', action='store_true', help='empty the tables first')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--database', default='tripsync')
+    args = parser.parse_args(argv)
+
+    layout = Layout.from_scale(args.scale)
+    print(f"Generating {layout}")
+    conn = mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                   database=args.database)
+    try:
+        if args.truncate:
+            truncate(conn)
+        generate(conn, layout, args.seed, args.batch_size)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Replay a realistic mix of TripSync API calls and report latency per route.
+
+    python -m bench.loadtest --base-url http://localhost:5000 --scale 100000 \
+        --concurrency 32 --duration 60
+
+Use the same ``--scale`` and ``--seed`` as bench.generate so every request
+targets rows that exist. Works against the Flask app and the ASGI mode alike.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from bench.dataset import CATEGORIES, Layout
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Weighted mix of endpoint calls, each returning (route, method, path, body)."""
+
+    def __init__(self, layout, rng):
+        self.layout = layout
+        self.rng = rng
+        self.mix = [
+            (20, self.group_messages),
+            (10, self.send_message),
+            (10, self.get_groups),
+            (8, self.friends),
+            (6, self.group_members),
+            (6, self.friend_requests),
+            (6, self.user_search),
+            (8, self.places),
+            (4, self.places_search),
+            (3, self.top_cities),
+            (3, self.top_places),
+            (3, self.categories),
+            (5, self.place_details),
+            (6, self.calendar_events),
+            (2, self.event_participants),
+        ]
+        self._weights = [weight for weight, _ in self.mix]
+
+    def next(self):
+        _, make = self.rng.choices(self.mix, weights=self._weights)[0]
+        return make()
+
+    def _user(self):
+        return self.rng.randint(1, self.layout.users)
+
+    def _member(self):
+        group_id = self.rng.randint(1, self.layout.groups)
+        return group_id, self.rng.choice(self.layout.group_member_ids(group_id))
+
+    def group_messages(self):
+        group_id, user_id = self._member()
+        query = urlencode({'user_id': user_id, 'limit': 50})
+        return 'GET /api/group_messages/<id>', 'GET', f"/api/group_messages/{group_id}?{query}", None
+
+    def send_message(self):
+        group_id, user_id = self._member()
+        body = {'group_id': group_id, 'sender': self.layout.username(user_id),
+                'message': f"load test message {self.rng.random():.6f}"}
+        return 'POST /api/send_message', 'POST', '/api/send_message', body
+
+    def get_groups(self):
+        return 'GET /api/get_groups', 'GET', f"/api/get_groups?user_id={self._user()}", None
+
+    def friends(self):
+        return 'GET /api/friends/<id>', 'GET', f"/api/friends/{self._user()}", None
+
+    def group_members(self):
+        group_id = self.rng.randint(1, self.layout.groups)
+        return 'GET /api/group_members/<id>', 'GET', f"/api/group_members/{group_id}", None
+
+    def friend_requests(self):
+        return 'GET /api/friend_requests/<id>', 'GET', f"/api/friend_requests/{self._user()}", None
+
+    def user_search(self):
+        term = self.layout.username(self._user())[:self.rng.randint(3, 6)]
+        query = urlencode({'search': term, 'current_user_id': self._user()})
+        return 'GET /api/users?search', 'GET', f"/api/users?{query}", None
+
+    def places(self):
+        params = {'page': self.rng.randint(1, 50), 'per_page': 12}
+        if self.rng.random() < 0.5:
+            params['category'] = self.rng.choice(CATEGORIES)
+        return 'GET /api/places', 'GET', f"/api/places?{urlencode(params)}", None
+
+    def places_search(self):
+        term = self.rng.choice(['tower', 'garden', 'royal', 'markt', 'palce', 'harbour', 'old'])
+        return 'GET /api/places?search', 'GET', f"/api/places?{urlencode({'search': term})}", None
+
+    def top_cities(self):
+        return 'GET /api/top-cities', 'GET', '/api/top-cities', None
+
+    def top_places(self):
+        return 'GET /api/top-places', 'GET', '/api/top-places', None
+
+    def categories(self):
+        return 'GET /api/categories', 'GET', '/api/categories', None
+
+    def place_details(self):
+        place_id = self.rng.randint(1, self.layout.places)
+        return 'GET /api/place/<id>', 'GET', f"/api/place/{place_id}", None
+
+    def calendar_events(self):
+        query = urlencode({'user_id': self._user(), 'start_date': '2025-05-01', 'end_date': '2025-05-31'})
+        return 'GET /api/calendar/events', 'GET', f"/api/calendar/events?{query}", None
+
+    def event_participants(self):
+        event_id = self.rng.randint(1, self.layout.events)
+        return ('GET /api/calendar/events/<id>/participants', 'GET',
+                f"/api/calendar/events/{event_id}/participants", None)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+def call(base_url, method, path, body, timeout):
+    data = None
+    headers = {}
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers['Content-Type'] = 'application/json'
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status < 400
+    except urllib.error.HTTPError as err:
+        err.read()
+        return False
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def worker(base_url, workload, recorder, deadline, timeout):
+    while time.monotonic() < deadline:
+        route, method, path, body = workload.next()
+        started = time.perf_counter()
+        ok = call(base_url, method, path, body, timeout)
+        recorder.record(route, time.perf_counter() - started, ok)
+
+
+def report(recorder, elapsed):
+    rows = []
+    for route in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[route])
+        rows.append({
+            'route': route,
+            'requests': len(values),
+            'errors': recorder.errors[route],
+            'rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        })
+    return rows
+
+
+def print_report(rows, elapsed):
+    total = sum(row['requests'] for row in rows)
+    errors = sum(row['errors'] for row in rows)
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), {errors} errors\n")
+    print(f"{'route':<46}{'reqs':>8}{'errs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(f"{row['route']:<46}{row['requests']:>8}{row['errors']:>7}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--scale', type=int, default=100000, help='scale the dataset was generated with')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to run')
+    parser.add_argument('--timeout', type=float, default=10.0, help='per-request timeout in seconds')
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    args = parser.parse_args(argv)
+
+    layout = Layout.from_scale(args.scale)
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(args.base_url.rstrip('/'), Workload(layout, random.Random(args.seed + n)),
+                  recorder, deadline, args.timeout),
+            daemon=True,
+        )
+        for n in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.monotonic() - started
+    rows = report(recorder, elapsed)
+    print_report(rows, elapsed)
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump({'elapsed': elapsed, 'concurrency': args.concurrency, 'routes': rows}, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Pub/sub fan-out for pushing chat events to streaming subscribers.
+
+The broker keeps one bounded queue per subscriber. A subscriber whose queue
+fills up is evicted rather than allowed to stall publishers; it is expected to
+reconnect and catch up from the database.
+
+Cross-process delivery goes through a backend. ``LocalBackend`` loops
+messages straight back into the same process; ``RedisBackend`` relays them
+through Redis pub/sub so every worker sees every publish. The backend starts
+with the first subscribe or publish in each process, so a server that imports
+the app before forking gives every worker its own listener. When the Redis
+connection drops it reconnects with backoff and resubscribes; publishes made
+while it was down are lost, so every local subscriber is evicted to catch up.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+
+try:
+    import redis
+except ImportError:  # optional, only needed for multi-worker deployments
+    redis = None
+
+_EVICTED = object()
+
+
+class SubscriptionClosed(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def _offer(self, message):
+        if self.closed:
+            return True
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def _evict(self):
+        self.closed = True
+        # Make room for the marker so a blocked get() wakes up immediately
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self._queue.put_nowait(_EVICTED)
+        except queue.Full:
+            pass
+
+    def get(self, timeout=None):
+        """Return the next message, or None if nothing arrived within timeout."""
+        if self.closed and self._queue.empty():
+            raise SubscriptionClosed(self.channel)
+        try:
+            message = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if message is _EVICTED:
+            raise SubscriptionClosed(self.channel)
+        return message
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class AsyncSubscription:
+    """Subscription consumed from an asyncio event loop instead of a thread."""
+
+    def __init__(self, broker, channel, maxsize, loop):
+        self.broker = broker
+        self.channel = channel
+        self.maxsize = maxsize
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _offer(self, message):
+        if self.closed:
+            return True
+        with self._lock:
+            if self._pending >= self.maxsize:
+                return False
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        return True
+
+    def _evict(self):
+        self.closed = True
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _EVICTED)
+
+    async def get(self, timeout=None):
+        """Return the next message, or None if nothing arrived within timeout."""
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if message is _EVICTED:
+            raise SubscriptionClosed(self.channel)
+        with self._lock:
+            self._pending -= 1
+        return message
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class LocalBackend:
+    """Single-process backend: publishes are delivered in-process only."""
+
+    def start(self, deliver, resync=None):
+        self._deliver = deliver
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def close(self):
+        pass
+
+
+class RedisBackend:
+    """Relays publishes through Redis so all worker processes receive them."""
+
+    def __init__(self, url, prefix='tripsync:', min_backoff=0.5, max_backoff=30.0):
+        if redis is None:
+            raise RuntimeError("RedisBackend requires the 'redis' package")
+        self.prefix = prefix
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread = None
+        self._closed = threading.Event()
+        self.reconnects = 0
+
+    def start(self, deliver, resync=None):
+        self._thread = threading.Thread(target=self._run, args=(deliver, resync), name='broker-redis', daemon=True)
+        self._thread.start()
+
+    def _run(self, deliver, resync):
+        backoff = self.min_backoff
+        connected_before = False
+        while not self._closed.is_set():
+            try:
+                self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.psubscribe(self.prefix + '*')
+                if connected_before:
+                    self.reconnects += 1
+                    # Anything published while the connection was down never reached us
+                    if resync is not None:
+                        resync()
+                connected_before = True
+                backoff = self.min_backoff
+                for item in self._pubsub.listen():
+                    channel = item['channel'].decode()[len(self.prefix):]
+                    deliver(channel, json.loads(item['data']))
+            except (redis.ConnectionError, redis.TimeoutError, OSError) as err:
+                if self._closed.is_set():
+                    break
+                print(f"Redis broker connection lost, retrying in {backoff:.1f}s:", err)
+            finally:
+                self._close_pubsub()
+            # Also covers listen() returning after the server closed the connection
+            if self._closed.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _close_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, json.dumps(message, default=str))
+
+    def close(self):
+        self._closed.set()
+        self._close_pubsub()
+
+
+class Broker:
+    def __init__(self, backend=None, queue_size=256):
+        self.backend = backend or LocalBackend()
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._published = 0
+        self._evictions = 0
+        self._pid = None
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self.backend.start(self._deliver, self._evict_all)
+                self._pid = pid
+
+    def subscribe(self, channel):
+        self._ensure_started()
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def subscribe_async(self, channel):
+        """Subscribe from a coroutine running on the current event loop."""
+        self._ensure_started()
+        subscription = AsyncSubscription(self, channel, self.queue_size, asyncio.get_running_loop())
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, message):
+        self._ensure_started()
+        self.backend.publish(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            self._published += 1
+            subscribers = list(self._channels.get(channel, ()))
+
+        slow = [sub for sub in subscribers if not sub._offer(message)]
+        for subscription in slow:
+            subscription._evict()
+            self.unsubscribe(subscription)
+        if slow:
+            with self._lock:
+                self._evictions += len(slow)
+
+    def _evict_all(self):
+        """Drop every subscriber so it reconnects and catches up from the database."""
+        with self._lock:
+            subscribers = [sub for subs in self._channels.values() for sub in subs]
+            self._channels.clear()
+            self._evictions += len(subscribers)
+        for subscription in subscribers:
+            subscription._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscribers': sum(len(subs) for subs in self._channels.values()),
+                'published': self._published,
+                'evictions': self._evictions,
+            }
+
+    def close(self):
+        self.backend.close()
+
+
+def create_broker(url=None, queue_size=256):
+    """Build a broker from a URL: empty for in-process, redis://... for Redis."""
+    if url and url.startswith(('redis://', 'rediss://')):
+        return Broker(RedisBackend(url), queue_size=queue_size)
+    return Broker(queue_size=queue_size)
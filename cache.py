@@ -0,0 +1,165 @@
+"""Caches shared by the API endpoints."""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from serialization import JSON_MIMETYPE, negotiated_mimetype
+
+try:
+    import redis
+except ImportError:  # optional, only needed for a shared cache
+    redis = None
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RedisCache:
+    """Shared cache backend with the same get/set/clear surface as TTLCache."""
+
+    def __init__(self, url, ttl=60.0, prefix='tripsync:cache:'):
+        if redis is None:
+            raise RuntimeError("RedisCache requires the 'redis' package")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key, default=None):
+        raw = self._client.get(self.prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        expires = max(1, int(self.ttl if ttl is None else ttl))
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=expires)
+
+    def incr(self, key):
+        return self._client.incr(self.prefix + key)
+
+    def counter(self, key):
+        """Current value of a key maintained with incr() (stored as a raw integer, not pickled)."""
+        raw = self._client.get(self.prefix + key)
+        return 0 if raw is None else int(raw)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class ResponseCache:
+    """Read-through cache of rendered JSON responses with strong ETags.
+
+    Entries are grouped under tags; invalidating a tag bumps its generation so
+    every key built from the old generation is simply never read again.
+    """
+
+    def __init__(self, backend, max_age=0):
+        self.backend = backend
+        # Browsers and CDNs may reuse a response for this long without revalidating
+        self.max_age = max_age
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def _generation(self, tag):
+        if isinstance(self.backend, RedisCache):
+            return self.backend.counter(f"gen:{tag}")
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def invalidate(self, tag):
+        if isinstance(self.backend, RedisCache):
+            self.backend.incr(f"gen:{tag}")
+            return
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def _respond(self, body, etag, mimetype=JSON_MIMETYPE):
+        response = Response(body, mimetype=mimetype)
+        response.vary.add('Accept')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        if not self.max_age:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def cached(self, tag):
+        """Decorate a GET view whose JSON output only changes when ``tag`` is invalidated."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # JSON and MessagePack renderings of the same URL are cached separately
+                key = f"{tag}:{self._generation(tag)}:{negotiated_mimetype()}:{request.full_path}"
+                entry = self.backend.get(key)
+                if entry is not None:
+                    return self._respond(*entry)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha256(body).hexdigest()[:32]
+                self.backend.set(key, (body, etag, response.mimetype))
+                return self._respond(body, etag, response.mimetype)
+            return wrapper
+        return decorator
+
+
+def create_backend(url=None, maxsize=1024, ttl=60.0):
+    """Build a cache backend: in-process LRU by default, redis://... for a shared store."""
+    if url and url.startswith(('redis://', 'rediss://')):
+        return RedisCache(url, ttl=ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
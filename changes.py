@@ -0,0 +1,126 @@
+"""Append-only change log behind the delta-sync endpoint.
+
+Every write that affects what a client keeps locally (groups, memberships,
+friendships and requests, calendar events) appends a row to ``change_log`` in
+the same transaction. A row reaches either the current members of
+``group_id``, or ``user_id`` directly, or both. Clients hold the id of the
+last row they have seen and ask only for rows after it.
+"""
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+GROUP = 'group'
+MEMBER = 'member'            # entity_id is the member's user_id, group_id the group
+FRIENDSHIP = 'friendship'    # entity_id is the friends row id (requests and friendships)
+EVENT = 'event'
+
+# Auto-increment ids are assigned at insert time, not at commit, so a slower
+# transaction can commit a lower id after a higher one was read. Tokens only
+# advance past rows older than this, and newer rows are sent again next time.
+SETTLE_SECONDS = 5
+
+
+class ResyncRequired(Exception):
+    """The token is older than the retained log; the client must take a full snapshot."""
+
+
+def record_changes(cursor, changes):
+    """Append (entity, entity_id, op, group_id, user_id) rows; the caller commits."""
+    changes = list(changes)
+    if changes:
+        cursor.executemany(
+            "INSERT INTO change_log (entity, entity_id, op, group_id, user_id) VALUES (%s, %s, %s, %s, %s)",
+            changes,
+        )
+
+
+def record_change(cursor, entity, entity_id, op=UPSERT, group_id=None, user_id=None):
+    record_changes(cursor, [(entity, entity_id, op, group_id, user_id)])
+
+
+def encode_token(change_id):
+    return encode_cursor({'change': change_id})
+
+
+def decode_token(token):
+    try:
+        return int(decode_cursor(token)['change'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursor(f"Invalid sync token: {token!r}")
+
+
+def snapshot_token(cursor):
+    """Token for a full snapshot taken now: the newest row older than the settle window."""
+    cursor.execute(
+        "SELECT id FROM change_log WHERE created_at < NOW() - INTERVAL %s SECOND ORDER BY created_at DESC LIMIT 1",
+        (SETTLE_SECONDS,),
+    )
+    rows = cursor.fetchall()
+    return encode_token(rows[0]['id'] if rows else 0)
+
+
+def changes_since(cursor, since, user_id, username, limit):
+    """Rows after ``since`` visible to the user, oldest first, plus whether more remain.
+
+    ``cursor`` must be a dictionary cursor.
+    """
+    cursor.execute("SELECT MIN(id) AS floor FROM change_log")
+    floor = cursor.fetchall()[0]['floor']
+    if floor is not None and since < floor - 1:
+        raise ResyncRequired(f"Changes before {floor} are no longer retained")
+
+    # Two index range reads, (user_id, id) and (group_id, id), instead of one OR scan
+    cursor.execute("""
+    (SELECT id, entity, entity_id, op, group_id, user_id,
+            created_at < NOW(3) - INTERVAL %s SECOND AS settled
+     FROM change_log
+     WHERE user_id = %s AND id > %s
+     ORDER BY id LIMIT %s)
+    UNION
+    (SELECT cl.id, cl.entity, cl.entity_id, cl.op, cl.group_id, cl.user_id,
+            cl.created_at < NOW(3) - INTERVAL %s SECOND AS settled
+     FROM group_members gm
+     JOIN change_log cl ON cl.group_id = gm.group_id AND cl.id > %s
+     WHERE gm.username = %s
+     ORDER BY cl.id LIMIT %s)
+    ORDER BY id
+    LIMIT %s
+    """, (SETTLE_SECONDS, user_id, since, limit + 1,
+          SETTLE_SECONDS, since, username, limit + 1,
+          limit + 1))
+    rows = cursor.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def next_token(since, rows):
+    """Advance over the settled prefix of ``rows``; returns (token id, whether all rows settled)."""
+    token = since
+    for row in rows:
+        if not row['settled']:
+            return token, False
+        token = row['id']
+    return token, True
+
+
+def latest(rows):
+    """Collapse rows to the last op per entity: {(entity, group_id, entity_id): op}."""
+    ops = {}
+    for row in rows:
+        key = (row['entity'], row['group_id'] if row['entity'] == MEMBER else None, row['entity_id'])
+        ops.pop(key, None)
+        ops[key] = row['op']
+    return ops
+
+
+def prune(cursor, older_than_days, limit=None):
+    """Drop rows older than the retention period (at most ``limit``), always keeping the newest one."""
+    cursor.execute(f"""
+    DELETE FROM change_log
+    WHERE created_at < NOW() - INTERVAL %s DAY
+      AND id < (SELECT head FROM (SELECT MAX(id) AS head FROM change_log) AS newest)
+    {"ORDER BY id LIMIT %s" if limit else ""}
+    """, (older_than_days, limit) if limit else (older_than_days,))
+    return cursor.rowcount
+
@@ -0,0 +1,268 @@
+"""Shared MySQL access layer for the TripSync API.
+
+Connections are borrowed from a bounded, process-wide pool instead of being
+opened per request. Closing a borrowed connection hands it back to the pool.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+
+class PoolTimeout(errors.PoolError):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+# Instrumentation hooks, installed by metrics.init_app():
+#   on_checkout(wait_seconds) after a connection is borrowed
+#   on_query(statement, params, seconds) after every cursor execute
+_observers = {'on_checkout': None, 'on_query': None}
+
+
+def set_observers(on_checkout=None, on_query=None):
+    _observers['on_checkout'] = on_checkout
+    _observers['on_query'] = on_query
+
+
+class InstrumentedCursor:
+    """Cursor proxy that reports each statement and its duration."""
+
+    def __init__(self, raw, on_query):
+        self._raw = raw
+        self._on_query = on_query
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def _timed(self, method, operation, params):
+        started = time.perf_counter()
+        try:
+            return method(operation, params)
+        finally:
+            self._on_query(operation, params, time.perf_counter() - started)
+
+    def execute(self, operation, params=None):
+        return self._timed(self._raw.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        return self._timed(self._raw.executemany, operation, seq_params)
+
+
+class PooledConnection:
+    """Thin proxy around a raw connection; close() returns it to the pool."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        on_query = _observers['on_query']
+        return InstrumentedCursor(cursor, on_query) if on_query else cursor
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw)
+
+
+class ConnectionPool:
+    def __init__(self, config, size=10, timeout=5.0, ping_after=30.0):
+        self.config = dict(config)
+        self.size = size
+        self.timeout = timeout
+        # Connections idle for longer than this are pinged before reuse
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw_connection, last_used_monotonic)
+        self._open = 0
+        self._waiters = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._health_failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def _healthy(self, raw, last_used):
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except errors.Error:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except errors.Error:
+            pass
+
+    def get_connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            raw = None
+            last_used = None
+            create = False
+            with self._cond:
+                self._waiters += 1
+                try:
+                    while not self._idle and self._open >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(
+                                f"No database connection available within {timeout}s "
+                                f"(pool size {self.size})"
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                else:
+                    self._open += 1
+                    create = True
+
+            if create:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(raw, last_used):
+                # Drop the stale connection and try again with the same deadline
+                self._discard(raw)
+                with self._cond:
+                    self._open -= 1
+                    self._health_failures += 1
+                    self._cond.notify()
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            on_checkout = _observers['on_checkout']
+            if on_checkout:
+                on_checkout(waited)
+            return PooledConnection(self, raw)
+
+    def _release(self, raw):
+        try:
+            if raw.unread_result:
+                raw.consume_results()
+            # Never hand an open transaction to the next borrower
+            if raw.in_transaction:
+                raw.rollback()
+            reusable = True
+        except errors.Error:
+            reusable = False
+
+        with self._cond:
+            if reusable:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+        if not reusable:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': idle,
+                'in_use': self._open - idle,
+                'waiters': self._waiters,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'health_check_failures': self._health_failures,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool = None
+
+
+def init_pool(config, **options):
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+    _pool = ConnectionPool(config, **options)
+    return _pool
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database pool has not been initialised; call db.init_pool() first")
+    return _pool
+
+
+def get_connection(timeout=None):
+    return get_pool().get_connection(timeout)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+@contextmanager
+def connection():
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(dictionary=False):
+    """Yield a cursor whose statements commit together, or roll back on error."""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=dictionary)
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
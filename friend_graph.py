@@ -0,0 +1,230 @@
+"""In-memory adjacency index of the ``friends`` table.
+
+Each user has three sorted int arrays: accepted friends, users they sent a
+pending request to, and users they received one from. A friendship status is
+a binary search in one of them, and friend-of-friend suggestions are counted
+from the arrays alone.
+
+The index is loaded once and then kept current from the change log: every
+write to ``friends`` records a friendship change for both ends, so the index
+re-reads just the pairs named by changes it has not seen. Re-reading a pair
+is idempotent, which lets the high-water mark trail by the change log's
+settle window without missing late commits.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+import changes
+
+FRIENDS = 'friends'
+REQUEST_SENT = 'request_sent'
+REQUEST_RECEIVED = 'request_received'
+NONE = 'none'
+
+# Reads the whole table, once per process; migrations.plans allows that scan
+LOAD_STATEMENT = "SELECT user_id, friend_id, status FROM friends"
+
+_EMPTY = array('i')
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _with(ids, value):
+    index = bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        return ids
+    # Arrays are replaced rather than changed in place, so readers never see one mid-update
+    return ids[:index] + array('i', [value]) + ids[index:]
+
+
+def _without(ids, value):
+    index = bisect_left(ids, value)
+    if index == len(ids) or ids[index] != value:
+        return ids
+    return ids[:index] + ids[index + 1:]
+
+
+class FriendGraph:
+    def __init__(self, refresh_interval=2.0, max_scan=5000):
+        self.refresh_interval = refresh_interval
+        # Friend-of-friend counting stops after this many second-degree entries
+        self.max_scan = max_scan
+        self._friends = {}
+        self._sent = {}
+        self._received = {}
+        self._change_id = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._reloads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def friends(self, user_id):
+        """Sorted ids of the user's accepted friends."""
+        return self._friends.get(user_id, _EMPTY)
+
+    def status(self, user_id, other_id):
+        """'friends', 'request_sent', 'request_received' or 'none', as seen from user_id."""
+        if _contains(self._friends.get(user_id, _EMPTY), other_id):
+            return FRIENDS
+        if _contains(self._sent.get(user_id, _EMPTY), other_id):
+            return REQUEST_SENT
+        if _contains(self._received.get(user_id, _EMPTY), other_id):
+            return REQUEST_RECEIVED
+        return NONE
+
+    def suggest(self, user_id, limit=10):
+        """[(user_id, mutual friend count)] of friends-of-friends, most mutual friends first.
+
+        Users already friends with user_id or with a request pending either way
+        are left out.
+        """
+        mine = self._friends.get(user_id, _EMPTY)
+        sent = self._sent.get(user_id, _EMPTY)
+        received = self._received.get(user_id, _EMPTY)
+        mutual = defaultdict(int)
+        scanned = 0
+        for friend_id in mine:
+            theirs = self._friends.get(friend_id, _EMPTY)
+            for candidate in theirs:
+                mutual[candidate] += 1
+            scanned += len(theirs)
+            if scanned >= self.max_scan:
+                break
+
+        mutual.pop(user_id, None)
+        ranked = (
+            (-count, candidate) for candidate, count in mutual.items()
+            if not (_contains(mine, candidate) or _contains(sent, candidate) or _contains(received, candidate))
+        )
+        return [(candidate, -count) for count, candidate in heapq.nsmallest(limit, ranked)]
+
+    def stats(self):
+        return {
+            'users': len(self._friends),
+            'friendships': sum(len(ids) for ids in list(self._friends.values())) // 2,
+            'pending_requests': sum(len(ids) for ids in list(self._sent.values())),
+            'change_id': self._change_id,
+            'reloads': self._reloads,
+        }
+
+    def ensure_fresh(self, cursor):
+        """Load the graph on first use, then apply newer friendship changes every refresh interval.
+
+        ``cursor`` must be a dictionary cursor.
+        """
+        now = time.monotonic()
+        if self._loaded and now - self._last_refresh < self.refresh_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._last_refresh < self.refresh_interval:
+                return
+            if not self._loaded or not self._apply_changes(cursor):
+                self._load(cursor)
+            self._loaded = True
+            self._last_refresh = time.monotonic()
+
+    def refresh_pair(self, cursor, user_id, friend_id):
+        """Re-read the friendship between two users after this process wrote it."""
+        if self._loaded:
+            with self._lock:
+                self._refresh_pairs(cursor, {(int(user_id), int(friend_id))})
+
+    def _load(self, cursor):
+        # Taken first: changes committed while the table is read are applied again afterwards
+        change_id = changes.decode_token(changes.snapshot_token(cursor))
+        friends = defaultdict(list)
+        sent = defaultdict(list)
+        received = defaultdict(list)
+        cursor.execute(LOAD_STATEMENT)
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                user_id, friend_id = row['user_id'], row['friend_id']
+                if row['status'] == 'accepted':
+                    friends[user_id].append(friend_id)
+                    friends[friend_id].append(user_id)
+                elif row['status'] == 'pending':
+                    sent[user_id].append(friend_id)
+                    received[friend_id].append(user_id)
+
+        def pack(lists):
+            return {user_id: array('i', sorted(set(ids))) for user_id, ids in lists.items()}
+
+        self._friends, self._sent, self._received = pack(friends), pack(sent), pack(received)
+        self._change_id = change_id
+        self._reloads += 1
+
+    def _apply_changes(self, cursor):
+        """Re-read the pairs changed since the high-water mark; False when the log no longer reaches back."""
+        cursor.execute("SELECT MIN(id) AS floor FROM change_log")
+        floor = cursor.fetchall()[0]['floor']
+        if floor is not None and self._change_id < floor - 1:
+            return False
+
+        cursor.execute("""
+        SELECT id, entity_id, user_id, created_at < NOW(3) - INTERVAL %s SECOND AS settled
+        FROM change_log
+        WHERE id > %s AND entity = %s
+        ORDER BY id
+        """, (changes.SETTLE_SECONDS, self._change_id, changes.FRIENDSHIP))
+        rows = cursor.fetchall()
+        # Each friends row is logged once per end
+        ends = defaultdict(set)
+        for row in rows:
+            ends[row['entity_id']].add(row['user_id'])
+        pairs = {tuple(sorted(users)) for users in ends.values() if len(users) == 2}
+        if pairs:
+            self._refresh_pairs(cursor, pairs)
+        self._change_id, _ = changes.next_token(self._change_id, rows)
+        return True
+
+    def _refresh_pairs(self, cursor, pairs):
+        pairs = list(pairs)
+        cursor.execute(f"""
+        SELECT user_id, friend_id, status FROM friends
+        WHERE (user_id, friend_id) IN ({', '.join(['(%s, %s)'] * len(pairs) * 2)})
+        """, [value for a, b in pairs for value in (a, b, b, a)])
+        rows = {}
+        for row in cursor.fetchall():
+            key = (min(row['user_id'], row['friend_id']), max(row['user_id'], row['friend_id']))
+            # An accepted row wins over a pending one in the other direction
+            if key not in rows or row['status'] == 'accepted':
+                rows[key] = row
+
+        for a, b in pairs:
+            key = (min(a, b), max(a, b))
+            self._unlink(a, b)
+            row = rows.get(key)
+            if row is None:
+                continue
+            if row['status'] == 'accepted':
+                self._friends[a] = _with(self._friends.get(a, _EMPTY), b)
+                self._friends[b] = _with(self._friends.get(b, _EMPTY), a)
+            elif row['status'] == 'pending':
+                sender, recipient = row['user_id'], row['friend_id']
+                self._sent[sender] = _with(self._sent.get(sender, _EMPTY), recipient)
+                self._received[recipient] = _with(self._received.get(recipient, _EMPTY), sender)
+
+    def _unlink(self, a, b):
+        for adjacency in (self._friends, self._sent, self._received):
+            for user_id, other_id in ((a, b), (b, a)):
+                ids = adjacency.get(user_id)
+                if ids is not None:
+                    ids = _without(ids, other_id)
+                    if ids:
+                        adjacency[user_id] = ids
+                    else:
+                        del adjacency[user_id]
@@ -0,0 +1,86 @@
+"""Incremental iCalendar (RFC 5545) rendering for calendar subscriptions.
+
+``render_calendar`` yields the feed one line at a time from any iterable of
+event rows, so a large calendar can be streamed straight from a database
+cursor without collecting it first.
+"""
+from datetime import datetime, timezone
+
+PRODID = '-//TripSync//Calendar//EN'
+MAX_LINE_OCTETS = 75
+
+
+def escape_text(value):
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\r\n', '\\n')
+            .replace('\n', '\\n'))
+
+
+def format_datetime(value):
+    # Event times are stored without a zone, so they are exported as floating local times
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def fold(line):
+    """Split a content line into CRLF-terminated chunks of at most 75 octets."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+    chunks = []
+    limit = MAX_LINE_OCTETS
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split inside a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = MAX_LINE_OCTETS - 1  # continuation lines start with a space
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def event_location(event):
+    if event.get('location'):
+        return event['location']
+    parts = [event.get('place_name'), event.get('place_address'), event.get('city_name')]
+    return ', '.join(part for part in parts if part)
+
+
+def render_event(event, stamp, host):
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{event['event_id']}@{host}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{format_datetime(event['start_date'])}",
+    ]
+    if event.get('end_date'):
+        lines.append(f"DTEND:{format_datetime(event['end_date'])}")
+    lines.append(f"SUMMARY:{escape_text(event['title'])}")
+    if event.get('description'):
+        lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+    location = event_location(event)
+    if location:
+        lines.append(f"LOCATION:{escape_text(location)}")
+    if event.get('group_name'):
+        lines.append(f"CATEGORIES:{escape_text(event['group_name'])}")
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def render_calendar(events, name, host='tripsync'):
+    """Yield the text of a VCALENDAR containing ``events`` (dicts with calendar_events columns)."""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f"PRODID:{PRODID}",
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ])
+    for event in events:
+        yield render_event(event, stamp, host)
+    yield fold('END:VCALENDAR')
@@ -0,0 +1,103 @@
+"""Cached user_id -> username and group membership lookups.
+
+Nearly every endpoint starts by resolving the caller's username and checking
+that they belong to a group. Results are kept in a bounded process-wide cache
+and memoised on ``flask.g`` so a request never repeats the same lookup; the
+caller's own username comes from their verified session token when they sent one.
+Membership is cached as the whole member set of a group, which lets writers
+invalidate a group with a single key. With a shared backend (Redis) each group
+also has a generation there: invalidating bumps it, and every worker drops a
+member set cached under an older generation, so a removed member loses access
+everywhere at once rather than when each worker's entry expires.
+"""
+from flask import g, has_request_context
+
+from cache import TTLCache
+
+_MISSING = object()
+
+
+class IdentityCache:
+    def __init__(self, maxsize=10000, username_ttl=3600.0, membership_ttl=30.0, shared=None):
+        self.usernames = TTLCache(maxsize=maxsize, ttl=username_ttl)
+        self.members = TTLCache(maxsize=maxsize, ttl=membership_ttl)  # group_id -> (generation, members)
+        self.shared = shared  # a RedisCache holding the group generations, or None in a single process
+
+    @staticmethod
+    def _memo():
+        if not has_request_context():
+            return {}
+        if 'identity_memo' not in g:
+            g.identity_memo = {}
+        return g.identity_memo
+
+    def username(self, cursor, user_id):
+        """Return the username for user_id, or None if there is no such user."""
+        if user_id is None:
+            return None
+        user_id = int(user_id)
+        # The signed session already names the caller
+        session = g.get('identity') if has_request_context() else None
+        if session is not None and session.user_id == user_id:
+            return session.username
+        memo = self._memo()
+        key = ('user', user_id)
+        if key in memo:
+            return memo[key]
+
+        username = self.usernames.get(user_id)
+        if username is None:
+            cursor.execute("SELECT username FROM users WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+            if row:
+                username = row['username'] if isinstance(row, dict) else row[0]
+                self.usernames.set(user_id, username)
+        memo[key] = username
+        return username
+
+    def group_members(self, cursor, group_id):
+        """Return the frozenset of usernames in a group."""
+        group_id = int(group_id)
+        memo = self._memo()
+        key = ('group', group_id)
+        if key in memo:
+            return memo[key]
+
+        members, generation = self.cached_members(group_id)
+        if members is None:
+            cursor.execute("SELECT username FROM group_members WHERE group_id = %s", (group_id,))
+            members = frozenset(row['username'] if isinstance(row, dict) else row[0]
+                                for row in cursor.fetchall())
+            self.store_members(group_id, generation, members)
+        memo[key] = members
+        return members
+
+    def cached_members(self, group_id):
+        """(the cached member set, or None when missing or outdated; the group's current generation).
+
+        The generation is read before the members are, so a set stored under it
+        is dropped by any invalidation made while it was being read.
+        """
+        generation = self.shared.counter(f"members:{group_id}") if self.shared is not None else 0
+        entry = self.members.get(group_id)
+        if entry is not None and entry[0] == generation:
+            return entry[1], generation
+        return None, generation
+
+    def store_members(self, group_id, generation, members):
+        self.members.set(group_id, (generation, members))
+
+    def is_member(self, cursor, group_id, username):
+        return username is not None and username in self.group_members(cursor, group_id)
+
+    def invalidate_group(self, group_id):
+        group_id = int(group_id)
+        if self.shared is not None:
+            self.shared.incr(f"members:{group_id}")
+        self.members.pop(group_id)
+        self._memo().pop(('group', group_id), None)
+
+    def invalidate_user(self, user_id):
+        user_id = int(user_id)
+        self.usernames.pop(user_id)
+        self._memo().pop(('user', user_id), None)
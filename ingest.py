@@ -0,0 +1,207 @@
+"""Group-commit write path for chat messages.
+
+Request threads hand each message to a MessageIngestor and wait for it to be
+stored. One writer thread drains the queue in batches: whatever arrived while
+the previous batch was being written, plus anything arriving within
+``max_delay`` seconds, up to ``max_batch`` messages. A batch costs one
+multi-row INSERT and one commit however many messages it holds.
+
+Every message has a ``client_msg_id`` (generated server-side when the client
+sends none), unique per group. A resent message resolves to the row stored
+the first time instead of being inserted again, so clients can retry freely
+and match their optimistic copy to the stored id. The queue is bounded: once
+it is full, submit() fails immediately with IngestBusy instead of letting
+waiting requests pile up.
+"""
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+MAX_CLIENT_ID_LENGTH = 64
+
+
+def server_client_id():
+    """client_msg_id for a message the server writes on nobody's behalf."""
+    return f"srv-{uuid.uuid4().hex}"
+
+
+class IngestError(Exception):
+    pass
+
+
+class IngestBusy(IngestError):
+    """The queue is full; the caller should retry shortly."""
+
+
+class NotAMember(IngestError):
+    pass
+
+
+class PendingMessage:
+    def __init__(self, group_id, sender, message, client_msg_id):
+        self.group_id = group_id
+        self.sender = sender
+        self.message = message
+        self.client_msg_id = client_msg_id
+        self.future = Future()
+
+    @property
+    def key(self):
+        return (self.group_id, self.client_msg_id)
+
+
+class MessageIngestor:
+    def __init__(self, get_connection, is_member, on_insert=None, on_commit=None, max_batch=100, max_delay=0.002,
+                 queue_size=1000):
+        self.get_connection = get_connection
+        self.is_member = is_member      # is_member(cursor, group_id, username)
+        self.on_insert = on_insert      # on_insert(cursor, rows) inside the batch's transaction, before the commit
+        self.on_commit = on_commit      # on_commit(rows) with the newly stored rows, after the commit
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self._batches = 0
+        self._messages = 0
+        self._duplicates = 0
+        self._rejected = 0
+        self._largest_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='message-ingest', daemon=True)
+                self._thread.start()
+
+    def submit(self, group_id, sender, message, client_msg_id=None):
+        """Queue a message; the returned Future resolves to the stored row.
+
+        The row has id, group_id, sender, message, client_msg_id and
+        created_at, plus ``duplicate`` when it had already been stored.
+        """
+        self._ensure_started()
+        pending = PendingMessage(int(group_id), sender, message, client_msg_id or server_client_id())
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise IngestBusy("Too many messages queued")
+        return pending.future
+
+    def send(self, group_id, sender, message, client_msg_id=None, timeout=None):
+        """submit() and wait; raises concurrent.futures.TimeoutError after ``timeout`` seconds."""
+        return self.submit(group_id, sender, message, client_msg_id).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'batches': self._batches,
+                'messages': self._messages,
+                'duplicates': self._duplicates,
+                'rejected': self._rejected,
+                'largest_batch': self._largest_batch,
+            }
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                created = self._write(batch)
+            except Exception as err:
+                # Nothing in the batch was committed; every sender sees the error and may resend
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(err)
+                continue
+            if created and self.on_commit:
+                try:
+                    self.on_commit(created)
+                except Exception as err:
+                    print("Message publish failed:", err)
+
+    @staticmethod
+    def _lookup(cursor, keys):
+        keys = list(keys)
+        cursor.execute(
+            "SELECT id, group_id, sender, message, client_msg_id, created_at FROM messages "
+            f"WHERE (group_id, client_msg_id) IN ({', '.join(['(%s, %s)'] * len(keys))})",
+            [value for key in keys for value in key],
+        )
+        return {(row['group_id'], row['client_msg_id']): row for row in cursor.fetchall()}
+
+    def _write(self, batch):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+
+            accepted = []
+            for pending in batch:
+                if self.is_member(cursor, pending.group_id, pending.sender):
+                    accepted.append(pending)
+                else:
+                    pending.future.set_exception(NotAMember(pending.sender))
+            if not accepted:
+                return []
+
+            existing = self._lookup(cursor, {pending.key for pending in accepted})
+            fresh = {}
+            for pending in accepted:
+                if pending.key not in existing:
+                    fresh.setdefault(pending.key, pending)  # the first copy within the batch is stored
+
+            stored = {}
+            if fresh:
+                # IGNORE: another worker may have stored the same key since the lookup
+                cursor.executemany(
+                    "INSERT IGNORE INTO messages (group_id, sender, message, client_msg_id) VALUES (%s, %s, %s, %s)",
+                    [(p.group_id, p.sender, p.message, p.client_msg_id) for p in fresh.values()],
+                )
+                # Still inside the transaction, so this sees only the rows this batch inserted
+                stored = self._lookup(cursor, fresh)
+                if stored and self.on_insert:
+                    self.on_insert(cursor, [stored[key] for key in fresh if key in stored])
+                conn.commit()
+                missing = [key for key in fresh if key not in stored]
+                if missing:
+                    # Keys another worker stored first count as duplicates
+                    existing.update(self._lookup(cursor, missing))
+        finally:
+            conn.close()
+
+        duplicates = 0
+        for pending in accepted:
+            if pending.key in stored:
+                row, duplicate = stored[pending.key], fresh[pending.key] is not pending
+            elif pending.key in existing:
+                row, duplicate = existing[pending.key], True
+            else:
+                pending.future.set_exception(IngestError("Message could not be stored"))
+                continue
+            duplicates += duplicate
+            pending.future.set_result(dict(row, duplicate=duplicate))
+
+        with self._lock:
+            self._batches += 1
+            self._messages += len(stored)
+            self._duplicates += duplicates
+            self._largest_batch = max(self._largest_batch, len(batch))
+        return [stored[key] for key in fresh if key in stored]
@@ -0,0 +1,302 @@
+"""Durable background jobs run by worker threads inside the API process.
+
+Jobs are rows in the ``jobs`` table, so one enqueued in the same transaction
+as the change that needs it survives restarts and is picked up by whichever
+process claims it first. A worker claims a job with ``FOR UPDATE SKIP
+LOCKED`` and holds a lease on it. The lease is extended every time the job
+reports progress, and a job whose lease expires (its worker died) is claimed
+again. Failed jobs are retried with exponential backoff until they run out of
+attempts.
+
+Handlers are registered per kind and receive a Job. They should work in
+bounded, separately committed steps, call ``job.report(...)`` between them,
+and be safe to re-run from the start or from ``job.progress``:
+
+    @runner.register('purge_group')
+    def purge_group(job):
+        ...
+        job.report(deleted=total)
+"""
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_BACKOFF_SECONDS = 300
+
+# The oldest runnable job: queued and due, or running on an expired lease.
+# migrations.plans EXPLAINs it, so keep it served by idx_jobs_status_run_after.
+CLAIM_STATEMENT = """
+SELECT id, kind, payload, attempts, max_attempts, progress FROM jobs
+WHERE (status = 'queued' AND run_after <= NOW(3))
+   OR (status = 'running' AND locked_until < NOW(3))
+ORDER BY id
+LIMIT 1
+FOR UPDATE SKIP LOCKED
+"""
+
+
+class JobError(Exception):
+    pass
+
+
+class LeaseLost(JobError):
+    """Another worker took the job over after this one's lease expired."""
+
+
+class Handler:
+    def __init__(self, kind, func, max_attempts):
+        self.kind = kind
+        self.func = func
+        self.max_attempts = max_attempts
+
+
+class Job:
+    def __init__(self, runner, worker_id, id, kind, payload, attempts, max_attempts, progress):
+        self.runner = runner
+        self.worker_id = worker_id
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.progress = progress
+
+    def report(self, **progress):
+        """Record progress and extend the lease; raises LeaseLost if the job was taken over."""
+        self.progress.update(progress)
+        self.runner._report(self)
+
+
+class JobRunner:
+    def __init__(self, get_connection, workers=2, poll_interval=1.0, lease_seconds=60, retry_base_seconds=5):
+        self.get_connection = get_connection
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self.handlers = {}
+        self._schedules = []  # [kind, payload, every seconds, next due (monotonic)]
+        self._threads = []
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        self._running = 0
+        self._succeeded = 0
+        self._failed = 0
+        self._retried = 0
+
+    def register(self, kind, max_attempts=5):
+        def decorator(func):
+            self.handlers[kind] = Handler(kind, func, max_attempts)
+            return func
+        return decorator
+
+    def schedule(self, kind, every, payload=None):
+        """Enqueue ``kind`` every ``every`` seconds, unless one is already queued or running."""
+        self._schedules.append([kind, payload or {}, every, time.monotonic() + every])
+
+    def enqueue(self, cursor, kind, payload=None, delay=0, unique=False):
+        """Add a job in the caller's transaction; returns its id (None if ``unique`` and one is pending).
+
+        Call wake() after the commit so an idle worker picks it up straight away.
+        """
+        handler = self.handlers.get(kind)
+        if handler is None:
+            raise JobError(f"No handler registered for job kind {kind!r}")
+        params = (kind, json.dumps(payload or {}), handler.max_attempts, delay)
+        if unique:
+            cursor.execute("""
+            INSERT INTO jobs (kind, payload, max_attempts, run_after)
+            SELECT %s, %s, %s, NOW(3) + INTERVAL %s SECOND FROM DUAL
+            WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = %s AND status IN ('queued', 'running'))
+            """, params + (kind,))
+            if cursor.rowcount == 0:
+                return None
+        else:
+            cursor.execute("""
+            INSERT INTO jobs (kind, payload, max_attempts, run_after)
+            VALUES (%s, %s, %s, NOW(3) + INTERVAL %s SECOND)
+            """, params)
+        return cursor.lastrowid
+
+    def wake(self):
+        self._wakeup.set()
+
+    def get(self, cursor, job_id):
+        """The job as a dict for status endpoints, or None; ``cursor`` must be a dictionary cursor."""
+        cursor.execute("""
+        SELECT id, kind, status, attempts, max_attempts, progress, error, created_at, finished_at
+        FROM jobs WHERE id = %s
+        """, (job_id,))
+        job = cursor.fetchone()
+        if job is not None:
+            job['progress'] = json.loads(job['progress']) if job['progress'] else {}
+        return job
+
+    def start(self):
+        """Start this process's workers; cheap once they run, so it can be called per request.
+
+        Threads do not survive fork, so a worker process forked from one that
+        already started (a preloading server's master) starts its own.
+        """
+        pid = os.getpid()
+        if self.workers <= 0 or self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            base = f"{socket.gethostname()}:{pid}"
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, args=(f"{base}:{index}",), name=f'job-worker-{index}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = pid
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': len(self._threads),
+                'running': self._running,
+                'succeeded': self._succeeded,
+                'failed': self._failed,
+                'retried': self._retried,
+            }
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _run_schedules(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [entry for entry in self._schedules if entry[3] <= now]
+            for entry in due:
+                entry[3] = now + entry[2]
+        for kind, payload, _, _ in due:
+            with self._transaction() as cursor:
+                self.enqueue(cursor, kind, payload, unique=True)
+
+    def _claim(self, worker_id):
+        with self._transaction() as cursor:
+            cursor.execute(CLAIM_STATEMENT)
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            if row['attempts'] >= row['max_attempts']:
+                # Its last worker died holding it and there are no attempts left
+                cursor.execute("""
+                UPDATE jobs SET status = 'failed', error = 'Worker lost', locked_by = NULL, locked_until = NULL,
+                       finished_at = NOW(3)
+                WHERE id = %s
+                """, (row['id'],))
+                return None
+            cursor.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                   locked_until = NOW(3) + INTERVAL %s SECOND
+            WHERE id = %s
+            """, (worker_id, self.lease_seconds, row['id']))
+        return Job(self, worker_id, row['id'], row['kind'], json.loads(row['payload']), row['attempts'] + 1,
+                   row['max_attempts'], json.loads(row['progress']) if row['progress'] else {})
+
+    def _report(self, job):
+        with self._transaction() as cursor:
+            cursor.execute("""
+            UPDATE jobs SET progress = %s, locked_until = NOW(3) + INTERVAL %s SECOND
+            WHERE id = %s AND locked_by = %s AND status = 'running'
+            """, (json.dumps(job.progress), self.lease_seconds, job.id, job.worker_id))
+            if cursor.rowcount == 0:
+                raise LeaseLost(f"Job {job.id} was taken over by another worker")
+
+    def _finish(self, job, error=None):
+        with self._transaction() as cursor:
+            if error is None:
+                cursor.execute("""
+                UPDATE jobs SET status = 'done', progress = %s, error = NULL, locked_by = NULL, locked_until = NULL,
+                       finished_at = NOW(3)
+                WHERE id = %s AND locked_by = %s
+                """, (json.dumps(job.progress), job.id, job.worker_id))
+            elif job.attempts >= job.max_attempts:
+                cursor.execute("""
+                UPDATE jobs SET status = 'failed', progress = %s, error = %s, locked_by = NULL, locked_until = NULL,
+                       finished_at = NOW(3)
+                WHERE id = %s AND locked_by = %s
+                """, (json.dumps(job.progress), str(error), job.id, job.worker_id))
+            else:
+                backoff = min(self.retry_base_seconds * 2 ** (job.attempts - 1), MAX_BACKOFF_SECONDS)
+                cursor.execute("""
+                UPDATE jobs SET status = 'queued', progress = %s, error = %s, locked_by = NULL, locked_until = NULL,
+                       run_after = NOW(3) + INTERVAL %s SECOND
+                WHERE id = %s AND locked_by = %s
+                """, (json.dumps(job.progress), str(error), backoff, job.id, job.worker_id))
+
+    def _execute(self, job):
+        with self._lock:
+            self._running += 1
+        error = None
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise JobError(f"No handler registered for job kind {job.kind!r}")
+            handler.func(job)
+        except LeaseLost as err:
+            print("Job abandoned:", err)
+            with self._lock:
+                self._running -= 1
+            return
+        except Exception as err:
+            print(f"Job {job.id} ({job.kind}) failed:", err)
+            error = err
+
+        try:
+            self._finish(job, error)
+        except Exception as err:
+            # The lease runs out and the job is claimed again
+            print(f"Could not record the outcome of job {job.id}:", err)
+        with self._lock:
+            self._running -= 1
+            if error is None:
+                self._succeeded += 1
+            elif job.attempts >= job.max_attempts:
+                self._failed += 1
+            else:
+                self._retried += 1
+
+    def _work(self, worker_id):
+        while not self._stopping.is_set():
+            job = None
+            try:
+                if self._schedules:
+                    self._run_schedules()
+                job = self._claim(worker_id)
+            except Exception as err:
+                print("Job runner error:", err)
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
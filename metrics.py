@@ -0,0 +1,255 @@
+"""Per-route request and SQL instrumentation exposed in Prometheus text format.
+
+``init_app(app)`` wraps every request to record its latency, response size,
+how many SQL statements it ran, how long they took and how long it waited for
+a pooled connection, and serves the result at ``/metrics``. Statements slower
+than the slow-query threshold are logged with the shape of their parameters
+(types and lengths, never the values).
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+import db
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+slow_query_log = logging.getLogger('tripsync.slow_query')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count)
+                        for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, ('le', _number(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class GaugeSet:
+    """Gauges read from a stats callback (e.g. pool_stats) at scrape time."""
+
+    def __init__(self, prefix, help, collect, keys):
+        self.prefix = prefix
+        self.help = help
+        self.collect = collect
+        self.keys = keys
+
+    def render(self):
+        try:
+            stats = self.collect()
+        except Exception:  # a broken collector must not break the scrape
+            return []
+        lines = []
+        for key in self.keys:
+            if key in stats:
+                name = f"{self.prefix}_{key}"
+                lines.append(f"# HELP {name} {self.help} ({key})")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(stats[key])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'tripsync_request_duration_seconds', 'Time spent handling a request',
+    ('route', 'method', 'status')))
+request_sql_statements = registry.register(Histogram(
+    'tripsync_request_sql_statements', 'SQL statements executed per request',
+    ('route',), COUNT_BUCKETS))
+request_sql_seconds = registry.register(Histogram(
+    'tripsync_request_sql_seconds', 'Total SQL execution time per request', ('route',)))
+request_connection_wait = registry.register(Histogram(
+    'tripsync_request_connection_wait_seconds', 'Time spent waiting for pooled connections per request',
+    ('route',)))
+response_size = registry.register(Histogram(
+    'tripsync_response_size_bytes', 'Response body size', ('route',), SIZE_BUCKETS))
+slow_queries = registry.register(Counter(
+    'tripsync_slow_queries_total', 'Statements slower than the slow-query threshold', ('route',)))
+
+
+def register_stats(prefix, help, collect, keys):
+    """Export numeric fields of a stats() dict (pool, broker, ...) as gauges."""
+    return registry.register(GaugeSet(prefix, help, collect, keys))
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def param_shape(params):
+    """Describe parameters by type and size only, e.g. (int, str[12], list[3])."""
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{key}: {param_shape_one(value)}" for key, value in params.items()) + '}'
+    if isinstance(params, (list, tuple)) and params and isinstance(params[0], (list, tuple)):
+        return f"{len(params)} x {param_shape(params[0])}"
+    try:
+        return '(' + ', '.join(param_shape_one(value) for value in params) + ')'
+    except TypeError:
+        return param_shape_one(params)
+
+
+def param_shape_one(value):
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+# Set by init_app(); the native asyncio routes log slow queries against the same threshold
+_settings = {'slow_query_seconds': 0.2}
+
+
+def request_state():
+    """Per-request counters, kept in ``g.metrics`` while the request runs."""
+    return {'started': time.perf_counter(), 'statements': 0, 'sql_seconds': 0.0, 'connection_wait': 0.0}
+
+
+def observe_query(state, route, statement, params, seconds):
+    if state is not None:
+        state['statements'] += 1
+        state['sql_seconds'] += seconds
+    if seconds >= _settings['slow_query_seconds']:
+        slow_queries.inc(route or 'background')
+        slow_query_log.warning(
+            "slow query %.1f ms route=%s params=%s sql=%s",
+            seconds * 1000, route or '-', param_shape(params),
+            _WHITESPACE.sub(' ', str(statement)).strip(),
+        )
+
+
+def observe_request(state, route, method, status, content_length):
+    request_duration.observe(time.perf_counter() - state['started'], route, method, str(status))
+    request_sql_statements.observe(state['statements'], route)
+    request_sql_seconds.observe(state['sql_seconds'], route)
+    request_connection_wait.observe(state['connection_wait'], route)
+    if content_length is not None:
+        response_size.observe(content_length, route)
+
+
+def init_app(app, slow_query_seconds=0.2):
+    _settings['slow_query_seconds'] = slow_query_seconds
+
+    def on_checkout(waited):
+        if has_request_context() and 'metrics' in g:
+            g.metrics['connection_wait'] += waited
+
+    def on_query(statement, params, seconds):
+        if has_request_context() and 'metrics' in g:
+            observe_query(g.metrics, _route(), statement, params, seconds)
+        else:
+            observe_query(None, None, statement, params, seconds)
+
+    db.set_observers(on_checkout=on_checkout, on_query=on_query)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics = request_state()
+
+    @app.after_request
+    def record_request_metrics(response):
+        state = g.pop('metrics', None)
+        if state is not None:
+            observe_request(state, _route(), request.method, response.status_code, response.content_length)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,164 @@
+"""Versioned schema migrations for the TripSync database.
+
+Each module in ``migrations/versions`` is named ``<version>_<name>.py`` and
+defines ``upgrade(cursor)``. Migrations run in version order and the applied
+versions are recorded in ``schema_migrations``. MySQL commits DDL implicitly,
+so every migration is written to be idempotent (``CREATE TABLE IF NOT
+EXISTS``, ``ensure_index``): re-running one that failed half way is safe.
+
+    python -m migrations up
+    python -m migrations status
+    python -m migrations check-plans --scale 100000
+"""
+import importlib
+import os
+import pkgutil
+
+VERSIONS_PACKAGE = 'migrations.versions'
+VERSIONS_PATH = os.path.join(os.path.dirname(__file__), 'versions')
+
+# Serialises concurrent runners (e.g. several workers starting at once)
+LOCK_NAME = 'tripsync_schema_migrations'
+LOCK_TIMEOUT = 60
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or '').strip().split('\n')[0]
+
+    def upgrade(self, cursor):
+        self.module.upgrade(cursor)
+
+
+def discover():
+    """All migrations shipped with the code, in version order."""
+    migrations = []
+    for info in pkgutil.iter_modules([VERSIONS_PATH]):
+        version, _, name = info.name.partition('_')
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f"{VERSIONS_PACKAGE}.{info.name}")
+        if not hasattr(module, 'upgrade'):
+            raise MigrationError(f"Migration {info.name} does not define upgrade(cursor)")
+        migrations.append(Migration(version, name, module))
+    migrations.sort(key=lambda migration: int(migration.version))
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(32) NOT NULL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version, applied_at FROM schema_migrations")
+    return {version: applied_at for version, applied_at in cursor.fetchall()}
+
+
+def status(conn):
+    """(migration, applied_at or None) for every known migration."""
+    cursor = conn.cursor()
+    try:
+        ensure_version_table(cursor)
+        applied = applied_versions(cursor)
+    finally:
+        cursor.close()
+    return [(migration, applied.get(migration.version)) for migration in discover()]
+
+
+def migrate(conn, target=None, log=print):
+    """Apply every pending migration up to and including ``target``; return those applied."""
+    migrations = discover()
+    if target is not None and target not in {migration.version for migration in migrations}:
+        raise MigrationError(f"Unknown migration version {target!r}")
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise MigrationError("Another migration run holds the schema lock")
+
+    done = []
+    try:
+        ensure_version_table(cursor)
+        applied = applied_versions(cursor)
+        for migration in migrations:
+            if migration.version not in applied:
+                log(f"Applying {migration.version} {migration.name}")
+                migration.upgrade(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name),
+                )
+                conn.commit()
+                done.append(migration)
+            if migration.version == target:
+                break
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+        cursor.close()
+    return done
+
+
+# Helpers for writing idempotent migrations
+
+def table_exists(cursor, table):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.tables
+    WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_columns(cursor, table):
+    """index name -> ordered list of its columns."""
+    cursor.execute("""
+    SELECT index_name, column_name FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s
+    ORDER BY index_name, seq_in_index
+    """, (table,))
+    indexes = {}
+    for index_name, column_name in cursor.fetchall():
+        indexes.setdefault(index_name, []).append(column_name)
+    return indexes
+
+
+def ensure_index(cursor, table, name, columns, unique=False):
+    """Create ``name`` unless the table already has an index on exactly these columns.
+
+    Returns True when the index was created.
+    """
+    for existing_name, existing_columns in index_columns(cursor, table).items():
+        if existing_name == name or existing_columns == list(columns):
+            return False
+    cursor.execute(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"
+    )
+    return True
@@ -0,0 +1,104 @@
+import argparse
+import sys
+
+import mysql.connector
+
+from migrations import MigrationError, migrate, status
+
+TABLES = [
+    'users', 'friends', 'cities', 'places', 'chat_groups', 'group_members',
+    'messages', 'calendar_events', 'event_participants',
+]
+
+
+def connect(args):
+    return mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                   database=args.database)
+
+
+def cmd_up(args):
+    conn = connect(args)
+    try:
+        applied = migrate(conn, target=args.target)
+    finally:
+        conn.close()
+    print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+
+
+def cmd_status(args):
+    conn = connect(args)
+    try:
+        rows = status(conn)
+    finally:
+        conn.close()
+    for migration, applied_at in rows:
+        state = f"applied {applied_at}" if applied_at else "pending"
+        print(f"{migration.version}  {migration.name:<32} {state:<30} {migration.description}")
+
+
+def cmd_check_plans(args):
+    # Imported here: loading the app needs Flask and its configuration, the other commands do not
+    import App
+    import db
+    from bench.dataset import Layout
+    from migrations.plans import check_plans
+
+    db.init_pool({'host': args.host, 'user': args.user, 'password': args.password,
+                  'database': args.database})
+    conn = connect(args)
+    try:
+        cursor = conn.cursor()
+        # Fresh statistics after a bulk load, so the plans match a steady-state server
+        for table in TABLES:
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+        cursor.close()
+        layout = Layout.from_scale(args.scale)
+        # The routes are requested as the user endpoint_requests() reads for
+        user_id = layout.group_creator(1)
+        headers = {}
+        if App.session_tokens is not None:
+            headers['Authorization'] = f"Bearer {App.session_tokens.issue(user_id, layout.username(user_id))}"
+        failures = check_plans(App.app, conn, layout, min_rows=args.min_rows, headers=headers)
+    finally:
+        conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) fall back to a full table scan:")
+        for route, statement, scans in failures:
+            tables = ', '.join(f"{step['table']} (~{step['rows']} rows)" for step in scans)
+            print(f"\n{route}: {tables}\n{statement.strip()}")
+        sys.exit(1)
+    print("\nEvery plan uses an index")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m migrations', description='TripSync schema migrations')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--database', default='tripsync')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    up = commands.add_parser('up', help='apply pending migrations')
+    up.add_argument('--target', help='stop after this version')
+    up.set_defaults(func=cmd_up)
+
+    commands.add_parser('status', help='list migrations and whether they are applied').set_defaults(func=cmd_status)
+
+    plans = commands.add_parser('check-plans', help='EXPLAIN the API queries against the bench dataset')
+    plans.add_argument('--scale', type=int, default=100000, help='scale the dataset was generated with')
+    plans.add_argument('--min-rows', type=int, default=1000,
+                       help='full scans of smaller tables are not reported as failures')
+    plans.set_defaults(func=cmd_check_plans)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except MigrationError as err:
+        print(f"Migration error: {err}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""EXPLAIN every query the API issues and fail on full table scans.
+
+The GET routes are driven through Flask's test client against a database
+filled by ``bench.generate``, and every statement they execute is captured and
+EXPLAINed with its real parameters, so the check follows App.py as it changes.
+Write routes are not replayed (that would modify the data); the lookups they
+depend on are listed in WRITE_PATH_STATEMENTS and explained directly, which
+MySQL does without executing them.
+
+A plan step fails when it reads a table with ``type = ALL`` and the table holds
+at least ``min_rows`` rows. Small lookup tables such as ``cities`` may be
+scanned to drive a join, and routes listed in ALLOWED_FULL_SCANS scan on
+purpose.
+"""
+import re
+from urllib.parse import urlencode
+
+import changes
+import db
+import friend_graph
+import jobs
+from bench.dataset import CATEGORIES
+
+# route rule -> why a full scan is expected there
+ALLOWED_FULL_SCANS = {
+    '/api/top-places': 'ranks every place of every category; the response is cached',
+}
+
+# statement -> why it reads a whole table, whichever route runs it
+ALLOWED_FULL_SCAN_STATEMENTS = {
+    friend_graph.LOAD_STATEMENT: 'loads the friend graph into memory once per process',
+}
+
+WRITE_PATH_STATEMENTS = [
+    ("SELECT id, status, user_id, friend_id FROM friends "
+     "WHERE (user_id = %s AND friend_id = %s) OR (user_id = %s AND friend_id = %s)", (1, 2, 2, 1)),
+    ("SELECT status FROM event_participants WHERE event_id = %s AND user_id = %s", (1, 1)),
+    ("DELETE FROM group_members WHERE group_id = %s AND username = %s", (1, 'user1')),
+    ("DELETE FROM messages WHERE group_id = %s", (1,)),
+    ("UPDATE friends SET status = 'accepted' WHERE id = %s", (1,)),
+    ("SELECT id, group_id, sender, message, client_msg_id, created_at FROM messages "
+     "WHERE (group_id, client_msg_id) IN ((%s, %s), (%s, %s))", (1, 'a', 2, 'b')),
+    ("SELECT COUNT(*) AS newer FROM (SELECT 1 FROM messages WHERE group_id = %s AND id > %s LIMIT %s) AS tail",
+     (1, 1, 1000)),
+    # Run by every job worker once per poll interval, not by a route
+    (jobs.CLAIM_STATEMENT, ()),
+]
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+
+def endpoint_requests(layout):
+    """GET requests covering every read route, with ids that exist in the bench dataset."""
+    user_id = layout.group_creator(1)
+    friend_id = layout.friend_ids(user_id)[0]
+    group_id = 1
+    messages = layout.messages_per_group
+    return [
+        f"/api/users?{urlencode({'current_user_id': user_id})}",
+        f"/api/users?{urlencode({'search': layout.username(friend_id), 'current_user_id': user_id})}",
+        f"/api/group_messages/{group_id}?user_id={user_id}",
+        f"/api/group_messages/{group_id}?user_id={user_id}&limit=50",
+        f"/api/group_messages/{group_id}?user_id={user_id}&limit=50&before={messages // 2}",
+        f"/api/group_messages/{group_id}?user_id={user_id}&after={messages // 2}",
+        f"/api/get_groups?user_id={user_id}",
+        f"/api/group_members/{group_id}",
+        f"/api/group_info/{group_id}",
+        f"/api/friend_requests/{user_id}",
+        f"/api/friends/{user_id}",
+        f"/api/friend_suggestions/{user_id}",
+        f"/api/friend_suggestions/{user_id}?limit=5",
+        "/api/top-places",
+        "/api/top-cities",
+        "/api/categories",
+        "/api/places?page=3&per_page=12",
+        f"/api/places?{urlencode({'category': CATEGORIES[0], 'page': 3, 'per_page': 12})}",
+        "/api/places?cursor=&per_page=12",
+        "/api/places?search=tower",
+        "/api/place/1",
+        f"/api/calendar/events?user_id={user_id}&start_date=2025-05-01&end_date=2025-05-31",
+        f"/api/calendar/export.ics?user_id={user_id}&start_date=2025-05-01",
+        "/api/calendar/events/1/participants",
+        f"/api/calendar/groups/{user_id}",
+        f"/api/sync?user_id={user_id}",
+        f"/api/sync?{urlencode({'user_id': user_id, 'since': changes.encode_token(0)})}",
+    ]
+
+
+def capture_statements(app, paths, headers=None):
+    """Request each path and return [(route, path, statement, params)] for explainable statements.
+
+    Job workers and search warm-up stay off meanwhile: their statements would
+    run on other threads and be captured under whichever route is current.
+    """
+    captured = []
+    current = {}
+
+    def on_query(statement, params, seconds):
+        if _EXPLAINABLE.match(str(statement)):
+            captured.append((current['route'], current['path'], str(statement), params))
+
+    db.set_observers(on_query=on_query)
+    background_work = app.config.get('BACKGROUND_WORK', True)
+    app.config['BACKGROUND_WORK'] = False
+    try:
+        client = app.test_client()
+        adapter = app.url_map.bind('')
+        for path in paths:
+            rule, _ = adapter.match(path.split('?', 1)[0], method='GET', return_rule=True)
+            current['route'] = rule.rule
+            current['path'] = path
+            response = client.get(path, headers=headers or {})
+            if response.status_code >= 400:
+                print(f"  warning: GET {path} returned {response.status_code}")
+            # Streamed routes only read their rows (and return the connection) as the body is consumed
+            response.get_data()
+            response.close()
+    finally:
+        app.config['BACKGROUND_WORK'] = background_work
+        db.set_observers()
+    return captured
+
+
+def explain(cursor, statement, params):
+    cursor.execute(f"EXPLAIN {statement}", params or ())
+    return cursor.fetchall()
+
+
+def full_scans(plan, min_rows):
+    """Plan steps that read a whole base table of at least ``min_rows`` rows."""
+    return [
+        step for step in plan
+        if step.get('type') == 'ALL'
+        and step.get('table') and not step['table'].startswith('<')
+        and (step.get('rows') or 0) >= min_rows
+    ]
+
+
+def check_plans(app, conn, layout, min_rows=1000, log=print, headers=None):
+    """Return a list of (route, statement, offending plan steps); empty means every plan is indexed.
+
+    ``headers`` go with every request, e.g. the session of ``layout.group_creator(1)``.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        statements = capture_statements(app, endpoint_requests(layout), headers)
+        statements += [('(write path)', None, statement, params)
+                       for statement, params in WRITE_PATH_STATEMENTS]
+
+        failures = []
+        seen = set()
+        for route, path, statement, params in statements:
+            key = (route, statement)
+            if key in seen:
+                continue
+            seen.add(key)
+            plan = explain(cursor, statement, params)
+            scans = full_scans(plan, min_rows)
+            summary = ', '.join(f"{step['table']}:{step['type']}" for step in plan if step.get('table'))
+            if scans and route in ALLOWED_FULL_SCANS:
+                log(f"  allowed  {route}  {summary}  ({ALLOWED_FULL_SCANS[route]})")
+            elif scans and statement in ALLOWED_FULL_SCAN_STATEMENTS:
+                log(f"  allowed  {route}  {summary}  ({ALLOWED_FULL_SCAN_STATEMENTS[statement]})")
+            elif scans:
+                log(f"  FAIL     {route}  {summary}")
+                failures.append((route, statement, scans))
+            else:
+                log(f"  ok       {route}  {summary}")
+        return failures
+    finally:
+        cursor.close()
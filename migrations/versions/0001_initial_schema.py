@@ -0,0 +1,107 @@
+"""Create the tables the API has always assumed."""
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        first_name VARCHAR(100) NOT NULL,
+        last_name VARCHAR(100) NOT NULL,
+        username VARCHAR(100) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_users_username (username),
+        UNIQUE KEY uq_users_email (email)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS friends (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        friend_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT fk_friends_user FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+        CONSTRAINT fk_friends_friend FOREIGN KEY (friend_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cities (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        city_name VARCHAR(255) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS places (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        category VARCHAR(100),
+        city_id INT NOT NULL,
+        image_url VARCHAR(1024),
+        address VARCHAR(255),
+        CONSTRAINT fk_places_city FOREIGN KEY (city_id) REFERENCES cities (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_groups (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        created_by INT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT fk_chat_groups_creator FOREIGN KEY (created_by) REFERENCES users (user_id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS group_members (
+        group_id INT NOT NULL,
+        username VARCHAR(100) NOT NULL,
+        joined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT fk_group_members_group FOREIGN KEY (group_id) REFERENCES chat_groups (id) ON DELETE CASCADE,
+        CONSTRAINT fk_group_members_user FOREIGN KEY (username) REFERENCES users (username)
+            ON UPDATE CASCADE ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        group_id INT NOT NULL,
+        sender VARCHAR(100) NOT NULL,
+        message TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT fk_messages_group FOREIGN KEY (group_id) REFERENCES chat_groups (id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS calendar_events (
+        event_id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        start_date DATETIME NOT NULL,
+        end_date DATETIME,
+        location VARCHAR(255),
+        place_id INT,
+        group_id INT NOT NULL,
+        created_by INT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT fk_calendar_events_place FOREIGN KEY (place_id) REFERENCES places (id) ON DELETE SET NULL,
+        CONSTRAINT fk_calendar_events_group FOREIGN KEY (group_id) REFERENCES chat_groups (id) ON DELETE CASCADE,
+        CONSTRAINT fk_calendar_events_creator FOREIGN KEY (created_by) REFERENCES users (user_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS event_participants (
+        event_id INT NOT NULL,
+        user_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'attending',
+        PRIMARY KEY (event_id, user_id),
+        CONSTRAINT fk_event_participants_event FOREIGN KEY (event_id)
+            REFERENCES calendar_events (event_id) ON DELETE CASCADE,
+        CONSTRAINT fk_event_participants_user FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """,
+]
+
+
+def upgrade(cursor):
+    for statement in TABLES:
+        cursor.execute(statement)
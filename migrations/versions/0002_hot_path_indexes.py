@@ -0,0 +1,24 @@
+"""Indexes behind the membership, message, friendship, calendar and catalog queries."""
+from migrations import ensure_index
+
+INDEXES = [
+    # Membership checks (group_id = ? AND username = ?) and member lists
+    ('group_members', 'idx_group_members_group_user', ['group_id', 'username']),
+    # A user's groups (get_groups, calendar groups, calendar events)
+    ('group_members', 'idx_group_members_user_group', ['username', 'group_id']),
+    # Message windows and replays seek on id within a group; time-range reads use created_at
+    ('messages', 'idx_messages_group_id', ['group_id', 'id']),
+    ('messages', 'idx_messages_group_created', ['group_id', 'created_at']),
+    # Friendships are looked up from both ends
+    ('friends', 'idx_friends_user_friend_status', ['user_id', 'friend_id', 'status']),
+    ('friends', 'idx_friends_friend_user_status', ['friend_id', 'user_id', 'status']),
+    ('calendar_events', 'idx_calendar_events_group_start', ['group_id', 'start_date']),
+    # Category listings ordered by name, and the unfiltered listing / keyset cursor
+    ('places', 'idx_places_category_name', ['category', 'name']),
+    ('places', 'idx_places_name', ['name']),
+]
+
+
+def upgrade(cursor):
+    for table, name, columns in INDEXES:
+        ensure_index(cursor, table, name, columns)
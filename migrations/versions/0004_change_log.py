@@ -0,0 +1,20 @@
+"""Change log read by /api/sync."""
+from migrations import ensure_index
+
+
+def upgrade(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        entity VARCHAR(32) NOT NULL,
+        entity_id INT NOT NULL,
+        op VARCHAR(8) NOT NULL,
+        group_id INT,
+        user_id INT,
+        created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+    )
+    """)
+    # A user's direct changes and their groups' changes are both read as id ranges
+    ensure_index(cursor, 'change_log', 'idx_change_log_user', ['user_id', 'id'])
+    ensure_index(cursor, 'change_log', 'idx_change_log_group', ['group_id', 'id'])
+    ensure_index(cursor, 'change_log', 'idx_change_log_created', ['created_at'])
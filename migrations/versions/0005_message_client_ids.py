@@ -0,0 +1,9 @@
+"""Client-generated message ids, so a resent chat message is stored once."""
+from migrations import column_exists, ensure_index
+
+
+def upgrade(cursor):
+    if not column_exists(cursor, 'messages', 'client_msg_id'):
+        cursor.execute("ALTER TABLE messages ADD COLUMN client_msg_id VARCHAR(64) NULL")
+    # NULLs do not collide, so rows written before this migration are unaffected
+    ensure_index(cursor, 'messages', 'uniq_messages_client_id', ['group_id', 'client_msg_id'], unique=True)
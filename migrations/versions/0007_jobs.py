@@ -0,0 +1,28 @@
+"""Durable background jobs, and tombstones for groups whose data is purged in the background."""
+from migrations import column_exists, ensure_index
+
+
+def upgrade(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        kind VARCHAR(64) NOT NULL,
+        payload TEXT NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'queued',
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 5,
+        progress TEXT,
+        error TEXT,
+        run_after TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        locked_by VARCHAR(64),
+        locked_until TIMESTAMP(3) NULL,
+        created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        finished_at TIMESTAMP(3) NULL
+    )
+    """)
+    # Workers claim the oldest due job; expired leases are found through the same index
+    ensure_index(cursor, 'jobs', 'idx_jobs_status_run_after', ['status', 'run_after'])
+    ensure_index(cursor, 'jobs', 'idx_jobs_kind_status', ['kind', 'status'])
+
+    if not column_exists(cursor, 'chat_groups', 'deleted_at'):
+        cursor.execute("ALTER TABLE chat_groups ADD COLUMN deleted_at TIMESTAMP NULL")
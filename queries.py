@@ -0,0 +1,29 @@
+"""Reusable SQL building blocks shared by several endpoints."""
+
+
+def top_n_per_group(cursor, columns, from_clause, partition_by, order_by, limit,
+                    group_key, where=None, params=(), outer_order=None, drop_key=False):
+    """Fetch the first ``limit`` rows of every group in a single query.
+
+    ``columns`` is the select list (it must include ``group_key`` as an output
+    column), ``partition_by``/``order_by`` define the groups and their ranking.
+    Returns a dict of group key -> rows, in the order the groups were first seen.
+    """
+    query = f"""
+    SELECT * FROM (
+        SELECT {columns},
+               ROW_NUMBER() OVER (PARTITION BY {partition_by} ORDER BY {order_by}) AS group_rank
+        FROM {from_clause}
+        {f"WHERE {where}" if where else ""}
+    ) AS ranked
+    WHERE group_rank <= %s
+    ORDER BY {outer_order or f"{group_key}, group_rank"}
+    """
+    cursor.execute(query, (*params, limit))
+
+    grouped = {}
+    for row in cursor.fetchall():
+        row.pop('group_rank', None)
+        key = row.pop(group_key) if drop_key else row[group_key]
+        grouped.setdefault(key, []).append(row)
+    return grouped
@@ -0,0 +1,297 @@
+"""In-memory trigram search indexes.
+
+Text is normalised (lower-cased, accents and punctuation stripped) and broken
+into padded word trigrams, so a query still matches when a few characters are
+mistyped. Postings map each trigram to the ids of the documents containing it.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Ranked, typo-tolerant lookup of documents by trigram overlap."""
+
+    def __init__(self, threshold=0.5):
+        # Fraction of the query's trigrams a document must share to match
+        self.threshold = threshold
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def add(self, doc_id, text, **attrs):
+        grams = frozenset(trigrams(text))
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._docs[doc_id] = (grams, attrs)
+            for gram in grams:
+                self._postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for gram in entry[0]:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def get(self, doc_id):
+        entry = self._docs.get(doc_id)
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+
+    def candidates(self, query, accept=None):
+        """Return ({doc_id: (shared trigrams, attrs)}, query trigram count)."""
+        grams = trigrams(query)
+        if not grams:
+            return {}, 0
+        needed = max(1, math.ceil(len(grams) * self.threshold))
+
+        with self._lock:
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            # Any document with `needed` shared trigrams must appear in at least one
+            # of the rarest len - needed + 1 postings, so only those are scanned;
+            # the larger ones are just probed for the candidates found so far.
+            seed_count = len(postings) - needed + 1
+            counts = defaultdict(int)
+            for posting in postings[:seed_count]:
+                for doc_id in posting:
+                    counts[doc_id] += 1
+            for posting in postings[seed_count:]:
+                for doc_id in counts:
+                    if doc_id in posting:
+                        counts[doc_id] += 1
+
+            matches = {}
+            for doc_id, count in counts.items():
+                if count < needed:
+                    continue
+                attrs = self._docs[doc_id][1]
+                if accept is not None and not accept(attrs):
+                    continue
+                matches[doc_id] = (count, attrs)
+        return matches, len(grams)
+
+
+class TableSearchIndex(ABC):
+    """A TrigramIndex mirroring rows of one table, refreshed by primary key."""
+
+    # Subclasses provide the row query (with the id column aliased as ``id``),
+    # the qualified id column and document()
+    select_query = None
+    id_column = None
+
+    def __init__(self, refresh_interval=30.0, max_results=1000):
+        self.index = TrigramIndex()
+        self.refresh_interval = refresh_interval
+        self.max_results = max_results
+        self._max_id = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._warm_pid = None
+
+    @abstractmethod
+    def document(self, row):
+        """Return (text, attrs) for a row."""
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _index_rows(self, rows, advance=True):
+        for row in rows:
+            text, attrs = self.document(row)
+            self.index.add(row['id'], text, **attrs)
+            if advance:
+                self._max_id = max(self._max_id, row['id'])
+
+    def _load_since(self, cursor, since_id, batch_size=5000):
+        cursor.execute(
+            f"{self.select_query} WHERE {self.id_column} > %s ORDER BY {self.id_column}",
+            (since_id,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            self._index_rows(rows)
+
+    def ensure_fresh(self, cursor):
+        """Build the index on first use, then pick up newly added rows periodically."""
+        now = time.monotonic()
+        if self._loaded and now - self._last_refresh < self.refresh_interval:
+            return
+        with self._refresh_lock:
+            if self._loaded and now - self._last_refresh < self.refresh_interval:
+                return
+            self._load_since(cursor, self._max_id)
+            self._loaded = True
+            self._last_refresh = time.monotonic()
+
+    def warm(self, get_connection):
+        """Build the index on a background thread, once per process, so no request pays for the first load.
+
+        Searches arriving before it finishes wait for it instead of loading again.
+        """
+        pid = os.getpid()
+        with self._warm_lock:
+            if self._loaded or self._warm_pid == pid:
+                return
+            self._warm_pid = pid
+
+        def load():
+            conn = None
+            try:
+                conn = get_connection()
+                self.ensure_fresh(conn.cursor(dictionary=True))
+            except Exception as err:
+                # The first search loads it instead
+                print(f"{type(self).__name__} warm-up failed:", err)
+            finally:
+                if conn:
+                    conn.close()
+
+        threading.Thread(target=load, name=f'warm-{type(self).__name__}', daemon=True).start()
+
+    def refresh_row(self, cursor, row_id):
+        """Re-read one row after it was inserted, updated or deleted."""
+        cursor.execute(f"{self.select_query} WHERE {self.id_column} = %s", (row_id,))
+        row = cursor.fetchone()
+        if row:
+            # Leave the high-water mark alone so rows inserted elsewhere are still loaded
+            self._index_rows([row], advance=False)
+        else:
+            self.index.remove(row_id)
+
+    def score(self, needle, attrs):
+        """Bonus added to the trigram overlap for a document."""
+        return 0.0
+
+    def search(self, query, accept=None):
+        """Return (ids ordered by relevance, best first, number of matches).
+
+        At most ``max_results`` ids are ranked and returned; the count is of
+        every match, so callers can tell when the ids were capped.
+        """
+        matches, query_size = self.index.candidates(query, accept)
+        if not matches:
+            return [], 0
+
+        needle = normalize(query)
+
+        def rank(doc_id):
+            count, attrs = matches[doc_id]
+            return (-(count / query_size + self.score(needle, attrs)), attrs['name'], doc_id)
+
+        if len(matches) > self.max_results:
+            return heapq.nsmallest(self.max_results, matches, key=rank), len(matches)
+        return sorted(matches, key=rank), len(matches)
+
+
+class PlaceSearchIndex(TableSearchIndex):
+    """Search over place name, city and category backing /api/places?search=."""
+
+    select_query = """
+        SELECT p.id, p.name, p.category, p.city_id, c.city_name
+        FROM places p
+        JOIN cities c ON p.city_id = c.id
+    """
+    id_column = 'p.id'
+
+    def document(self, row):
+        text = f"{row['name']} {row['city_name']} {row['category'] or ''}"
+        return text, {
+            'name': normalize(row['name']),
+            'city': normalize(row['city_name']),
+            'category': row['category'],
+            'city_id': row['city_id'],
+        }
+
+    def refresh_place(self, cursor, place_id):
+        self.refresh_row(cursor, place_id)
+
+    def refresh_city(self, cursor, city_id):
+        """Re-read every place in a city, e.g. after the city was renamed."""
+        cursor.execute(f"{self.select_query} WHERE p.city_id = %s", (city_id,))
+        self._index_rows(cursor.fetchall(), advance=False)
+
+    def score(self, needle, attrs):
+        if attrs['name'].startswith(needle):
+            return 0.5
+        if needle in attrs['name']:
+            return 0.3
+        if needle in attrs['city']:
+            return 0.2
+        return 0.0
+
+    def search(self, query, category=None):
+        accept = None
+        if category:
+            accept = lambda attrs: attrs['category'] == category
+        return super().search(query, accept)
+
+
+class UserSearchIndex(TableSearchIndex):
+    """Prefix and typo-tolerant search over username, first and last name."""
+
+    select_query = "SELECT user_id AS id, username, first_name, last_name FROM users"
+    id_column = 'user_id'
+
+    def document(self, row):
+        text = f"{row['username']} {row['first_name']} {row['last_name']}"
+        return text, {
+            'name': normalize(f"{row['first_name']} {row['last_name']}"),
+            'username': normalize(row['username']),
+        }
+
+    def score(self, needle, attrs):
+        if attrs['username'] == needle:
+            return 1.0
+        if attrs['username'].startswith(needle) or attrs['name'].startswith(needle):
+            return 0.5
+        if any(word.startswith(needle) for word in attrs['name'].split()):
+            return 0.4
+        return 0.0
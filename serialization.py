@@ -0,0 +1,250 @@
+"""Response encoding: fast JSON, optional MessagePack, streamed arrays and compression.
+
+``init_app(app)`` installs a JSON provider that uses orjson when it is
+installed (datetimes and Decimals are handled natively instead of per-row
+``isoformat()`` loops), lets clients ask for MessagePack with
+``Accept: application/msgpack``, and compresses responses with brotli or gzip
+according to ``Accept-Encoding``. ``stream_array`` writes large result sets
+to the client in chunks straight from a cursor.
+"""
+import datetime
+import decimal
+import json
+import uuid
+import zlib
+
+from flask import Response, has_request_context, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for Accept: application/msgpack
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+COMPRESSIBLE_MIMETYPES = {
+    JSON_MIMETYPE, MSGPACK_MIMETYPE, 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/calendar',
+}
+
+# Grouped responses (e.g. top places by category) may have non-string keys
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _default(value):
+    """Types MySQL hands back that the encoders do not know natively."""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj, **kwargs):
+    """JSON text with the app's encoding rules (ISO 8601 datetimes, floats for Decimals)."""
+    if orjson is not None and not kwargs:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode('utf-8')
+    kwargs.setdefault('default', _default)
+    return json.dumps(obj, **kwargs)
+
+
+def packb(obj):
+    return msgpack.packb(obj, default=_default, use_bin_type=True, datetime=False)
+
+
+def negotiated_mimetype():
+    """MessagePack when the client prefers it (and it is installed), JSON otherwise."""
+    if msgpack is None or not has_request_context():
+        return JSON_MIMETYPE
+    best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+    return MSGPACK_MIMETYPE if best in MSGPACK_MIMETYPES else JSON_MIMETYPE
+
+
+def encode(obj, mimetype=None):
+    """(body bytes, mimetype) in the negotiated or given format."""
+    mimetype = mimetype or negotiated_mimetype()
+    if mimetype == MSGPACK_MIMETYPE:
+        return packb(obj), MSGPACK_MIMETYPE
+    return dumps_bytes(obj), JSON_MIMETYPE
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() backed by orjson, answering in MessagePack when the client asks for it."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body, mimetype = encode(obj)
+        response = self._app.response_class(body, mimetype=mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+
+def iter_cursor(cursor, size=500):
+    """Rows from an executed cursor, fetched ``size`` at a time."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_array(rows, key=None, fields=None, chunk_rows=200, on_close=None):
+    """Stream ``rows`` as a JSON array, or as ``{**fields, key: [...]}`` when ``key`` is given.
+
+    Rows are encoded ``chunk_rows`` at a time, so memory stays flat however many
+    there are. ``on_close`` runs once the last chunk is written (or the client
+    goes away), e.g. to return the connection the rows are read from. Clients
+    asking for MessagePack get a regular, fully built response instead, since
+    the format needs the array length up front.
+    """
+    if negotiated_mimetype() == MSGPACK_MIMETYPE:
+        try:
+            rows = list(rows)
+        finally:
+            if on_close:
+                on_close()
+        obj = rows if key is None else {**(fields or {}), key: rows}
+        response = Response(packb(obj), mimetype=MSGPACK_MIMETYPE)
+        response.vary.add('Accept')
+        return response
+
+    if key is None:
+        head, tail = b'[', b']'
+    else:
+        head = dumps_bytes(fields or {})[:-1]
+        head += (b',' if fields else b'') + dumps_bytes(key) + b':['
+        tail = b']}'
+
+    def generate():
+        try:
+            yield head
+            chunk = []
+            first = True
+            for row in rows:
+                chunk.append(dumps_bytes(row))
+                if len(chunk) >= chunk_rows:
+                    yield (b'' if first else b',') + b','.join(chunk)
+                    first = False
+                    chunk = []
+            if chunk:
+                yield (b'' if first else b',') + b','.join(chunk)
+            yield tail
+        finally:
+            if on_close:
+                on_close()
+
+    response = Response(stream_with_context(generate()), mimetype=JSON_MIMETYPE)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
+
+
+def _choose_encoding():
+    encodings = request.accept_encodings
+    if brotli is not None and encodings['br']:
+        return 'br'
+    if encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compressor(encoding, level):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(level, 11))
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _compress_stream(chunks, encoding, level):
+    process, flush, finish = _compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            # Flush per chunk so the client can start parsing before the stream ends
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def init_app(app, compress_min_size=1024, compress_level=6):
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress_response(response):
+        mimetype = response.mimetype or ''
+        if not (mimetype in COMPRESSIBLE_MIMETYPES or mimetype.startswith('text/')):
+            return response
+        # Event streams must reach the client message by message; files are served by static_assets
+        if mimetype == 'text/event-stream' or response.direct_passthrough:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if 'Content-Encoding' in response.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoding, compress_level)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < compress_min_size:
+                return response
+            process, _, finish = _compressor(encoding, compress_level)
+            response.set_data(process(body) + finish())
+
+        response.headers['Content-Encoding'] = encoding
+        # Each encoding is its own byte sequence, so it gets its own strong tag; a client
+        # revalidating the variant it holds is answered here, as the view only knew the plain tag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+            return response.make_conditional(request)
+        return response
@@ -0,0 +1,180 @@
+"""Signed session tokens carrying the caller's identity.
+
+/api/login issues a token embedding the user's id and username, signed with
+TRIPSYNC_SESSION_SECRET and stamped with its issue time. Clients send it as
+``Authorization: Bearer <token>`` (or ``X-Session-Token``), never in a URL. A
+before_request hook checks the signature and age without touching the
+database and puts the identity on ``g.identity``, where IdentityCache and
+``caller_id()`` pick it up.
+
+EventSource cannot set headers, so a client opening a stream first trades its
+token for a ticket (POST /api/stream_ticket) and passes that as ``?ticket=``.
+Tickets are signed separately, expire after a minute and are only accepted by
+the streaming endpoints, so one copied from an access log is of little use.
+
+When sessions are required (the default), every API route except the public
+ones needs a session and takes the caller from it. A request that still names
+a user (``user_id`` in the path, query or body, ``current_user_id``,
+``created_by`` or ``sender``) must name the session's user. With sessions not
+required, requests without a token keep working on those parameters; without
+a secret, sessions are off: no tokens are issued and any sent are ignored.
+"""
+from flask import g, has_request_context, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+SALT = 'tripsync-session'
+TICKET_SALT = 'tripsync-stream-ticket'
+TICKET_PARAM = 'ticket'
+TICKET_MAX_AGE = 60
+
+# Endpoints taking a stream ticket in the query string instead of a header
+TICKET_ENDPOINTS = frozenset({'stream_group_messages'})
+
+# Request fields naming the caller, checked against the session
+USER_ID_FIELDS = ('user_id', 'current_user_id', 'created_by')
+USERNAME_FIELDS = ('sender',)
+
+
+class InvalidSession(Exception):
+    pass
+
+
+class Identity:
+    __slots__ = ('user_id', 'username')
+
+    def __init__(self, user_id, username):
+        self.user_id = user_id
+        self.username = username
+
+    def __repr__(self):
+        return f"Identity({self.user_id!r}, {self.username!r})"
+
+
+class SessionTokens:
+    def __init__(self, secret, max_age=7 * 24 * 3600, ticket_max_age=TICKET_MAX_AGE):
+        if not secret:
+            # A per-process secret would reject tokens issued by every other worker
+            raise ValueError("A session secret is required")
+        self.max_age = max_age
+        self.ticket_max_age = ticket_max_age
+        self._serializer = URLSafeTimedSerializer(secret, salt=SALT)
+        self._tickets = URLSafeTimedSerializer(secret, salt=TICKET_SALT)
+
+    def issue(self, user_id, username):
+        return self._serializer.dumps({'uid': int(user_id), 'usr': username})
+
+    def verify(self, token):
+        """The Identity in ``token``; raises InvalidSession when it is forged, malformed or expired."""
+        return self._load(self._serializer, token, self.max_age, "Session expired", "Invalid session token")
+
+    def issue_ticket(self, identity):
+        """A short-lived stand-in for the session, for URLs (EventSource) that cannot carry a header."""
+        return self._tickets.dumps({'uid': identity.user_id, 'usr': identity.username})
+
+    def verify_ticket(self, ticket):
+        return self._load(self._tickets, ticket, self.ticket_max_age, "Stream ticket expired", "Invalid stream ticket")
+
+    @staticmethod
+    def _load(serializer, token, max_age, expired, invalid):
+        try:
+            data = serializer.loads(token, max_age=max_age)
+            return Identity(int(data['uid']), data['usr'])
+        except SignatureExpired:
+            raise InvalidSession(expired)
+        except (BadSignature, KeyError, TypeError, ValueError):
+            raise InvalidSession(invalid)
+
+
+def token_from(headers):
+    authorization = headers.get('Authorization', '')
+    if authorization[:7].lower() == 'bearer ':
+        return authorization[7:].strip()
+    return headers.get('X-Session-Token')
+
+
+def identify(tokens, headers, args, endpoint):
+    """The Identity the request carries, or None; raises InvalidSession for a bad token or ticket."""
+    if tokens is None:
+        return None
+    token = token_from(headers)
+    if token:
+        return tokens.verify(token)
+    ticket = args.get(TICKET_PARAM) if endpoint in TICKET_ENDPOINTS else None
+    if ticket:
+        return tokens.verify_ticket(ticket)
+    return None
+
+
+def requires_session(path, endpoint, public):
+    """Whether a request must carry a session when sessions are required: API routes but the public ones."""
+    return path.startswith('/api/') and endpoint not in public
+
+
+def claimed_user(view_args, args, body):
+    """(user ids, usernames) the request names as its caller."""
+    sources = [view_args or {}, args]
+    if isinstance(body, dict):
+        sources.append(body)
+    user_ids = set()
+    usernames = set()
+    for source in sources:
+        for field in USER_ID_FIELDS:
+            value = source.get(field)
+            if value not in (None, ''):
+                user_ids.add(str(value))
+        for field in USERNAME_FIELDS:
+            value = source.get(field)
+            if value not in (None, ''):
+                usernames.add(value)
+    return user_ids, usernames
+
+
+def check_claims(identity, view_args, args, body, required=False):
+    """Error message when the request names someone other than its session (or has no session but must)."""
+    user_ids, usernames = claimed_user(view_args, args, body)
+    if identity is None:
+        if required and (user_ids or usernames):
+            return "Session token required"
+        return None
+    if user_ids - {str(identity.user_id)} or usernames - {identity.username}:
+        return "Request does not match the session's user"
+    return None
+
+
+def init_app(app, tokens, required=False, public=()):
+    """Verify session tokens before every request; ``tokens`` is None when sessions are off.
+
+    With ``required``, API requests to endpoints not named in ``public`` are
+    rejected unless they carry a session.
+    """
+    @app.before_request
+    def authenticate():
+        g.identity = None
+        try:
+            g.identity = identify(tokens, request.headers, request.args, request.endpoint)
+        except InvalidSession as err:
+            return jsonify({'error': str(err)}), 401
+        if request.method == 'OPTIONS':
+            return None
+        if g.identity is None and required and requires_session(request.path, request.endpoint, public):
+            return jsonify({'error': "Session token required"}), 401
+        error = check_claims(g.identity, request.view_args, request.args, request.get_json(silent=True), required)
+        if error:
+            return jsonify({'error': error}), 401 if g.identity is None else 403
+        return None
+
+
+def current():
+    """The verified Identity of the request, or None."""
+    return g.get('identity') if has_request_context() else None
+
+
+def caller_id(claimed=None):
+    """The caller's user_id: the session's when there is one, else the one the request names."""
+    identity = current()
+    return identity.user_id if identity is not None else claimed
+
+
+def caller_username(claimed=None):
+    identity = current()
+    return identity.username if identity is not None else claimed
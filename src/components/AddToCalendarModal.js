@@ -60,8 +60,7 @@ const AddToCalendarModal = ({ place, onClose }) => {
         end_date: eventForm.endDate || null,
         location: eventForm.location,
         place_id: eventForm.placeId,
-        group_id: eventForm.groupId,
-        created_by: currentUserId
+        group_id: eventForm.groupId
       });
       
       setIsSuccess(true);
@@ -1,4 +1,22 @@
 import React, { createContext, useState, useEffect } from 'react';
+import axios from 'axios';
+
+const TOKEN_KEY = 'session_token';
+
+// Every axios request carries the signed session token issued at login
+export const setSessionToken = (token) => {
+  if (token) {
+    localStorage.setItem(TOKEN_KEY, token);
+    axios.defaults.headers.common.Authorization = `Bearer ${token}`;
+  } else {
+    localStorage.removeItem(TOKEN_KEY);
+    delete axios.defaults.headers.common.Authorization;
+  }
+};
+
+export const getSessionToken = () => localStorage.getItem(TOKEN_KEY);
+
+setSessionToken(getSessionToken());
 
 // Create the authentication context
 export const AuthContext = createContext();
@@ -24,9 +42,27 @@ export const AuthProvider = ({ children }) => {
   // Function to handle user logout
   const logout = () => {
     localStorage.removeItem('user');
+    setSessionToken(null);
     setUser(null);
   };
 
+  // An expired or rejected session token signs the user out; the routes then show the login page
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      (error) => {
+        if (error.response && error.response.status === 401 && getSessionToken()) {
+          logout();
+          if (window.location.pathname !== '/') {
+            window.location.replace('/');
+          }
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   // Make the context values available to all children components
   return (
     <AuthContext.Provider value={{ 
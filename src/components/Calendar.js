@@ -95,7 +95,7 @@ const Calendar = () => {
       const startDateStr = startOfMonth.toISOString().split('T')[0];
       const endDateStr = endOfMonth.toISOString().split('T')[0];
       
-      let url = `http://localhost:5000/api/calendar/events?user_id=${currentUserId}&start_date=${startDateStr}&end_date=${endDateStr}`;
+      let url = `http://localhost:5000/api/calendar/events?start_date=${startDateStr}&end_date=${endDateStr}`;
       
       if (selectedGroup) {
         url += `&group_id=${selectedGroup}`;
@@ -177,7 +177,6 @@ const Calendar = () => {
       if (isEditMode) {
         // Update existing event
         await axios.put(`http://localhost:5000/api/calendar/events/${currentEventId}`, {
-          user_id: currentUserId,
           title: eventForm.title,
           description: eventForm.description,
           start_date: eventForm.startDate,
@@ -194,8 +193,7 @@ const Calendar = () => {
           end_date: eventForm.endDate || null,
           location: eventForm.location,
           place_id: eventForm.placeId || null,
-          group_id: eventForm.groupId,
-          created_by: currentUserId
+          group_id: eventForm.groupId
         });
       }
       
@@ -211,7 +209,7 @@ const Calendar = () => {
     if (!window.confirm('Are you sure you want to delete this event?')) return;
     
     try {
-      await axios.delete(`http://localhost:5000/api/calendar/events/${eventId}?user_id=${currentUserId}`);
+      await axios.delete(`http://localhost:5000/api/calendar/events/${eventId}`);
       fetchEvents(); // Refresh events
       setShowEventDetails(false); // Close the details modal if open
     } catch (error) {
@@ -259,11 +257,13 @@ const Calendar = () => {
       days.push({ 
         day: i, 
         date: new Date(year, month, i),
+        // Multi-day events show up on every day they cover
         events: filteredEvents.filter(event => {
-          const eventDate = new Date(event.start_date);
-          return eventDate.getDate() === i && 
-                 eventDate.getMonth() === month && 
-                 eventDate.getFullYear() === year;
+          const dayStart = new Date(year, month, i);
+          const dayEnd = new Date(year, month, i + 1);
+          const eventStart = new Date(event.start_date);
+          const eventEnd = event.end_date ? new Date(event.end_date) : eventStart;
+          return eventStart < dayEnd && eventEnd >= dayStart;
         })
       });
     }
@@ -3,8 +3,36 @@ import axios from 'axios';
 import { FaArrowLeft, FaPaperPlane, FaUserPlus, FaEllipsisV } from 'react-icons/fa';
 import './styles/ChatRoom.css';
 
+const PAGE_SIZE = 50;
+
+// Messages already fetched per group, so re-opening a chat only asks for newer ones
+const messageCache = new Map();
+
+const SEND_ATTEMPTS = 3;
+
+// Idempotency key for a message: resending it with the same key never stores a second copy
+const newClientMsgId = () =>
+  window.crypto?.randomUUID?.() || `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+// Replace our optimistic copy (matched by client_msg_id) with the stored message
+const reconcile = (msgs, stored) => {
+  if (msgs.some((msg) => msg.id === stored.id)) {
+    return msgs.filter((msg) => msg.id || msg.client_msg_id !== stored.client_msg_id);
+  }
+  const pending = msgs.findIndex((msg) => !msg.id && msg.client_msg_id === stored.client_msg_id);
+  if (pending === -1) return null;
+  const next = [...msgs];
+  next[pending] = { ...next[pending], ...stored };
+  return next;
+};
+
+const newestId = (msgs) => msgs.reduce((max, msg) => (msg.id && msg.id > max ? msg.id : max), 0);
+const oldestId = (msgs) => msgs.find((msg) => msg.id)?.id;
+
 const ChatRoom = ({ groupId, groupName, onBack }) => {
   const [messages, setMessages] = useState([]);
+  const [hasEarlier, setHasEarlier] = useState(false);
+  const [isLoadingEarlier, setIsLoadingEarlier] = useState(false);
   const [messageText, setMessageText] = useState('');
   const [isLoading, setIsLoading] = useState(true);
   const [showOptions, setShowOptions] = useState(false);
@@ -16,13 +44,43 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
   const messagesEndRef = useRef(null);
   const inputRef = useRef(null);
   const optionsRef = useRef(null);
+  const loadedGroupRef = useRef(null);
+  const lastReadRef = useRef(0);
 
   useEffect(() => {
-    setIsLoading(true);
+    const cached = messageCache.get(groupId);
+    const since = cached ? newestId(cached.messages) : 0;
+    const windowParam = since ? `after=${since}&limit=${PAGE_SIZE}` : `limit=${PAGE_SIZE}`;
+
+    if (cached) {
+      setMessages(cached.messages);
+      setHasEarlier(cached.hasEarlier);
+    }
+    loadedGroupRef.current = null;
+    lastReadRef.current = 0;
+    setIsLoading(!cached);
     axios
-      .get(`http://localhost:5000/api/group_messages/${groupId}?user_id=${currentUserId}`)
+      .get(`http://localhost:5000/api/group_messages/${groupId}?${windowParam}`)
       .then((res) => {
-        setMessages(res.data);
+        if (since && res.data.has_more) {
+          // Too much is new to catch up incrementally; start again from the latest window
+          messageCache.delete(groupId);
+          return axios
+            .get(`http://localhost:5000/api/group_messages/${groupId}?limit=${PAGE_SIZE}`)
+            .then((latest) => {
+              loadedGroupRef.current = groupId;
+              setMessages(latest.data.messages);
+              setHasEarlier(latest.data.has_more);
+              setIsLoading(false);
+            });
+        }
+        if (since) {
+          setMessages((prev) => [...prev, ...res.data.messages]);
+        } else {
+          setMessages(res.data.messages);
+          setHasEarlier(res.data.has_more);
+        }
+        loadedGroupRef.current = groupId;
         setIsLoading(false);
       })
       .catch((err) => {
@@ -49,8 +107,116 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
   }, [groupId, currentUserId]);
 
   useEffect(() => {
-    messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-  }, [messages]);
+    if (loadedGroupRef.current === groupId) {
+      messageCache.set(groupId, { messages: messages.filter((msg) => msg.id), hasEarlier });
+    }
+  }, [groupId, messages, hasEarlier]);
+
+  // Move the read marker to the newest message shown, so the chat list's unread count clears
+  useEffect(() => {
+    if (isLoading) return undefined;
+    const latest = newestId(messages);
+    if (!latest || latest <= lastReadRef.current) return undefined;
+
+    const timer = setTimeout(() => {
+      lastReadRef.current = latest;
+      axios
+        .post('http://localhost:5000/api/mark_read', { group_id: groupId, last_read_id: latest })
+        .catch((err) => console.error("Error marking messages read:", err.response?.data || err.message));
+    }, 1000);
+    return () => clearTimeout(timer);
+  }, [groupId, currentUserId, messages, isLoading]);
+
+  // Live updates: new messages are pushed over server-sent events while the chat is open
+  useEffect(() => {
+    if (isLoading) return undefined;
+
+    let since = newestId(messageCache.get(groupId)?.messages || []);
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+
+    // EventSource cannot send headers, so each connection uses a one-minute stream ticket
+    // instead of putting the session token in the URL
+    const connect = () => {
+      axios
+        .post('http://localhost:5000/api/stream_ticket')
+        .then((res) => {
+          if (closed) return;
+          const ticket = encodeURIComponent(res.data.ticket);
+          source = new EventSource(
+            `http://localhost:5000/api/group_messages/${groupId}/stream?ticket=${ticket}${since ? `&after=${since}` : ''}`
+          );
+
+          source.addEventListener('message', (event) => {
+            const incoming = JSON.parse(event.data);
+            since = Math.max(since || 0, incoming.id);
+            setMessages((prev) => {
+              if (prev.some((msg) => msg.id === incoming.id)) return prev;
+
+              // Swap our own optimistic copy for the stored message
+              return (incoming.client_msg_id && reconcile(prev, incoming)) || [...prev, incoming];
+            });
+          });
+
+          // The browser would reconnect with the same, soon expired, ticket; fetch a new one instead
+          source.onerror = () => {
+            source.close();
+            reconnect();
+          };
+        })
+        .catch((err) => {
+          console.error("Error opening message stream:", err.response?.data || err.message);
+          reconnect();
+        });
+    };
+
+    const reconnect = () => {
+      if (closed) return;
+      clearTimeout(retryTimer);
+      retryTimer = setTimeout(connect, 3000);
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [groupId, currentUserId, isLoading]);
+
+  useEffect(() => {
+    if (!isLoadingEarlier) {
+      messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    }
+  }, [messages, isLoadingEarlier]);
+
+  const loadEarlierMessages = () => {
+    const before = oldestId(messages);
+    if (!before) return;
+
+    setIsLoadingEarlier(true);
+    axios
+      .get(`http://localhost:5000/api/group_messages/${groupId}?before=${before}&limit=${PAGE_SIZE}`)
+      .then((res) => {
+        setMessages((prev) => [...res.data.messages, ...prev]);
+        setHasEarlier(res.data.has_more);
+      })
+      .catch((err) => {
+        console.error("Error fetching earlier messages:", err.response?.data || err.message);
+      })
+      .finally(() => setIsLoadingEarlier(false));
+  };
+
+  const postMessage = (payload, attempt = 1) =>
+    axios.post('http://localhost:5000/api/send_message', payload).catch((err) => {
+      // Network errors and 503s are retried with the same client_msg_id, so they cannot duplicate
+      const retryable = !err.response || err.response.status === 503;
+      if (!retryable || attempt >= SEND_ATTEMPTS) throw err;
+      return new Promise((resolve) => setTimeout(resolve, 500 * attempt))
+        .then(() => postMessage(payload, attempt + 1));
+    });
 
   const sendMessage = () => {
     if (!messageText.trim()) return;
@@ -59,18 +225,22 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
     const newMessage = { 
       sender: currentUsername, 
       message: messageText.trim(),
-      timestamp: new Date().toISOString() 
+      timestamp: new Date().toISOString(),
+      client_msg_id: newClientMsgId(),
     };
     
     setMessages([...messages, newMessage]);
     setMessageText('');
 
     // Then send to server
-    axios
-      .post('http://localhost:5000/api/send_message', {
-        group_id: groupId,
-        sender: currentUsername,
-        message: messageText.trim(),
+    postMessage({
+      group_id: groupId,
+      message: newMessage.message,
+      client_msg_id: newMessage.client_msg_id,
+    })
+      .then((res) => {
+        const { id, client_msg_id, timestamp } = res.data;
+        setMessages((prev) => reconcile(prev, { ...newMessage, id, client_msg_id, timestamp }) || prev);
       })
       .catch((err) => {
         console.error("Error sending message:", err.response?.data || err.message);
@@ -173,7 +343,17 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
             </div>
           </div>
         ) : (
-          Object.entries(messageGroups).map(([date, msgs]) => (
+          <>
+          {hasEarlier && (
+            <button
+              className="load-earlier-button"
+              onClick={loadEarlierMessages}
+              disabled={isLoadingEarlier}
+            >
+              {isLoadingEarlier ? 'Loading...' : 'Load earlier messages'}
+            </button>
+          )}
+          {Object.entries(messageGroups).map(([date, msgs]) => (
             <div key={date} className="message-group">
               <div className="date-divider">
                 <span>{formatDate(msgs[0].timestamp)}</span>
@@ -190,7 +370,7 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
                 
                 return (
                   <div
-                    key={index}
+                    key={msg.id || msg.client_msg_id || `pending-${index}`}
                     className={`message ${isSent ? 'sent' : 'received'} ${isConsecutive ? 'consecutive' : ''} ${sizeClass}`}
                   >
                     <div className="message-content">
@@ -202,7 +382,8 @@ const ChatRoom = ({ groupId, groupName, onBack }) => {
                 );
               })}
             </div>
-          ))
+          ))}
+          </>
         )}
         <div ref={messagesEndRef} />
       </div>
@@ -15,6 +15,7 @@ import {
 } from 'react-icons/fa';
 import Layout from './Layout';
 import ChatRoom from './ChatRoom';
+import { syncState, listGroups, listFriends, listGroupMembers } from '../syncStore';
 import './styles/Chats.css';
 
 // Chat Search Bar Component
@@ -54,6 +55,7 @@ const ChatSearchBar = ({ onSearch }) => {
 const Chats = () => {
   // State management
   const [groups, setGroups] = useState([]);
+  const [activity, setActivity] = useState({});
   const [filteredGroups, setFilteredGroups] = useState([]);
   const [friends, setFriends] = useState([]);
   const [selectedGroup, setSelectedGroup] = useState(null);
@@ -88,6 +90,7 @@ const Chats = () => {
     
     // Load data
     fetchGroups();
+    fetchActivity();
     fetchFriends();
     
     // Handle responsive layout
@@ -97,12 +100,12 @@ const Chats = () => {
     return () => window.removeEventListener('resize', handleResize);
   }, [currentUserId, navigate]);
 
-  // API Calls
+  // API Calls - groups, friends and members come from the delta-synced local copy
   const fetchGroups = useCallback(() => {
     setIsLoading(true);
-    axios.get(`http://localhost:5000/api/get_groups?user_id=${currentUserId}`)
-      .then(response => {
-        const fetchedGroups = response.data.groups || [];
+    syncState(currentUserId)
+      .then(state => {
+        const fetchedGroups = listGroups(state);
         setGroups(fetchedGroups);
         setFilteredGroups(fetchedGroups);
         setIsLoading(false);
@@ -113,10 +116,35 @@ const Chats = () => {
       });
   }, [currentUserId]);
 
-  const fetchFriends = useCallback(() => {
-    axios.get(`http://localhost:5000/api/friends/${currentUserId}`)
+  // Unread counts and last-message previews, maintained by the server as messages are sent
+  const fetchActivity = useCallback(() => {
+    axios
+      .get('http://localhost:5000/api/get_groups')
       .then(response => {
-        setFriends(response.data.friends || []);
+        const byGroup = {};
+        response.data.groups.forEach(group => { byGroup[group.id] = group; });
+        setActivity(byGroup);
+      })
+      .catch(error => {
+        console.error("Error fetching group activity:", error.response?.data || error.message);
+      });
+  }, [currentUserId]);
+
+  // Opening a chat reads it; coming back to the list picks up what arrived meanwhile
+  const openGroup = (group) => {
+    setSelectedGroup(group);
+    setActivity(prev => (prev[group.id] ? { ...prev, [group.id]: { ...prev[group.id], unread_count: 0 } } : prev));
+  };
+
+  const closeGroup = () => {
+    setSelectedGroup(null);
+    fetchActivity();
+  };
+
+  const fetchFriends = useCallback(() => {
+    syncState(currentUserId)
+      .then(state => {
+        setFriends(listFriends(state));
       })
       .catch(error => {
         console.error("Error fetching friends:", error.response?.data || error.message);
@@ -125,16 +153,16 @@ const Chats = () => {
 
   const fetchGroupMembers = useCallback((groupId) => {
     setIsLoadingMembers(true);
-    axios.get(`http://localhost:5000/api/group_members/${groupId}`)
-      .then(response => {
-        setGroupMembers(response.data.members || []);
+    syncState(currentUserId)
+      .then(state => {
+        setGroupMembers(listGroupMembers(state, groupId));
         setIsLoadingMembers(false);
       })
       .catch(error => {
         console.error("Error fetching group members:", error.response?.data || error.message);
         setIsLoadingMembers(false);
       });
-  }, []);
+  }, [currentUserId]);
 
   // Search functionality
   const handleGroupSearch = (searchTerm) => {
@@ -156,7 +184,6 @@ const Chats = () => {
     
     const payload = {
       group_name: newGroupName.trim(),
-      created_by: currentUserId,
       members: selectedFriends
     };
     
@@ -179,20 +206,15 @@ const Chats = () => {
         console.error("Error creating group:", error.response?.data || error.message);
         alert("Failed to create group: " + (error.response?.data?.error || "Unknown error"));
       });
-  }, [currentUserId, fetchGroups, newGroupName, selectedFriends]);
+  }, [fetchGroups, newGroupName, selectedFriends]);
 
   const addMembersToGroup = useCallback(() => {
     if (!selectedGroup || selectedFriends.length === 0) return;
   
-    const addPromises = selectedFriends.map(friendId => 
-      axios.post('http://localhost:5000/api/add_friend_to_group', {
-        group_id: selectedGroup.id,
-        friend_id: friendId,
-        user_id: currentUserId
-      })
-    );
-  
-    Promise.all(addPromises)
+    axios.post('http://localhost:5000/api/add_friend_to_group', {
+      group_id: selectedGroup.id,
+      friend_ids: selectedFriends
+    })
       .then(() => {
         setShowAddMembersModal(false);
         setSelectedFriends([]);
@@ -202,15 +224,12 @@ const Chats = () => {
         console.error("Error adding members:", error.response?.data || error.message);
         alert("Failed to add members: " + (error.response?.data?.error || "Unknown error"));
       });
-  }, [currentUserId, fetchGroupMembers, selectedFriends, selectedGroup]);
+  }, [fetchGroupMembers, selectedFriends, selectedGroup]);
 
   const leaveGroup = useCallback((groupId) => {
     if (!groupId) return;
     
-    axios.post('http://localhost:5000/api/leave_group', { 
-      group_id: groupId,
-      user_id: currentUserId 
-    })
+    axios.post('http://localhost:5000/api/leave_group', { group_id: groupId })
       .then(() => {
         setGroups(prevGroups => {
           const updatedGroups = prevGroups.filter(group => group.id !== groupId);
@@ -229,7 +248,7 @@ const Chats = () => {
         console.error("Error leaving group:", error.response?.data || error.message);
         alert("Failed to leave group: " + (error.response?.data?.error || "Unknown error"));
       });
-  }, [currentUserId, selectedGroup]);
+  }, [selectedGroup]);
 
   // Helper Functions
   const toggleFriendSelection = useCallback((friendId) => {
@@ -295,7 +314,7 @@ const Chats = () => {
               <div 
                 key={group.id}
                 className={`group-item ${selectedGroup?.id === group.id ? 'active' : ''}`}
-                onClick={() => setSelectedGroup(group)}
+                onClick={() => openGroup(group)}
               >
                 <div className="group-avatar">
                   {getInitial(group.name)}
@@ -306,9 +325,16 @@ const Chats = () => {
                     <span className="tooltip-text">{group.name}</span>
                   </div>
                   <p className="group-message">
-                    {group.last_message || "No messages yet"}
+                    {activity[group.id]?.last_message_preview
+                      ? `${activity[group.id].last_sender}: ${activity[group.id].last_message_preview}`
+                      : "No messages yet"}
                   </p>
                 </div>
+                {activity[group.id]?.unread_count > 0 && selectedGroup?.id !== group.id && (
+                  <span className="unread-badge">
+                    {activity[group.id].unread_count > 99 ? '99+' : activity[group.id].unread_count}
+                  </span>
+                )}
                 <div className="group-actions">
                   <button 
                     className="action-btn info"
@@ -358,7 +384,7 @@ const Chats = () => {
           <ChatRoom
             groupId={selectedGroup.id}
             groupName={selectedGroup.name}
-            onBack={() => setSelectedGroup(null)}
+            onBack={closeGroup}
           />
         </div>
       );
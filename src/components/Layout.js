@@ -16,6 +16,7 @@ import {
   FaUserFriends
 } from 'react-icons/fa';
 import axios from 'axios';
+import { syncState, listFriendRequests } from '../syncStore';
 import './styles/Layout.css';
 
 const Layout = ({ children }) => {
@@ -52,10 +53,9 @@ const Layout = ({ children }) => {
   const fetchFriendRequests = () => {
     if (!user?.user_id) return;
     
-    axios
-      .get(`http://localhost:5000/api/friend_requests/${user.user_id}`)
-      .then((res) => {
-        setFriendRequests(res.data.friend_requests || []);
+    syncState(user.user_id)
+      .then((state) => {
+        setFriendRequests(listFriendRequests(state));
       })
       .catch((err) => console.error(err));
   };
@@ -126,7 +126,7 @@ const Layout = ({ children }) => {
     setFriendSearchMessage("Searching...");
     
     axios
-      .get(`http://localhost:5000/api/users?search=${encodeURIComponent(friendSearchQuery)}&current_user_id=${user.user_id}`)
+      .get(`http://localhost:5000/api/users?search=${encodeURIComponent(friendSearchQuery)}`)
       .then((res) => {
         setFriendSearchResults(res.data.users || []);
         setFriendSearchMessage(
@@ -149,7 +149,6 @@ const Layout = ({ children }) => {
     
     axios
       .post('http://localhost:5000/api/send_friend_request', {
-        user_id: user.user_id,
         friend_id: friendId,
       })
       .then((res) => {
@@ -1,6 +1,6 @@
 import React, { useState, useContext } from 'react';
 import { Link } from 'react-router-dom';
-import { AuthContext } from './AuthContext';
+import { AuthContext, setSessionToken } from './AuthContext';
 import { useNavigate } from 'react-router-dom';
 import './styles/Login.css';
 
@@ -35,6 +35,7 @@ function Login() {
       
       if (data.success) {
         localStorage.setItem('user', JSON.stringify(data.user));
+        setSessionToken(data.token);
         setUser(data.user); // Set user in context
         navigate('/home'); // Navigate to home
       } else {
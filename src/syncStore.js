@@ -0,0 +1,126 @@
+import axios from 'axios';
+
+// Local copy of the user's groups, members, friends, friend requests and events,
+// kept current with /api/sync so navigation only downloads what changed.
+const API_URL = 'http://localhost:5000/api/sync';
+const STORAGE_PREFIX = 'tripsync_sync_';
+
+const stores = {};
+const inFlight = {};
+
+const emptyState = () => ({
+  token: null,
+  groups: {},
+  members: {},
+  friends: {},
+  friendRequests: {},
+  events: {},
+});
+
+const loadState = (userId) => {
+  if (!stores[userId]) {
+    try {
+      stores[userId] = JSON.parse(localStorage.getItem(STORAGE_PREFIX + userId)) || emptyState();
+    } catch (e) {
+      stores[userId] = emptyState();
+    }
+  }
+  return stores[userId];
+};
+
+const saveState = (userId, state) => {
+  stores[userId] = state;
+  try {
+    localStorage.setItem(STORAGE_PREFIX + userId, JSON.stringify(state));
+  } catch (e) {
+    // Storage full or unavailable: the in-memory copy still works for this session
+  }
+};
+
+const memberKey = (member) => `${member.group_id}:${member.user_id}`;
+
+const applyChanges = (state, data) => {
+  const next = data.full ? emptyState() : { ...state };
+  next.groups = { ...next.groups };
+  next.members = { ...next.members };
+  next.friends = { ...next.friends };
+  next.friendRequests = { ...next.friendRequests };
+  next.events = { ...next.events };
+
+  data.groups.upserted.forEach(group => { next.groups[group.id] = group; });
+  data.groups.deleted.forEach(groupId => {
+    delete next.groups[groupId];
+    // Without the group the user no longer sees its members or events
+    Object.keys(next.members).forEach(key => {
+      if (next.members[key].group_id === groupId) delete next.members[key];
+    });
+    Object.keys(next.events).forEach(key => {
+      if (next.events[key].group_id === groupId) delete next.events[key];
+    });
+  });
+
+  data.members.upserted.forEach(member => { next.members[memberKey(member)] = member; });
+  data.members.deleted.forEach(member => { delete next.members[memberKey(member)]; });
+
+  data.friends.upserted.forEach(friend => { next.friends[friend.user_id] = friend; });
+  data.friends.deleted.forEach(userId => { delete next.friends[userId]; });
+
+  data.friend_requests.upserted.forEach(request => { next.friendRequests[request.id] = request; });
+  data.friend_requests.deleted.forEach(requestId => { delete next.friendRequests[requestId]; });
+
+  data.events.upserted.forEach(event => { next.events[event.event_id] = event; });
+  data.events.deleted.forEach(eventId => { delete next.events[eventId]; });
+
+  next.token = data.token;
+  return next;
+};
+
+const runSync = async (userId) => {
+  let state = loadState(userId);
+  for (;;) {
+    const params = state.token ? { since: state.token } : {};
+
+    let response;
+    try {
+      response = await axios.get(API_URL, { params });
+    } catch (error) {
+      if (error.response?.status === 410 && state.token) {
+        // Token older than the retained change log: start over from a snapshot
+        state = emptyState();
+        continue;
+      }
+      throw error;
+    }
+
+    state = applyChanges(state, response.data);
+    if (!response.data.has_more) break;
+  }
+  saveState(userId, state);
+  return state;
+};
+
+// Concurrent callers (e.g. Layout and Chats mounting together) share one request
+export const syncState = (userId) => {
+  if (!inFlight[userId]) {
+    inFlight[userId] = runSync(userId).finally(() => { delete inFlight[userId]; });
+  }
+  return inFlight[userId];
+};
+
+export const clearSyncState = (userId) => {
+  delete stores[userId];
+  localStorage.removeItem(STORAGE_PREFIX + userId);
+};
+
+export const listGroups = (state) =>
+  Object.values(state.groups).sort((a, b) => a.id - b.id);
+
+export const listGroupMembers = (state, groupId) =>
+  Object.values(state.members)
+    .filter(member => member.group_id === groupId)
+    .sort((a, b) => `${a.first_name} ${a.last_name}`.localeCompare(`${b.first_name} ${b.last_name}`));
+
+export const listFriends = (state) => Object.values(state.friends);
+
+export const listFriendRequests = (state) =>
+  Object.values(state.friendRequests).sort((a, b) => a.id - b.id);
@@ -0,0 +1,214 @@
+"""Serving the React production build.
+
+The build directory is scanned once at startup into a manifest of
+path -> Asset, so a request for a file is a dict lookup rather than a stat.
+Compressible files get ``.br``/``.gz`` siblings (written at startup or with
+``python -m static_assets build``) that are sent as-is to clients accepting
+them. Content-hashed files (``static/js/main.1a2b3c4d.js``) never change
+under the same name and are cached by browsers for a year, so after the
+first visit only ``index.html`` is requested again, and that is answered from
+memory, usually with a 304.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # optional, .br variants are only written when it is installed
+    brotli = None
+
+INDEX = 'index.html'
+
+# react-scripts names bundles and media <name>.<8+ hex chars>[.chunk].<ext>
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}(\.chunk)?\.[A-Za-z0-9]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=3600'
+REVALIDATE = 'no-cache'
+
+# Preferred first; the suffix is the sibling file holding that encoding
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.css', '.json', '.map', '.svg', '.txt', '.ico', '.xml', '.webmanifest'}
+MIN_COMPRESS_SIZE = 1024
+
+
+class Asset:
+    def __init__(self, path, file, size, mtime, etag, mimetype, cache_control, variants):
+        self.path = path
+        self.file = file
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.variants = variants  # encoding -> file
+
+
+def _digest(file):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _available_encodings():
+    return [(encoding, suffix) for encoding, suffix in ENCODINGS if encoding != 'br' or brotli is not None]
+
+
+def precompress(root, min_size=MIN_COMPRESS_SIZE):
+    """Write missing or outdated .br/.gz siblings for compressible files; returns how many were written."""
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            file = os.path.join(dirpath, name)
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS or os.path.getsize(file) < min_size:
+                continue
+            data = None
+            for encoding, suffix in _available_encodings():
+                target = file + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(file):
+                    continue
+                if data is None:
+                    with open(file, 'rb') as f:
+                        data = f.read()
+                encoded = _compress(data, encoding)
+                if len(encoded) >= len(data):
+                    continue
+                # Several workers may start at once: write aside and rename into place
+                tmp = f"{target}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(encoded)
+                os.replace(tmp, target)
+                written += 1
+    return written
+
+
+def build_manifest(root):
+    manifest = {}
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(suffixes) or name.endswith('.tmp'):
+                continue
+            file = os.path.join(dirpath, name)
+            path = os.path.relpath(file, root).replace(os.sep, '/')
+            stat = os.stat(file)
+
+            if path == INDEX:
+                cache_control = REVALIDATE
+            elif HASHED_NAME.search(name):
+                cache_control = IMMUTABLE
+            else:
+                cache_control = SHORT_LIVED
+
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                sibling = file + suffix
+                if os.path.isfile(sibling) and os.path.getmtime(sibling) >= stat.st_mtime:
+                    variants[encoding] = sibling
+
+            manifest[path] = Asset(
+                path=path,
+                file=file,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                etag=_digest(file),
+                mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                cache_control=cache_control,
+                variants=variants,
+            )
+    return manifest
+
+
+def _accepted_encoding(variants):
+    for encoding, _ in ENCODINGS:
+        if encoding in variants and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+class StaticAssets:
+    """The build directory's manifest, plus index.html (and its encodings) held in memory."""
+
+    def __init__(self, root, precompress_on_start=True):
+        self.root = root
+        self.manifest = {}
+        self.index = None
+        self.index_bodies = {}
+        if os.path.isdir(root):
+            if precompress_on_start:
+                try:
+                    precompress(root)
+                except OSError as err:  # read-only deploys ship the variants with the build
+                    print("Static precompression skipped:", err)
+            self.load()
+
+    def load(self):
+        self.manifest = build_manifest(self.root)
+        self.index = self.manifest.get(INDEX)
+        self.index_bodies = {}
+        if self.index is not None:
+            with open(self.index.file, 'rb') as f:
+                body = f.read()
+            self.index_bodies[None] = body
+            for encoding, _ in _available_encodings():
+                self.index_bodies[encoding] = _compress(body, encoding)
+            self.index.variants = {encoding: None for encoding in self.index_bodies if encoding}
+
+    def _headers(self, response, asset, encoding):
+        response.headers['Cache-Control'] = asset.cache_control
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+
+    def send(self, asset):
+        encoding = _accepted_encoding(asset.variants)
+        file = asset.variants[encoding] if encoding else asset.file
+        # Each encoding is a different byte sequence, so it gets its own strong ETag
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+        response = send_file(
+            file, mimetype=asset.mimetype, etag=etag, last_modified=asset.mtime, max_age=None, conditional=True,
+        )
+        self._headers(response, asset, encoding)
+        return response
+
+    def send_index(self):
+        if self.index is None:
+            return {'error': 'Frontend build not found'}, 404
+        encoding = _accepted_encoding(self.index.variants)
+        response = Response(self.index_bodies[encoding], mimetype='text/html')
+        response.set_etag(f"{self.index.etag}-{encoding}" if encoding else self.index.etag)
+        response.last_modified = self.index.mtime
+        self._headers(response, self.index, encoding)
+        return response.make_conditional(request, accept_ranges=True)
+
+    def serve(self, path):
+        """The file at ``path``, or index.html so client-side routes resolve."""
+        asset = self.manifest.get(path)
+        if asset is not None and asset is not self.index:
+            return self.send(asset)
+        # A missing bundle (e.g. a chunk from the previous deploy) must not be answered with HTML
+        if path.startswith('static/'):
+            return {'error': 'Not found'}, 404
+        return self.send_index()
+
+
+if __name__ == '__main__':
+    # python -m static_assets [build dir]: write the .br/.gz variants after `npm run build`
+    root = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    print(f"{precompress(root)} compressed variants written under {root}")
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Sessions need a secret shared by every worker; the tests sign with this one
+os.environ.setdefault('TRIPSYNC_SESSION_SECRET', 'test-session-secret')
+# No background job workers or index loads against a database the tests do not have
+os.environ.setdefault('TRIPSYNC_JOB_WORKERS', '0')
+os.environ.setdefault('TRIPSYNC_SEARCH_WARMUP', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
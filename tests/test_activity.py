@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import activity
+
+
+class RecordingCursor:
+    """Records statements and answers SELECTs from a queue of canned results."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+        self.batches = []
+
+    def execute(self, statement, params=()):
+        self.statements.append((' '.join(statement.split()), params))
+
+    def executemany(self, statement, rows):
+        self.batches.append((' '.join(statement.split()), list(rows)))
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+
+def message(id, group_id, sender, text='hi'):
+    return {'id': id, 'group_id': group_id, 'sender': sender, 'message': text, 'created_at': datetime(2025, 1, 1)}
+
+
+def test_record_messages_numbers_messages_after_the_stored_count():
+    cursor = RecordingCursor([{'group_id': 1, 'message_count': 10}])
+    activity.record_messages(cursor, [
+        message(12, 1, 'bob'), message(11, 1, 'ann'), message(13, 1, 'ann', 'x' * 500), message(20, 2, 'cat'),
+    ])
+    (_, activity_rows), (_, read_rows) = cursor.batches
+    assert activity_rows == [
+        (1, 13, 13, 'ann', 'x' * activity.PREVIEW_LENGTH, datetime(2025, 1, 1)),
+        # A group with no activity row yet starts counting from zero
+        (2, 1, 20, 'cat', 'hi', datetime(2025, 1, 1)),
+    ]
+    # Senders have read up to their own latest message
+    assert sorted(read_rows) == [('ann', 1, 13, 13), ('bob', 1, 12, 12), ('cat', 2, 1, 20)]
+    assert cursor.statements[0][1] == [1, 2] and cursor.statements[0][0].endswith('FOR UPDATE')
+
+
+def test_mark_read_defaults_to_the_latest_message():
+    cursor = RecordingCursor({'message_count': 8, 'last_message_id': 40}, {'read_count': 8})
+    assert activity.mark_read(cursor, 1, 'ann') == 0
+    assert cursor.statements[1][1] == ('ann', 1, 8, 40)
+
+
+def test_mark_read_leaves_newer_messages_unread():
+    cursor = RecordingCursor({'message_count': 8, 'last_message_id': 40}, {'newer': 3}, {'read_count': 5})
+    assert activity.mark_read(cursor, 1, 'ann', last_read_id=30) == 3
+    assert cursor.statements[1][1] == (1, 30, activity.MARK_READ_SCAN_LIMIT)
+    assert cursor.statements[2][1] == ('ann', 1, 5, 30)
+
+
+def test_mark_read_in_an_empty_group():
+    cursor = RecordingCursor({'message_count': 0, 'last_message_id': None})
+    assert activity.mark_read(cursor, 1, 'ann') == 0
+    assert len(cursor.statements) == 1
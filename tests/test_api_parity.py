@@ -0,0 +1,244 @@
+"""The same API requests against both serving modes: the Flask app and asgi.application.
+
+Request validation runs everywhere. The cases that read and write data need a
+scratch MySQL database: set TRIPSYNC_DB_NAME (and TRIPSYNC_DB_HOST/USER/PASSWORD)
+and TRIPSYNC_TEST_DATABASE to the same name to run them. The schema is migrated
+and the rows they create are removed afterwards.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('mysql.connector')
+pytest.importorskip('quart')
+pytest.importorskip('quart_cors')
+pytest.importorskip('aiomysql')
+pytest.importorskip('asgiref')
+
+import App
+import asgi
+from archive import MessageArchive, archive_group
+
+
+async def _call_asgi(method, path, body, headers):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    finished = asyncio.Event()
+    response = {'status': None, 'body': b''}
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+            if not message.get('more_body'):
+                finished.set()
+
+    await asgi.application(scope, receive, send)
+    return response['status'], response['body']
+
+
+class FlaskMode:
+    name = 'flask'
+
+    def request(self, method, path, body=None, headers=None):
+        response = App.app.test_client().open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, json.loads(response.get_data() or b'null')
+
+
+class AsgiMode:
+    name = 'asgi'
+
+    def __init__(self, lifespan=False):
+        self.lifespan = lifespan
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        raw = b''
+        if body is not None:
+            raw = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        async def run():
+            if not self.lifespan:
+                return await _call_asgi(method, path, raw, headers)
+            # Opens and closes the aiomysql pool around the request
+            async with asgi.quart_app.test_app():
+                return await _call_asgi(method, path, raw, headers)
+
+        status, data = asyncio.run(run())
+        return status, json.loads(data or b'null')
+
+
+def both(method, path, body=None, headers=None, lifespan=False):
+    """The (status, JSON) pair from each mode, asserting they are identical."""
+    flask_result = FlaskMode().request(method, path, body, headers)
+    asgi_result = AsgiMode(lifespan).request(method, path, body, headers)
+    assert flask_result == asgi_result
+    return flask_result
+
+
+def _bearer(user_id=1, username='alice'):
+    return {'Authorization': f'Bearer {App.session_tokens.issue(user_id, username)}'}
+
+
+@pytest.mark.parametrize('method, path, body, signed_in, status', [
+    ('GET', '/api/group_messages/1', None, False, 401),
+    ('GET', '/api/group_messages/abc', None, True, 404),
+    ('GET', '/api/group_messages/1?limit=x', None, True, 400),
+    ('GET', '/api/group_messages/1?limit=0', None, True, 400),
+    ('GET', '/api/group_messages/1?before=5&after=2', None, True, 400),
+    ('GET', '/api/group_messages/1?before=x', None, True, 400),
+    ('GET', '/api/group_messages/1?after=', None, True, 400),
+    ('GET', '/api/group_messages/1?after=-1', None, True, 400),
+    ('GET', '/api/group_messages/1/stream', None, False, 401),
+    ('GET', '/api/group_messages/1/stream?after=x', None, True, 400),
+    ('GET', '/api/get_groups', None, False, 401),
+    ('DELETE', '/api/delete_group/1', None, False, 401),
+    ('DELETE', '/api/delete_group/1?user_id=2', None, True, 403),
+    ('POST', '/api/send_message', {'group_id': 1}, True, 400),
+    ('POST', '/api/send_message', {'group_id': 'x', 'message': 'hi'}, True, 400),
+    ('POST', '/api/send_message', {'group_id': 1, 'message': 'hi', 'client_msg_id': 'x' * 65}, True, 400),
+])
+def test_request_validation_matches(method, path, body, signed_in, status):
+    assert both(method, path, body, _bearer() if signed_in else None)[0] == status
+
+
+def test_sessions_are_checked_the_same_way():
+    bearer = _bearer()
+    assert both('GET', '/api/get_groups?user_id=2', headers=bearer)[0] == 403
+    assert both('POST', '/api/send_message', {'group_id': 1, 'sender': 'bob', 'message': 'hi'}, bearer)[0] == 403
+    assert both('GET', '/api/get_groups', headers={'Authorization': 'Bearer forged'})[0] == 401
+
+
+class _ExhaustedPool:
+    async def acquire(self):
+        await asyncio.sleep(60)
+
+
+def test_native_routes_answer_503_when_the_pool_is_exhausted(monkeypatch):
+    import metrics
+
+    monkeypatch.setattr(asgi, '_pool', _ExhaustedPool())
+    monkeypatch.setattr(asgi, 'POOL_TIMEOUT', 0.01)
+    status, body = AsgiMode().request('GET', '/api/get_groups', headers=_bearer())
+    assert status == 503
+    assert body == {'error': 'Server busy, please retry'}
+    assert any(labels == ('/api/get_groups', 'GET', '503') for labels in metrics.request_duration._series)
+
+
+requires_database = pytest.mark.skipif(
+    not os.environ.get('TRIPSYNC_TEST_DATABASE')
+    or os.environ.get('TRIPSYNC_TEST_DATABASE') != App.db_config['database'],
+    reason='set TRIPSYNC_TEST_DATABASE and TRIPSYNC_DB_NAME to a scratch database',
+)
+
+
+@pytest.fixture(scope='module')
+def chat(tmp_path_factory):
+    import db
+    import migrations
+
+    with db.connection() as conn:
+        migrations.migrate(conn, log=lambda line: None)
+
+    suffix = uuid.uuid4().hex[:8]
+    names = [f'alice_{suffix}', f'bob_{suffix}']
+    with db.transaction(dictionary=True) as cursor:
+        for name in names:
+            cursor.execute(
+                "INSERT INTO users (first_name, last_name, username, email, password) VALUES (%s, %s, %s, %s, %s)",
+                (name, 'Test', name, f'{name}@example.com', 'secret'),
+            )
+        cursor.execute("SELECT user_id, username FROM users WHERE username IN (%s, %s)", names)
+        users = {row['username']: row['user_id'] for row in cursor.fetchall()}
+        cursor.execute("INSERT INTO chat_groups (name, created_by) VALUES (%s, %s)", (f'parity {suffix}', users[names[0]]))
+        group_id = cursor.lastrowid
+        cursor.executemany("INSERT INTO group_members (group_id, username) VALUES (%s, %s)",
+                           [(group_id, name) for name in names])
+
+    # Two archived messages followed by three hot ones, so reads have to merge both sources
+    archive = MessageArchive(str(tmp_path_factory.mktemp('archive')))
+    previous_archive = App.message_archive
+    App.message_archive = archive
+    for text in ('one', 'two'):
+        App.message_ingestor.send(group_id, names[0], text, timeout=10)
+    with db.connection() as conn:
+        archive_group(conn, archive, group_id, datetime.now() + timedelta(days=1))
+    for text in ('three', 'four', 'five'):
+        App.message_ingestor.send(group_id, names[1], text, timeout=10)
+
+    yield {'group_id': group_id, 'users': users, 'names': names}
+
+    App.message_archive = previous_archive
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM chat_groups WHERE id = %s", (group_id,))
+        cursor.execute("DELETE FROM users WHERE username IN (%s, %s)", names)
+    App.identity.invalidate_group(group_id)
+
+
+@requires_database
+def test_full_history_is_merged_in_id_order(chat):
+    name = chat['names'][0]
+    signed_in = _bearer(chat['users'][name], name)
+    status, messages = both('GET', f"/api/group_messages/{chat['group_id']}", headers=signed_in, lifespan=True)
+    assert status == 200
+    assert [message['message'] for message in messages] == ['one', 'two', 'three', 'four', 'five']
+    ids = [message['id'] for message in messages]
+    assert ids == sorted(ids)
+
+
+@requires_database
+def test_windows_match_across_the_archive_boundary(chat):
+    name = chat['names'][0]
+    signed_in = _bearer(chat['users'][name], name)
+    base = f"/api/group_messages/{chat['group_id']}"
+    status, latest = both('GET', f"{base}?limit=2", headers=signed_in, lifespan=True)
+    assert status == 200 and latest['has_more']
+    assert [message['message'] for message in latest['messages']] == ['four', 'five']
+
+    oldest_shown = latest['messages'][0]['id']
+    _, older = both('GET', f"{base}?limit=3&before={oldest_shown}", headers=signed_in, lifespan=True)
+    assert [message['message'] for message in older['messages']] == ['one', 'two', 'three']
+    assert not older['has_more']
+
+    _, newer = both('GET', f"{base}?limit=10&after={older['messages'][0]['id']}", headers=signed_in, lifespan=True)
+    assert [message['message'] for message in newer['messages']] == ['two', 'three', 'four', 'five']
+
+
+@requires_database
+def test_group_list_and_membership_match(chat):
+    name = chat['names'][0]
+    status, result = both('GET', '/api/get_groups', headers=_bearer(chat['users'][name], name), lifespan=True)
+    assert status == 200
+    group = next(group for group in result['groups'] if group['id'] == chat['group_id'])
+    assert group['last_message_preview'] == 'five'
+
+    outsider = both('GET', f"/api/group_messages/{chat['group_id']}", headers=_bearer(0, 'nobody'), lifespan=True)
+    assert outsider[0] == 404
+
+
+@requires_database
+def test_only_the_creator_can_delete_a_group(chat):
+    member = chat['names'][1]
+    status, result = both('DELETE', f"/api/delete_group/{chat['group_id']}",
+                          headers=_bearer(chat['users'][member], member))
+    assert (status, result) == (403, {'error': 'Only the group creator can delete it'})
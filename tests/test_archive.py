@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask')
+
+import archive
+from archive import MessageArchive
+
+
+def rows(first, last):
+    start = datetime(2025, 1, 1, 12, 0)
+    return [{'id': i, 'sender': f'user{i % 3}', 'message': f'message {i} é', 'timestamp': start + timedelta(minutes=i),
+             'client_msg_id': f'c{i}'} for i in range(first, last + 1)]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Small blocks so a few hundred messages span several of them
+    monkeypatch.setattr(archive, 'BLOCK_MESSAGES', 16)
+    return MessageArchive(str(tmp_path))
+
+
+def test_messages_round_trip_through_segments(store):
+    store.append(7, rows(1, 40))
+    store.append(7, rows(41, 100))
+    messages = list(store.iter_messages(7))
+    assert [m['id'] for m in messages] == list(range(1, 101))
+    assert messages[0] == {'id': 1, 'sender': 'user1', 'message': 'message 1 é',
+                           'timestamp': '2025-01-01T12:01:00', 'client_msg_id': 'c1'}
+    # A fresh reader (another process) decodes the same files
+    assert list(MessageArchive(store.root).iter_messages(7)) == messages
+
+
+def test_floor_is_the_highest_archived_id(store):
+    assert store.floor(7) == 0
+    store.append(7, rows(1, 20))
+    assert store.floor(7) == 20
+    store.append(7, rows(21, 50))
+    assert store.floor(7) == 50
+    assert store.floor(8) == 0
+
+
+def test_windows_cross_block_boundaries(store):
+    store.append(7, rows(1, 100))
+    assert [m['id'] for m in store.read_after(7, 30, 5)] == [31, 32, 33, 34, 35]
+    assert [m['id'] for m in store.read_after(7, None, 3)] == [1, 2, 3]
+    assert store.read_after(7, 100, 5) == []
+    assert [m['id'] for m in store.read_before(7, 18, 4)] == [17, 16, 15, 14]
+    assert [m['id'] for m in store.read_before(7, None, 2)] == [100, 99]
+    assert store.read_before(7, 1, 5) == []
+
+
+def test_an_unindexed_block_is_replaced(store):
+    store.append(7, rows(1, 10))
+    # A run that died after writing segment bytes but before the index record
+    seg_path, _ = store._paths(7)
+    with open(seg_path, 'ab') as seg:
+        seg.write(b'partial block')
+    store.append(7, rows(11, 20))
+    assert [m['id'] for m in MessageArchive(store.root).iter_messages(7)] == list(range(1, 21))
+
+
+def test_drop_removes_the_group(store):
+    store.append(7, rows(1, 10))
+    list(store.iter_messages(7))
+    store.drop(7)
+    assert store.floor(7) == 0 and list(store.iter_messages(7)) == []
@@ -0,0 +1,67 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import batch
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+
+    @app.route('/api/echo/<int:value>')
+    def echo(value):
+        return flask.jsonify({'value': value, 'q': flask.request.args.get('q'),
+                              'auth': flask.request.headers.get('Authorization')})
+
+    @app.route('/api/text')
+    def text():
+        return 'plain'
+
+    @app.route('/api/broken')
+    def broken():
+        raise RuntimeError("boom")
+
+    @app.route('/api/group_messages/<int:group_id>/stream')
+    def stream_group_messages(group_id):
+        return ''
+
+    batch.init_app(app, max_requests=3, concurrency=2)
+    return app.test_client()
+
+
+def test_responses_come_back_in_request_order(client):
+    response = client.post('/api/batch', json={'requests': [
+        {'id': 'a', 'path': '/api/echo/1?q=x'},
+        {'path': '/api/text'},
+        {'id': 'c', 'path': '/api/echo/3'},
+    ]}, headers={'Authorization': 'Bearer t', 'Accept': 'text/html'})
+    assert response.status_code == 200
+    assert response.get_json()['responses'] == [
+        {'id': 'a', 'status': 200, 'body': {'value': 1, 'q': 'x', 'auth': 'Bearer t'}},
+        {'id': 1, 'status': 200, 'body': 'plain'},
+        {'id': 'c', 'status': 200, 'body': {'value': 3, 'q': None, 'auth': 'Bearer t'}},
+    ]
+
+
+def test_a_failing_sub_request_does_not_fail_the_batch(client):
+    responses = client.post('/api/batch', json={'requests': [
+        {'path': '/api/broken'}, {'path': '/api/echo/2'},
+    ]}).get_json()['responses']
+    assert [item['status'] for item in responses] == [500, 200]
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'requests': []},
+    {'requests': [{'path': '/api/echo/1'}] * 4},
+    {'requests': [{'path': '/api/echo/1', 'method': 'POST'}]},
+    {'requests': [{'path': 'http://elsewhere/api/echo/1'}]},
+    {'requests': [{'path': '/static/app.js'}]},
+    {'requests': [{'path': '/api/missing'}]},
+    {'requests': [{'path': '/api/group_messages/1/stream'}]},
+    {'requests': [{'path': '/api/batch'}]},
+    {'requests': ['/api/echo/1']},
+])
+def test_invalid_batches_are_rejected(client, body):
+    assert client.post('/api/batch', json=body).status_code == 400
@@ -0,0 +1,103 @@
+import json
+import threading
+import types
+
+import pytest
+
+import broker
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.patterns = []
+
+    def psubscribe(self, pattern):
+        self.patterns.append(pattern)
+        self.server.subscriptions += 1
+
+    def listen(self):
+        if self.server.subscriptions == 1:
+            raise FakeRedisModule.ConnectionError("connection reset")
+        yield {'channel': b'tripsync:group:1', 'data': json.dumps({'id': 1}).encode()}
+        self.server.delivered.wait()
+        yield from ()
+
+    def close(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.subscriptions = 0
+        self.delivered = threading.Event()
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakeRedisModule:
+    class ConnectionError(Exception):
+        pass
+
+    class TimeoutError(Exception):
+        pass
+
+    server = FakeRedis()
+    Redis = types.SimpleNamespace(from_url=lambda url: FakeRedisModule.server)
+
+
+def test_redis_backend_resubscribes_after_the_connection_drops(monkeypatch):
+    monkeypatch.setattr(broker, 'redis', FakeRedisModule)
+    server = FakeRedisModule.server = FakeRedis()
+    received = []
+
+    def deliver(channel, message):
+        received.append((channel, message))
+        server.delivered.set()
+
+    resynced = threading.Event()
+    backend = broker.RedisBackend('redis://fake', min_backoff=0.01)
+    backend.start(deliver, resynced.set)
+    try:
+        assert server.delivered.wait(5)
+    finally:
+        backend.close()
+    assert server.subscriptions >= 2
+    assert resynced.is_set() and backend.reconnects >= 1
+    assert received[0] == ('group:1', {'id': 1})
+
+
+def test_resync_evicts_local_subscribers():
+    message_broker = broker.Broker()
+    subscription = message_broker.subscribe('group:1')
+    message_broker._evict_all()
+    with pytest.raises(broker.SubscriptionClosed):
+        subscription.get(timeout=0)
+    assert message_broker.stats()['subscribers'] == 0
+
+
+class RecordingBackend(broker.LocalBackend):
+    def __init__(self):
+        self.starts = 0
+
+    def start(self, deliver, resync=None):
+        self.starts += 1
+        super().start(deliver, resync)
+
+
+def test_the_backend_starts_once_per_process(monkeypatch):
+    backend = RecordingBackend()
+    message_broker = broker.Broker(backend)
+    # Building the broker (at import) starts nothing
+    assert backend.starts == 0
+
+    subscription = message_broker.subscribe('group:1')
+    message_broker.publish('group:1', {'id': 1})
+    assert backend.starts == 1
+    assert subscription.get(timeout=0) == {'id': 1}
+
+    # A forked worker inherits the broker but not the listener thread
+    monkeypatch.setattr(broker.os, 'getpid', lambda: -1)
+    message_broker.publish('group:1', {'id': 2})
+    assert backend.starts == 2
@@ -0,0 +1,94 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from cache import RedisCache, ResponseCache, TTLCache
+
+
+class FakeRedis:
+    """Enough of redis.Redis for RedisCache: values are stored as bytes, like the real client."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def incr(self, key):
+        value = int(self.data.get(key, b'0')) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.data) if key.startswith(pattern.rstrip('*'))]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def redis_backend():
+    backend = RedisCache.__new__(RedisCache)
+    backend.ttl = 60
+    backend.prefix = 'test:'
+    backend._client = FakeRedis()
+    return backend
+
+
+def make_app(cache, counter):
+    app = flask.Flask(__name__)
+
+    @app.route('/items')
+    @cache.cached('catalog')
+    def items():
+        counter['calls'] += 1
+        return flask.jsonify({'version': counter['calls']})
+
+    return app
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('c') == 3
+    cache.set('d', 4, ttl=0)
+    assert cache.get('d') is None
+
+
+@pytest.mark.parametrize('backend_factory', [lambda: TTLCache(), redis_backend])
+def test_invalidate_then_get(backend_factory):
+    cache = ResponseCache(backend_factory())
+    counter = {'calls': 0}
+    client = make_app(cache, counter).test_client()
+
+    first = client.get('/items')
+    assert first.status_code == 200
+    assert client.get('/items').get_json() == first.get_json()
+    assert counter['calls'] == 1
+
+    cache.invalidate('catalog')
+    after = client.get('/items')
+    assert after.status_code == 200
+    assert after.get_json() == {'version': 2}
+
+
+def test_redis_generation_is_read_raw():
+    backend = redis_backend()
+    cache = ResponseCache(backend)
+    assert cache._generation('catalog') == 0
+    cache.invalidate('catalog')
+    cache.invalidate('catalog')
+    assert cache._generation('catalog') == 2
+
+
+def test_conditional_request_returns_304():
+    cache = ResponseCache(TTLCache())
+    client = make_app(cache, {'calls': 0}).test_client()
+    etag = client.get('/items').headers['ETag']
+    assert not etag.startswith('W/')
+    assert client.get('/items', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('mysql.connector')
+
+import App
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+    monkeypatch.setattr(App, 'catalog_changed', lambda place_ids=(), city_ids=(): calls.append((place_ids, city_ids)))
+    client = App.app.test_client()
+    client.calls = calls
+    return client
+
+
+def test_hook_is_absent_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(App, 'INTERNAL_TOKEN', None)
+    assert client.post('/api/catalog/changes', json={}).status_code == 404
+    assert client.calls == []
+
+
+def test_hook_rejects_a_wrong_token(client, monkeypatch):
+    monkeypatch.setattr(App, 'INTERNAL_TOKEN', 'secret')
+    assert client.post('/api/catalog/changes', json={}).status_code == 403
+    response = client.post('/api/catalog/changes', json={}, headers={'X-Internal-Token': 'nope'})
+    assert response.status_code == 403
+    assert client.calls == []
+
+
+def test_hook_invalidates_with_the_token(client, monkeypatch):
+    monkeypatch.setattr(App, 'INTERNAL_TOKEN', 'secret')
+    response = client.post('/api/catalog/changes', json={'place_ids': [3]}, headers={'X-Internal-Token': 'secret'})
+    assert response.status_code == 200
+    assert client.calls == [([3], [])]
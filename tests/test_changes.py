@@ -0,0 +1,38 @@
+import pytest
+
+import changes
+from pagination import InvalidCursor
+
+
+def test_tokens_round_trip():
+    assert changes.decode_token(changes.encode_token(42)) == 42
+
+
+@pytest.mark.parametrize('token', ['', 'not a token', changes.encode_token('x')])
+def test_bad_tokens_are_rejected(token):
+    with pytest.raises(InvalidCursor):
+        changes.decode_token(token)
+
+
+def test_token_stops_before_the_first_unsettled_row():
+    rows = [{'id': 5, 'settled': 1}, {'id': 6, 'settled': 1}, {'id': 9, 'settled': 0}, {'id': 10, 'settled': 1}]
+    assert changes.next_token(4, rows) == (6, False)
+    assert changes.next_token(4, rows[:2]) == (6, True)
+    assert changes.next_token(4, []) == (4, True)
+    # Nothing settled yet: the token stays put and the rows are sent again
+    assert changes.next_token(4, rows[2:]) == (4, False)
+
+
+def test_latest_keeps_the_last_op_per_entity():
+    rows = [
+        {'entity': changes.GROUP, 'entity_id': 1, 'group_id': 1, 'op': changes.UPSERT},
+        {'entity': changes.MEMBER, 'entity_id': 3, 'group_id': 1, 'op': changes.UPSERT},
+        {'entity': changes.MEMBER, 'entity_id': 3, 'group_id': 2, 'op': changes.UPSERT},
+        {'entity': changes.GROUP, 'entity_id': 1, 'group_id': 1, 'op': changes.DELETE},
+        {'entity': changes.MEMBER, 'entity_id': 3, 'group_id': 1, 'op': changes.DELETE},
+    ]
+    assert changes.latest(rows) == {
+        (changes.MEMBER, 2, 3): changes.UPSERT,
+        (changes.GROUP, None, 1): changes.DELETE,
+        (changes.MEMBER, 1, 3): changes.DELETE,
+    }
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+
+import db
+from mysql.connector import errors
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+        self.unread_result = False
+        self.in_transaction = False
+        self.rolled_back = 0
+        self.closed = False
+        self.ping_fails = False
+
+    def ping(self, reconnect=False):
+        if self.ping_fails:
+            raise errors.InterfaceError("gone away")
+
+    def rollback(self):
+        self.rolled_back += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor()
+
+
+class FakeCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, operation, params=None):
+        self.statements.append((operation, params))
+
+
+class FakePool(db.ConnectionPool):
+    def __init__(self, **options):
+        super().__init__({}, **options)
+        self.created = []
+
+    def _connect(self):
+        conn = FakeConnection(len(self.created))
+        self.created.append(conn)
+        return conn
+
+
+def test_closed_connections_are_reused():
+    pool = FakePool(size=2)
+    first = pool.get_connection()
+    raw = first._raw
+    first.close()
+    first.close()  # a second close must not return it twice
+    second = pool.get_connection()
+    assert second._raw is raw and len(pool.created) == 1
+    assert pool.stats()['in_use'] == 1 and pool.stats()['checkouts'] == 2
+
+
+def test_an_open_transaction_is_rolled_back_on_release():
+    pool = FakePool(size=1)
+    conn = pool.get_connection()
+    conn._raw.in_transaction = True
+    conn.close()
+    assert pool.created[0].rolled_back == 1
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool = FakePool(size=1)
+    held = pool.get_connection()
+    with pytest.raises(db.PoolTimeout):
+        pool.get_connection(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+
+    # A waiter is woken by the release
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get_connection(timeout=5)))
+    waiter.start()
+    held.close()
+    waiter.join(5)
+    assert got and got[0]._raw is held._raw
+
+
+def test_stale_connections_are_replaced():
+    pool = FakePool(size=1, ping_after=0)
+    conn = pool.get_connection()
+    conn._raw.ping_fails = True
+    conn.close()
+    fresh = pool.get_connection()
+    assert fresh._raw is pool.created[1] and pool.created[0].closed
+    assert pool.stats()['health_check_failures'] == 1 and pool.stats()['open'] == 1
+
+
+def test_queries_are_reported_to_the_observer():
+    seen = []
+    db.set_observers(on_query=lambda statement, params, seconds: seen.append((statement, params)))
+    try:
+        cursor = FakePool(size=1).get_connection().cursor()
+        cursor.execute("SELECT 1", (2,))
+    finally:
+        db.set_observers()
+    assert seen == [("SELECT 1", (2,))]
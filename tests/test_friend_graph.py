@@ -0,0 +1,79 @@
+import friend_graph
+from friend_graph import FRIENDS, NONE, REQUEST_RECEIVED, REQUEST_SENT, FriendGraph
+
+
+class FakeCursor:
+    """Answers the graph's queries from a list of friends rows and an empty change log."""
+
+    def __init__(self, friends):
+        self.friends = friends
+        self.result = []
+
+    def execute(self, statement, params=()):
+        if statement == friend_graph.LOAD_STATEMENT:
+            self.result = list(self.friends)
+        elif 'FROM friends' in statement:
+            pairs = set(zip(params[::2], params[1::2]))
+            self.result = [row for row in self.friends if (row['user_id'], row['friend_id']) in pairs]
+        elif 'MIN(id)' in statement:
+            self.result = [{'floor': None}]
+        else:
+            self.result = []
+
+    def fetchall(self):
+        result, self.result = self.result, []
+        return result
+
+    def fetchmany(self, size):
+        batch, self.result = self.result[:size], self.result[size:]
+        return batch
+
+
+def accepted(a, b):
+    return {'user_id': a, 'friend_id': b, 'status': 'accepted'}
+
+
+def pending(sender, recipient):
+    return {'user_id': sender, 'friend_id': recipient, 'status': 'pending'}
+
+
+def loaded(rows):
+    graph = FriendGraph()
+    cursor = FakeCursor(rows)
+    graph.ensure_fresh(cursor)
+    return graph, cursor
+
+
+def test_status_from_both_ends():
+    graph, _ = loaded([accepted(1, 2), pending(1, 3)])
+    assert graph.status(1, 2) == graph.status(2, 1) == FRIENDS
+    assert graph.status(1, 3) == REQUEST_SENT
+    assert graph.status(3, 1) == REQUEST_RECEIVED
+    assert graph.status(2, 3) == NONE
+    assert list(graph.friends(1)) == [2]
+
+
+def test_suggestions_count_mutual_friends():
+    # 1 is friends with 2, 3 and 4; 5 shares three of them, 6 shares one
+    graph, _ = loaded([
+        accepted(1, 2), accepted(1, 3), accepted(4, 1),
+        accepted(2, 5), accepted(3, 5), accepted(5, 4),
+        accepted(2, 6),
+        accepted(3, 7), pending(1, 7),
+        accepted(2, 3),
+    ])
+    # Friends (2, 3) and users with a pending request (7) are not suggested
+    assert graph.suggest(1) == [(5, 3), (6, 1)]
+    assert graph.suggest(1, limit=1) == [(5, 3)]
+    assert graph.suggest(99) == []
+
+
+def test_refresh_pair_applies_a_write():
+    rows = [pending(1, 2)]
+    graph, cursor = loaded(rows)
+    rows[0] = accepted(1, 2)
+    graph.refresh_pair(cursor, 2, 1)
+    assert graph.status(1, 2) == FRIENDS and graph.status(2, 1) == FRIENDS
+    rows.clear()
+    graph.refresh_pair(cursor, 1, 2)
+    assert graph.status(1, 2) == NONE and list(graph.friends(2)) == []
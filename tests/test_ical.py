@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from ical import MAX_LINE_OCTETS, escape_text, fold, render_calendar
+
+
+def test_text_is_escaped():
+    assert escape_text('a,b;c\\d\ne') == r'a\,b\;c\\d\ne'
+
+
+def test_long_lines_fold_on_character_boundaries():
+    line = 'DESCRIPTION:' + 'é' * 100
+    folded = fold(line)
+    chunks = folded.split('\r\n ')
+    assert all(len(chunk.rstrip('\r\n').encode('utf-8')) <= MAX_LINE_OCTETS for chunk in chunks)
+    assert ''.join(chunks).rstrip('\r\n') == line
+    assert fold('SHORT') == 'SHORT\r\n'
+
+
+def test_calendar_streams_events():
+    events = iter([
+        {'event_id': 1, 'title': 'Flight, BCN', 'start_date': datetime(2025, 5, 1, 9, 30),
+         'end_date': datetime(2025, 5, 1, 12, 0), 'place_name': 'El Prat', 'city_name': 'Barcelona',
+         'group_name': 'Spain trip'},
+        {'event_id': 2, 'title': 'Dinner', 'start_date': datetime(2025, 5, 1, 20, 0), 'location': 'Tapas bar'},
+    ])
+    parts = list(render_calendar(events, 'Trips', host='example.com'))
+    assert len(parts) == 4
+    text = ''.join(parts)
+    assert text.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n') and text.endswith('END:VCALENDAR\r\n')
+    assert 'UID:event-1@example.com\r\n' in text
+    assert 'DTSTART:20250501T093000\r\nDTEND:20250501T120000\r\n' in text
+    assert 'SUMMARY:Flight\\, BCN\r\n' in text
+    assert 'LOCATION:El Prat\\, Barcelona\r\n' in text
+    assert 'CATEGORIES:Spain trip\r\n' in text
+    assert 'LOCATION:Tapas bar\r\n' in text
+    assert text.count('BEGIN:VEVENT') == 2 and 'DTEND' not in parts[2]
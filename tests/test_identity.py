@@ -0,0 +1,84 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from identity import IdentityCache
+from sessions import Identity
+
+
+class FakeCursor:
+    def __init__(self, users, members):
+        self.users = users
+        self.members = members
+        self.queries = 0
+        self.result = []
+
+    def execute(self, statement, params):
+        self.queries += 1
+        if 'FROM users' in statement:
+            self.result = [{'username': self.users[params[0]]}] if params[0] in self.users else []
+        else:
+            self.result = [{'username': name} for name in self.members.get(params[0], ())]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class SharedGenerations:
+    """Stands in for the RedisCache every worker talks to."""
+
+    def __init__(self):
+        self.values = {}
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def counter(self, key):
+        return self.values.get(key, 0)
+
+
+@pytest.fixture
+def cursor():
+    return FakeCursor({1: 'ann', 2: 'bob'}, {7: ['ann', 'bob']})
+
+
+def test_lookups_are_cached(cursor):
+    cache = IdentityCache()
+    assert cache.username(cursor, 1) == 'ann' and cache.username(cursor, '1') == 'ann'
+    assert cache.username(cursor, 99) is None
+    assert cache.is_member(cursor, 7, 'bob') and not cache.is_member(cursor, 7, 'cat')
+    assert not cache.is_member(cursor, 7, None)
+    assert cursor.queries == 3
+
+
+def test_the_session_names_the_caller_without_a_query(cursor):
+    app = flask.Flask(__name__)
+    with app.test_request_context():
+        flask.g.identity = Identity(2, 'bob-from-token')
+        assert IdentityCache().username(cursor, 2) == 'bob-from-token'
+    assert cursor.queries == 0
+
+
+def test_invalidation_reaches_every_worker_through_the_shared_backend(cursor):
+    shared = SharedGenerations()
+    writer, other = IdentityCache(shared=shared), IdentityCache(shared=shared)
+    assert writer.is_member(cursor, 7, 'bob') and other.is_member(cursor, 7, 'bob')
+
+    cursor.members[7] = ['ann']
+    writer.invalidate_group(7)
+    assert not writer.is_member(cursor, 7, 'bob')
+    assert not other.is_member(cursor, 7, 'bob')
+
+
+def test_without_a_shared_backend_other_workers_wait_for_the_ttl(cursor):
+    writer, other = IdentityCache(), IdentityCache()
+    other.is_member(cursor, 7, 'bob')
+    cursor.members[7] = ['ann']
+    writer.invalidate_group(7)
+    assert other.is_member(cursor, 7, 'bob')
+    other.members.clear()
+    assert not other.is_member(cursor, 7, 'bob')
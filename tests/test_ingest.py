@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from ingest import MessageIngestor, NotAMember, PendingMessage
+
+
+class FakeMessages:
+    """The messages table with its (group_id, client_msg_id) unique key."""
+
+    def __init__(self):
+        self.rows = {}
+        self.inserts = 0
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+
+    def execute(self, statement, params):
+        keys = set(zip(params[::2], params[1::2]))
+        self.result = [row for key, row in self.table.rows.items() if key in keys]
+
+    def executemany(self, statement, params):
+        for group_id, sender, message, client_msg_id in params:
+            self.table.inserts += 1
+            self.table.rows.setdefault((group_id, client_msg_id), {
+                'id': len(self.table.rows) + 1, 'group_id': group_id, 'sender': sender, 'message': message,
+                'client_msg_id': client_msg_id, 'created_at': datetime(2025, 1, 1),
+            })
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def table():
+    return FakeMessages()
+
+
+@pytest.fixture
+def ingestor(table):
+    return MessageIngestor(lambda: table, lambda cursor, group_id, sender: sender != 'mallory')
+
+
+def write(ingestor, *messages):
+    batch = [PendingMessage(*message) for message in messages]
+    ingestor._write(batch)
+    return batch
+
+
+def test_copies_within_a_batch_are_stored_once(ingestor, table):
+    first, again, other = write(ingestor, (1, 'ann', 'hi', 'a'), (1, 'ann', 'hi', 'a'), (1, 'ann', 'yo', 'b'))
+    assert table.inserts == 2 and table.commits == 1
+    assert first.future.result()['id'] == again.future.result()['id'] != other.future.result()['id']
+    assert not first.future.result()['duplicate'] and again.future.result()['duplicate']
+
+
+def test_a_resend_resolves_to_the_stored_row(ingestor, table):
+    (original,) = write(ingestor, (1, 'ann', 'hi', 'a'))
+    (resend,) = write(ingestor, (1, 'ann', 'hi again', 'a'))
+    assert table.inserts == 1
+    assert resend.future.result()['id'] == original.future.result()['id']
+    assert resend.future.result()['message'] == 'hi' and resend.future.result()['duplicate']
+
+
+def test_the_same_client_id_in_another_group_is_a_new_message(ingestor, table):
+    one, two = write(ingestor, (1, 'ann', 'hi', 'a'), (2, 'ann', 'hi', 'a'))
+    assert one.future.result()['id'] != two.future.result()['id']
+
+
+def test_non_members_are_rejected(ingestor, table):
+    (pending,) = write(ingestor, (1, 'mallory', 'hi', 'a'))
+    with pytest.raises(NotAMember):
+        pending.future.result()
+    assert table.inserts == 0
+
+
+def test_send_waits_for_the_writer(ingestor):
+    row = ingestor.send(1, 'ann', 'hi', timeout=5)
+    assert row['client_msg_id'].startswith('srv-') and not row['duplicate']
+    assert ingestor.stats()['messages'] == 1
@@ -0,0 +1,24 @@
+import jobs
+
+
+def test_workers_start_once_per_process(monkeypatch):
+    runner = jobs.JobRunner(lambda: None, workers=2)
+    monkeypatch.setattr(runner, '_work', lambda worker_id: None)
+    assert runner.stats()['workers'] == 0
+
+    runner.start()
+    first = list(runner._threads)
+    runner.start()
+    assert runner._threads == first and len(first) == 2
+
+    # A forked child inherits the thread list but none of the threads
+    monkeypatch.setattr(jobs.os, 'getpid', lambda: -1)
+    runner.start()
+    assert runner._threads != first and len(runner._threads) == 2
+    runner.stop(timeout=1)
+
+
+def test_no_workers_configured():
+    runner = jobs.JobRunner(lambda: None, workers=0)
+    runner.start()
+    assert runner.stats()['workers'] == 0
@@ -0,0 +1,62 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+pytest.importorskip('mysql.connector')
+
+import db
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('t_seconds', 'Test', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, '/a')
+    assert histogram.render() == [
+        '# HELP t_seconds Test',
+        '# TYPE t_seconds histogram',
+        't_seconds_bucket{route="/a",le="0.1"} 1',
+        't_seconds_bucket{route="/a",le="1"} 2',
+        't_seconds_bucket{route="/a",le="+Inf"} 3',
+        't_seconds_sum{route="/a"} 5.55',
+        't_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter('t_total', 'Test', ('route',))
+    counter.inc('a"b\\c')
+    assert counter.render()[-1] == 't_total{route="a\\"b\\\\c"} 1'
+
+
+def test_a_broken_stats_callback_is_skipped():
+    assert metrics.GaugeSet('t', 'Test', lambda: 1 / 0, ['x']).render() == []
+    assert metrics.GaugeSet('t', 'Test', lambda: {'x': 2}, ['x', 'y']).render()[-1] == 't_x 2'
+
+
+def test_parameters_are_described_without_their_values():
+    assert metrics.param_shape((1, 'secret', [1, 2])) == '(int, str[6], list[2])'
+    assert metrics.param_shape([(1, 'a'), (2, 'b')]) == '2 x (int, str[1])'
+    assert metrics.param_shape({'name': 'x'}) == '{name: str[1]}'
+    assert metrics.param_shape(None) == '()'
+
+
+def test_requests_are_recorded_per_route():
+    app = flask.Flask(__name__)
+
+    @app.route('/api/thing/<int:thing_id>')
+    def thing(thing_id):
+        # Stands in for a query through the pool's instrumented cursor
+        db._observers['on_query']("SELECT 1", (thing_id,), 0.5)
+        return flask.jsonify({'id': thing_id})
+
+    metrics.init_app(app, slow_query_seconds=0.2)
+    try:
+        client = app.test_client()
+        client.get('/api/thing/1')
+        client.get('/api/thing/2')
+        text = client.get('/metrics').get_data(as_text=True)
+    finally:
+        db.set_observers()
+    assert 'tripsync_request_duration_seconds_count{route="/api/thing/<int:thing_id>",method="GET",status="200"} 2' in text
+    assert 'tripsync_request_sql_statements_sum{route="/api/thing/<int:thing_id>"} 2' in text
+    assert 'tripsync_slow_queries_total{route="/api/thing/<int:thing_id>"} 2' in text
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_cursors_round_trip_without_padding():
+    values = {'after': 120, 'name': 'Café', 'offset': 0}
+    token = encode_cursor(values)
+    assert '=' not in token and '/' not in token and '+' not in token
+    assert decode_cursor(token) == values
+
+
+def test_datetimes_are_encoded_as_text():
+    assert decode_cursor(encode_cursor({'at': datetime(2025, 5, 1, 9, 30)})) == {'at': '2025-05-01 09:30:00'}
+
+
+@pytest.mark.parametrize('token', ['!!!', 'abc', encode_cursor({'a': 1})[:-2] + '@'])
+def test_malformed_cursors_are_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('mysql.connector')
+
+import App
+from pagination import encode_cursor
+
+
+@pytest.mark.parametrize('token', [
+    'not-base64!',
+    encode_cursor({'name': 'Louvre', 'id': 3}),
+    encode_cursor('Louvre'),
+    encode_cursor(['Louvre']),
+    encode_cursor(['Louvre', 3, 4]),
+    encode_cursor([3, 'Louvre']),
+    encode_cursor(['Louvre', True]),
+])
+def test_malformed_place_cursors_are_rejected(token):
+    # Rejected before any query runs, so no database is needed
+    response = App.app.test_client().get(f'/api/places?per_page=12&cursor={token}')
+    assert response.status_code == 400
+    assert 'Invalid cursor' in response.get_json()['error']
+
+
+def test_place_cursors_round_trip():
+    assert App.decode_place_cursor(encode_cursor(['Louvre', 3])) == ['Louvre', 3]
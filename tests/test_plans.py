@@ -0,0 +1,29 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+pytest.importorskip('mysql.connector')
+
+import db
+from migrations.plans import capture_statements
+
+
+def test_requests_run_without_background_work_and_with_the_session_headers():
+    app = flask.Flask(__name__)
+    app.config['BACKGROUND_WORK'] = True
+    seen = []
+
+    @app.route('/api/things/<int:thing_id>')
+    def thing(thing_id):
+        seen.append((app.config['BACKGROUND_WORK'], flask.request.headers.get('Authorization')))
+        db._observers['on_query']("SELECT * FROM things WHERE id = %s", (thing_id,), 0.0)
+        return {}
+
+    captured = capture_statements(app, ['/api/things/1', '/api/things/2?x=1'], {'Authorization': 'Bearer t'})
+
+    assert seen == [(False, 'Bearer t'), (False, 'Bearer t')]
+    assert [(route, path, params) for route, path, _, params in captured] == [
+        ('/api/things/<int:thing_id>', '/api/things/1', (1,)),
+        ('/api/things/<int:thing_id>', '/api/things/2?x=1', (2,)),
+    ]
+    assert app.config['BACKGROUND_WORK'] is True
+    assert db._observers['on_query'] is None
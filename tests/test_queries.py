@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from queries import top_n_per_group
+
+
+class SqliteCursor:
+    """A dictionary cursor over sqlite, which has window functions, taking MySQL's %s placeholders."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def execute(self, statement, params=()):
+        cursor = self.conn.execute(statement.replace('%s', '?'), params)
+        names = [column[0] for column in cursor.description]
+        self.result = [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+    CREATE TABLE cities (id INTEGER PRIMARY KEY, city_name TEXT);
+    CREATE TABLE places (id INTEGER PRIMARY KEY, name TEXT, category TEXT, city_id INTEGER);
+    INSERT INTO cities VALUES (1, 'Paris'), (2, 'Rome'), (3, 'Oslo');
+    INSERT INTO places VALUES
+        (1, 'Louvre', 'Museum', 1), (2, 'Eiffel Tower', 'Landmark', 1), (3, 'Orsay', 'Museum', 1),
+        (4, 'Colosseum', 'Landmark', 2), (5, 'Vatican Museums', 'Museum', 2), (6, 'Pantheon', 'Landmark', 2);
+    """)
+    yield SqliteCursor(conn)
+    conn.close()
+
+
+def test_first_rows_of_every_group(cursor):
+    grouped = top_n_per_group(
+        cursor, columns="p.category, p.id AS place_id, p.name AS place_name",
+        from_clause="places p", partition_by="p.category", order_by="p.id", limit=2, group_key='category',
+    )
+    assert list(grouped) == ['Landmark', 'Museum']
+    assert [row['place_id'] for row in grouped['Landmark']] == [2, 4]
+    assert [row['place_id'] for row in grouped['Museum']] == [1, 3]
+    assert 'group_rank' not in grouped['Museum'][0] and grouped['Museum'][0]['category'] == 'Museum'
+
+
+def test_where_params_outer_order_and_dropped_key(cursor):
+    grouped = top_n_per_group(
+        cursor, columns="c.id AS city_id, p.id AS place_id",
+        from_clause="cities c LEFT JOIN places p ON p.city_id = c.id", partition_by="c.id", order_by="p.id DESC",
+        limit=1, group_key='city_id', where="c.id >= %s", params=(2,), outer_order="city_id DESC", drop_key=True,
+    )
+    # Oslo has no places but keeps its group through the LEFT JOIN
+    assert grouped == {3: [{'place_id': None}], 2: [{'place_id': 6}]}
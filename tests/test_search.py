@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from search import TableSearchIndex, UserSearchIndex
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.pending = []
+
+    def execute(self, statement, params=()):
+        since = params[0] if params else 0
+        self.pending = [row for row in self.rows if row['id'] > since]
+
+    def fetchmany(self, size):
+        batch, self.pending = self.pending[:size], self.pending[size:]
+        return batch
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = threading.Event()
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.rows)
+
+    def close(self):
+        self.closed.set()
+
+
+def users(count):
+    return [{'id': i, 'username': f'anna{i}', 'first_name': 'Anna', 'last_name': f'Smith{i}'}
+            for i in range(1, count + 1)]
+
+
+def test_table_index_requires_document():
+    with pytest.raises(TypeError):
+        TableSearchIndex()
+
+
+def test_search_counts_every_match_when_capped():
+    index = UserSearchIndex(max_results=5)
+    index.ensure_fresh(FakeCursor(users(20)))
+    ids, total = index.search('anna')
+    assert len(ids) == 5 and total == 20
+    assert index.search('zzzz') == ([], 0)
+
+
+def test_warm_loads_in_the_background_once():
+    index = UserSearchIndex()
+    conn = FakeConnection(users(3))
+    opened = []
+
+    def get_connection():
+        opened.append(conn)
+        return conn
+
+    index.warm(get_connection)
+    assert conn.closed.wait(5)
+    assert index.loaded and len(index.index) == 3
+    index.warm(get_connection)
+    assert len(opened) == 1
@@ -0,0 +1,56 @@
+import datetime
+import decimal
+import gzip
+import json
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import serialization
+
+
+def test_dumps_writes_iso_timestamps_and_plain_numbers():
+    text = serialization.dumps({
+        'at': datetime.datetime(2025, 5, 1, 12, 0, 0),
+        'day': datetime.date(2025, 5, 1),
+        'price': decimal.Decimal('1.50'),
+        'took': datetime.timedelta(seconds=90),
+    })
+    assert json.loads(text) == {'at': '2025-05-01T12:00:00', 'day': '2025-05-01', 'price': 1.5, 'took': 90.0}
+
+
+def make_app():
+    app = flask.Flask(__name__)
+    serialization.init_app(app, compress_min_size=10)
+
+    @app.route('/big')
+    def big():
+        response = flask.jsonify({'rows': list(range(500))})
+        response.set_etag('abc123')
+        return response.make_conditional(flask.request)
+
+    @app.route('/rows')
+    def rows():
+        return serialization.stream_array(iter([{'id': 1}, {'id': 2}]), key='rows', fields={'total': 2})
+
+    return app
+
+
+def test_compressed_responses_keep_a_strong_etag_per_encoding():
+    client = make_app().test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == '"abc123-gzip"'
+    assert json.loads(gzip.decompress(response.data))['rows'][-1] == 499
+
+    revalidated = client.get('/big', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"abc123-gzip"'})
+    assert revalidated.status_code == 304
+
+    plain = client.get('/big', headers={'Accept-Encoding': 'identity', 'If-None-Match': '"abc123"'})
+    assert plain.status_code == 304
+
+
+def test_stream_array_builds_valid_json():
+    response = make_app().test_client().get('/rows', headers={'Accept-Encoding': 'identity'})
+    assert json.loads(response.data) == {'total': 2, 'rows': [{'id': 1}, {'id': 2}]}
@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('itsdangerous')
+
+import sessions
+
+
+def test_tokens_round_trip():
+    tokens = sessions.SessionTokens('secret')
+    identity = tokens.verify(tokens.issue(7, 'alice'))
+    assert (identity.user_id, identity.username) == (7, 'alice')
+
+
+def test_a_token_from_another_secret_is_rejected():
+    token = sessions.SessionTokens('one').issue(7, 'alice')
+    with pytest.raises(sessions.InvalidSession):
+        sessions.SessionTokens('two').verify(token)
+
+
+def test_expired_tokens_are_rejected():
+    tokens = sessions.SessionTokens('secret', max_age=-1)
+    with pytest.raises(sessions.InvalidSession, match='expired'):
+        tokens.verify(tokens.issue(7, 'alice'))
+
+
+def test_a_secret_is_required():
+    with pytest.raises(ValueError):
+        sessions.SessionTokens(None)
+
+
+def test_claims_must_match_the_session():
+    me = sessions.Identity(3, 'bob')
+    assert sessions.check_claims(me, {'user_id': 3}, {'user_id': '3'}, {'sender': 'bob'}) is None
+    assert sessions.check_claims(me, {}, {'user_id': '4'}, None)
+    assert sessions.check_claims(me, {}, {}, {'sender': 'alice'})
+    assert sessions.check_claims(None, {}, {'user_id': '4'}, None) is None
+    assert sessions.check_claims(None, {}, {'user_id': '4'}, None, required=True) == "Session token required"
+
+
+def test_tokens_are_only_read_from_headers():
+    assert sessions.token_from({'Authorization': 'Bearer abc'}) == 'abc'
+    assert sessions.token_from({'X-Session-Token': 'def'}) == 'def'
+    assert sessions.token_from({}) is None
+
+
+def test_tickets_are_accepted_on_streaming_endpoints_only():
+    tokens = sessions.SessionTokens('secret')
+    ticket = tokens.issue_ticket(sessions.Identity(7, 'alice'))
+    identity = sessions.identify(tokens, {}, {'ticket': ticket}, 'stream_group_messages')
+    assert (identity.user_id, identity.username) == (7, 'alice')
+    assert sessions.identify(tokens, {}, {'ticket': ticket}, 'get_groups') is None
+    assert sessions.identify(tokens, {}, {}, 'stream_group_messages') is None
+
+
+def test_tickets_expire_quickly():
+    tokens = sessions.SessionTokens('secret', ticket_max_age=-1)
+    ticket = tokens.issue_ticket(sessions.Identity(7, 'alice'))
+    with pytest.raises(sessions.InvalidSession, match='expired'):
+        sessions.identify(tokens, {}, {'ticket': ticket}, 'stream_group_messages')
+
+
+def test_tickets_and_session_tokens_are_not_interchangeable():
+    tokens = sessions.SessionTokens('secret')
+    with pytest.raises(sessions.InvalidSession):
+        tokens.verify(tokens.issue_ticket(sessions.Identity(7, 'alice')))
+    with pytest.raises(sessions.InvalidSession):
+        tokens.verify_ticket(tokens.issue(7, 'alice'))
+
+
+def test_api_routes_need_a_session_unless_public():
+    assert sessions.requires_session('/api/get_groups', 'get_groups', {'login_user'})
+    assert not sessions.requires_session('/api/login', 'login_user', {'login_user'})
+    assert not sessions.requires_session('/index.html', 'serve_frontend', set())
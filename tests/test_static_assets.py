@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import static_assets
+
+BUNDLE = 'static/js/main.1a2b3c4d.js'
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'static' / 'js').mkdir(parents=True)
+    (tmp_path / 'index.html').write_text('<html>' + 'app ' * 500 + '</html>')
+    (tmp_path / BUNDLE).write_text('console.log("tripsync");\n' * 200)
+    (tmp_path / 'robots.txt').write_text('User-agent: *\n')
+    return static_assets.StaticAssets(str(tmp_path))
+
+
+@pytest.fixture
+def client(assets):
+    # No built-in /static route: the bundles under static/ are served from the manifest
+    app = flask.Flask(__name__, static_folder=None)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        return assets.serve(path)
+
+    return app.test_client()
+
+
+def test_compressed_siblings_are_written_for_large_files(assets):
+    assert os.path.exists(os.path.join(assets.root, BUNDLE + '.gz'))
+    assert not os.path.exists(os.path.join(assets.root, 'robots.txt.gz'))
+    assert static_assets.precompress(assets.root) == 0
+    assert BUNDLE + '.gz' not in assets.manifest
+
+
+def test_cache_lifetimes_follow_the_file_name(client):
+    assert client.get('/' + BUNDLE).headers['Cache-Control'] == static_assets.IMMUTABLE
+    assert client.get('/robots.txt').headers['Cache-Control'] == static_assets.SHORT_LIVED
+    assert client.get('/').headers['Cache-Control'] == static_assets.REVALIDATE
+
+
+def test_precompressed_variant_is_sent_when_accepted(client):
+    plain = client.get('/' + BUNDLE)
+    gzipped = client.get('/' + BUNDLE, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+    assert gzipped.headers['ETag'] != plain.headers['ETag']
+
+
+def test_index_revalidates_with_a_304(client):
+    first = client.get('/chats/3', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200 and first.headers['Content-Encoding'] == 'gzip'
+    again = client.get('/chats/3', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_missing_bundles_are_not_answered_with_html(client):
+    assert client.get('/static/js/main.00000000.js').status_code == 404